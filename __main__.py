@@ -2,11 +2,12 @@
 
 # pylint: disable=line-too-long,invalid-name
 
-import json
 import pulumi
 # import pulumi_aws as aws
 from autotag import register_auto_tags
+import capacity
 import infra
+import pipeline
 
 
 # ----------------------------------------------------------------
@@ -14,6 +15,9 @@ import infra
 # ----------------------------------------------------------------
 CONFIG = pulumi.Config()
 
+# Throttles, batch sizes and queue timeouts planned by capacity.py, the helper defaults apply without it
+CAPACITY = capacity.validate_capacity(CONFIG.get_object("capacity"))
+
 # ----------------------------------------------------------------
 # Automatically Inject Tags
 # ----------------------------------------------------------------
@@ -32,75 +36,15 @@ register_auto_tags({
 
 
 # ----------------------------------------------------------------
-# Create EventBridge Bus - Single Instance for Stack
-# ----------------------------------------------------------------
-
-bus_name = infra.create_event_bus(
-    name="pizza-bus",
-    archive_retention=7,
-    enable_schema_discoverer=True,
-)
-
-# ----------------------------------------------------------------
-# Create HTTP API - Single Instance for Stack
-# ----------------------------------------------------------------
-
-infra.create_http_api(
-    name="pizza-api",
-    authorizer_type="JWT",
-    authorizer_uri=CONFIG.get('api_authorizer_uri'),
-    authorizer_audience=CONFIG.get('authorizer_audience'),
-    bus_name=bus_name,
-    api_url=CONFIG.get('api_url'),
-    api_path="POST /event",
-    route53_zone_name=CONFIG.get('route53_zone_name'),
-    certificate_name=CONFIG.get('certificate_name'),
-)
-
-# ----------------------------------------------------------------
-# SQS - Single or Mulitple Instances for Stack
-# ----------------------------------------------------------------
-
-new_pizza_queue = infra.create_sqs_queue(name="NewPizza")
-cancel_pizza_queue = infra.create_sqs_queue(name="CancelPizza")
-
-# ----------------------------------------------------------------
-# EventBridge Rules/Targets - Single or Mulitple Instances for Stack
-# ----------------------------------------------------------------
-
-new_pizza_pattern = json.dumps({
-    "source": ["pizza.pineapple.events"],
-    "detail": {
-        "source": ["Pizza"],
-        "detail-type": ["NewOrder"]
-    }
-})
-new_pizza_rule = infra.create_rule_and_sqs_target(
-    name="NewPizza", bus_name=bus_name, rule_pattern=new_pizza_pattern, queue_target_arn=new_pizza_queue)
-
-cancel_pizza_pattern = json.dumps({
-    "source": ["pizza.pineapple.events"],
-    "detail": {
-        "source": ["Pizza"],
-        "detail-type": ["CancelOrder"]
-    }
-})
-cancel_pizza_rule = infra.create_rule_and_sqs_target(
-    name="CancelPizza", bus_name=bus_name, rule_pattern=cancel_pizza_pattern, queue_target_arn=cancel_pizza_queue)
-
-# ----------------------------------------------------------------
-# Lambda - Single or Mulitple Instances for Stack
+# Bus, API, Queues, Rules and Functions - shared with emulator.py
 # ----------------------------------------------------------------
 
-infra.create_lambda_function(
-    function_name="doStuff",
-    runtime="python3.9",
-    code_source="./src",
-    handler="lambda_function.lambda_handler",
-    memory=CONFIG.get_int('lambda_memory'),
-    queue_arn=new_pizza_queue,
-    # layer_arns=LAMBDA.get("layer_arns"),
-    x_ray=True,
-    insights=True,
-    powertools=True,
-)
+pipeline.define_pizza_pipeline(infra, {
+    "api_authorizer_uri": CONFIG.get('api_authorizer_uri'),
+    "authorizer_audience": CONFIG.get('authorizer_audience'),
+    "api_url": CONFIG.get('api_url'),
+    "route53_zone_name": CONFIG.get('route53_zone_name'),
+    "certificate_name": CONFIG.get('certificate_name'),
+    "lambda_memory": CONFIG.get_int('lambda_memory'),
+    "projection_samples": CONFIG.get_object("projection_samples"),
+}, CAPACITY)
@@ -0,0 +1,153 @@
+"""
+Decoder benchmark
+
+Compares the generated decoders in `src/order_models.py` against plain `json.loads` and
+dict access on SQS batches shaped like the ones the rules deliver: NewPizza batches of
+messages slimmed by the PizzaOrder projection, and CancelPizza batches of full `PizzaOrder`
+events.  The generated decoders also validate every field, the baseline does not.
+
+The decoders parse with `orjson` when it is installed (it is in the dependency layer and in
+requirements.txt) and with the standard library `json` otherwise, pass `--stdlib` to measure
+the fallback.
+
+Usage:
+    python benchmark_decoders.py --batches 2000 --batch-size 10
+    python benchmark_decoders.py --batches 2000 --batch-size 10 --stdlib
+"""
+# pylint: disable=line-too-long,wrong-import-position
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Callable, List, Optional
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+sys.path.insert(0, SRC)
+import order_models  # noqa: E402
+import projections  # noqa: E402
+
+
+TOPPINGS = ["pineapple", "ham", "mushroom", "olive", "pepperoni", "jalapeno", "onion"]
+
+# The projection of the NewPizza rule in __main__.py
+PIZZA_ORDER = projections.load_projection(os.path.join(SRC, "projections.json"), "PizzaOrder")
+
+
+def sample_event(index: int, rng: random.Random, kind: str) -> dict:
+    """Returns a PizzaOrder event, as the HTTP API puts it, with a NewOrder or CancelOrder detail"""
+    if kind == "NewOrder":
+        detail = {
+            "source": "Pizza",
+            "detail-type": kind,
+            "order": {
+                "id": index,
+                "toppings": rng.sample(TOPPINGS, rng.randint(1, 4)),
+                "size": rng.choice([8, 12, 16]),
+                "price": round(rng.uniform(8, 30), 2),
+                "delivery": rng.random() < 0.5,
+            },
+        }
+    else:
+        detail = {"source": "Pizza", "detail-type": kind, "order": {"id": index}, "reason": "changed my mind"}
+
+    return {
+        "version": "0",
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "detail-type": "PizzaOrder",
+        "source": "pizza.pineapple.events",
+        "account": "000000000000",
+        "time": "2022-01-01T00:00:00Z",
+        "region": "us-east-2",
+        "resources": [],
+        "detail": detail,
+    }
+
+
+def sample_message(index: int, rng: random.Random, kind: str) -> str:
+    """Returns the message body the rule of the kind's queue delivers"""
+    event = sample_event(index, rng, kind)
+    # The NewPizza rule sends the projection, the CancelPizza rule the whole event
+    return json.dumps(projections.project(PIZZA_ORDER, event) if kind == "NewOrder" else event)
+
+
+def sample_batches(batches: int, batch_size: int, seed: int = 42) -> List[dict]:
+    """Returns SQS events with `batch_size` records each, 80% from the NewPizza queue"""
+    rng = random.Random(seed)
+    events = []
+    for batch in range(batches):
+        kind = "NewOrder" if rng.random() < 0.8 else "CancelOrder"
+        events.append({"Records": [
+            {"messageId": str(uuid.UUID(int=rng.getrandbits(128))), "body": sample_message(batch * batch_size + index, rng, kind)}
+            for index in range(batch_size)
+        ]})
+    return events
+
+
+def decode_with_json(event: dict) -> int:
+    """Baseline, `json.loads` and dict access without validation"""
+    total = 0
+    for record in event["Records"]:
+        message = json.loads(record["body"])
+        detail = message["detail"] if "detail" in message else message["order"]
+        order = detail["order"]
+        if detail["detail-type"] == "NewOrder":
+            total += order["id"] + len(order["toppings"]) + order.get("size", 0)
+        else:
+            total += order["id"]
+    return total
+
+
+def decode_with_models(event: dict) -> int:
+    """Generated decoders, parsed with the fastest available backend and validated"""
+    total = 0
+    decode_event = order_models.decode_event
+    for record in event["Records"]:
+        detail = decode_event(record["body"])
+        order = detail.order
+        if type(detail) is order_models.NewOrder:  # pylint: disable=unidiomatic-typecheck
+            total += order.id + len(order.toppings) + (order.size or 0)
+        else:
+            total += order.id
+    return total
+
+
+def measure(decoder: Callable[[dict], int], batches: List[dict], repeat: int) -> float:
+    """Returns the best time in seconds to decode every batch"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for event in batches:
+            decoder(event)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[list] = None):
+    """Runs the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmarks the generated decoders against json.loads and dict access.")
+    parser.add_argument("--batches", type=int, default=2000, help="Number of SQS batches")
+    parser.add_argument("--batch-size", type=int, default=10, help="Records per batch")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per decoder, the best is reported")
+    parser.add_argument("--stdlib", action="store_true", help="Parse with the standard library json even when orjson is installed")
+    args = parser.parse_args(argv)
+
+    if args.stdlib:
+        order_models.loads = json.loads
+
+    batches = sample_batches(args.batches, args.batch_size)
+    if decode_with_json(batches[0]) != decode_with_models(batches[0]):
+        raise SystemExit("Decoders disagree on the sample batches")
+
+    records = args.batches * args.batch_size
+    print(f"{records} records in batches of {args.batch_size}, JSON backend: {order_models.loads.__module__}")
+    baseline = measure(decode_with_json, batches, args.repeat)
+    for name, elapsed in (("json.loads + dict", baseline), ("generated decoders", measure(decode_with_models, batches, args.repeat))):
+        print(f"{name:20} {elapsed / records * 1e6:8.2f} us/record  {records / elapsed:12,.0f} records/s  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
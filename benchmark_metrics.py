@@ -0,0 +1,98 @@
+"""
+Metrics benchmark
+
+Compares the `MetricsAggregator` in `src/batch_metrics.py` against one EMF document per
+record, the way per record `single_metric` calls are written, on batches of 1,000 records.
+Every record counts an order by size and records a high resolution processing latency.
+Reports the bytes written to CloudWatch Logs and the CPU time per batch.
+
+Usage:
+    python benchmark_metrics.py --batches 50 --batch-size 1000
+"""
+# pylint: disable=line-too-long,wrong-import-position
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from batch_metrics import MetricsAggregator  # noqa: E402
+
+
+NAMESPACE = "PineapplePizza"
+SERVICE = "Magic"
+SIZES = ["8", "12", "16"]
+
+
+def sample_batches(batches: int, batch_size: int, seed: int = 42) -> List[List[Tuple[str, float]]]:
+    """Returns batches of (pizza size, latency in milliseconds) records"""
+    rng = random.Random(seed)
+    return [[(rng.choice(SIZES), rng.lognormvariate(2, 0.5)) for _ in range(batch_size)] for _ in range(batches)]
+
+
+def per_record(batch: List[Tuple[str, float]]) -> List[str]:
+    """Baseline, one EMF document per record and metric"""
+    lines = []
+    for size, latency in batch:
+        for name, unit, value, dimensions, resolution in (
+            ("OrdersProcessed", "Count", 1, {"service": SERVICE, "size": size}, 60),
+            ("ProcessingLatency", "Milliseconds", latency, {"service": SERVICE}, 1),
+        ):
+            definition = {"Name": name, "Unit": unit}
+            if resolution == 1:
+                definition["StorageResolution"] = 1
+            document = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{"Namespace": NAMESPACE, "Dimensions": [sorted(dimensions)], "Metrics": [definition]}],
+                },
+                **dimensions,
+                name: value,
+            }
+            lines.append(json.dumps(document, separators=(",", ":")))
+    return lines
+
+
+def aggregated(batch: List[Tuple[str, float]]) -> List[str]:
+    """Counters and histograms aggregated for the batch and flushed once"""
+    metrics = MetricsAggregator(namespace=NAMESPACE, service=SERVICE, emit=lambda line: None)
+    for size, latency in batch:
+        metrics.count("OrdersProcessed", dimensions={"size": size})
+        metrics.timing("ProcessingLatency", latency, high_resolution=True)
+    return metrics.flush()
+
+
+def measure(emitter: Callable[[list], List[str]], batches: List[list], repeat: int) -> Tuple[float, int, int]:
+    """Returns the best CPU time in seconds for every batch, the documents and bytes of one batch"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for batch in batches:
+            lines = emitter(batch)
+        best = min(best, time.process_time() - start)
+    return best, len(lines), sum(len(line) + 1 for line in lines)
+
+
+def main(argv: Optional[list] = None):
+    """Runs the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmarks aggregated EMF metrics against one document per record.")
+    parser.add_argument("--batches", type=int, default=50, help="Number of batches")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Records per batch")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per emitter, the best is reported")
+    args = parser.parse_args(argv)
+
+    batches = sample_batches(args.batches, args.batch_size)
+    print(f"{args.batches} batches of {args.batch_size} records")
+    baseline = None
+    for name, emitter in (("per record", per_record), ("aggregated", aggregated)):
+        elapsed, documents, size = measure(emitter, batches, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:12} {documents:6} documents  {size:10,} bytes/batch  {elapsed / args.batches * 1e3:8.2f} ms CPU/batch  {baseline / elapsed:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Capacity planning
+
+Derives the sizing of the stack from the expected load instead of leaving it to scattered
+defaults.  A spec lists the routes of the HTTP API with their expected and peak requests per
+second and payload sizes, and the functions consuming them with the time a record takes and
+the latency target:
+
+    {
+        "region": "us-east-2",
+        "routes": [
+            {"route": "POST /event", "rps": 200, "peak_multiplier": 3, "payload_bytes": 2048}
+        ],
+        "consumers": [
+            {"function": "doStuff", "queue": "NewPizza", "route": "POST /event", "share": 0.8,
+             "record_ms": 40, "latency_target_ms": 5000, "recovery_hours": 24}
+        ],
+        "quotas": {"lambda_concurrency": 1000}
+    }
+
+`plan` turns it into the `capacity` stack config, which `__main__.py` reads and passes to
+`create_http_api` (route throttles), `create_sqs_queue` (visibility timeout and retention)
+and `create_lambda_function` (timeout, batch size, batching window and maximum concurrency).
+Every value is checked with `validate_capacity` when it is planned and again when it is
+loaded, and a warning is printed for every account quota the load would exceed.
+
+Usage:
+    python capacity.py capacity.json --stack nonprod
+    python capacity.py capacity.json --stack nonprod --write
+"""
+# pylint: disable=line-too-long
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from typing import List, Optional, Tuple
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_KEY = "capacity"
+
+# Default account quotas per region, most of them can be raised with a quota increase
+# https://docs.aws.amazon.com/lambda/latest/dg/gettingstarted-limits.html
+# https://docs.aws.amazon.com/apigateway/latest/developerguide/limits.html
+# https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-quota.html
+DEFAULT_QUOTAS = {
+    "lambda_concurrency": 1000,
+    "api_rate": 10000,
+    "api_burst": 5000,
+    "put_events_rate": 2400,
+}
+PUT_EVENTS_RATE_BY_REGION = {"us-east-1": 10000, "us-west-2": 10000, "eu-west-1": 10000}
+# Lambda keeps this much of the account concurrency unreserved
+UNRESERVED_CONCURRENCY = 100
+
+# Service limits, these can not be raised
+MAX_PAYLOAD_BYTES = 256 * 1024
+MAX_API_PAYLOAD_BYTES = 10 * 1024 * 1024
+MAX_BATCH_SIZE = 10000
+MAX_BATCH_SIZE_WITHOUT_WINDOW = 10
+MAX_BATCHING_WINDOW = 300
+MIN_MAXIMUM_CONCURRENCY = 2
+MAX_MAXIMUM_CONCURRENCY = 1000
+MAX_FUNCTION_TIMEOUT = 900
+MAX_VISIBILITY_TIMEOUT = 43200
+MIN_RETENTION = 60
+DEFAULT_RETENTION = 345600
+MAX_RETENTION = 1209600
+# `Publisher` sends up to 10 events with every PutEvents call
+EVENTS_PER_PUT_EVENTS = 10
+
+# Sizing rules
+HEADROOM = 1.2
+BURST_SECONDS = 2
+PROCESSING_SHARE = 0.5
+TIMEOUT_SAFETY = 2
+MIN_FUNCTION_TIMEOUT = 3
+# https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html#events-sqs-queueconfig
+VISIBILITY_TIMEOUT_MULTIPLIER = 6
+
+ROUTE_SETTINGS = {"throttle_rate": (0, None), "throttle_burst": (0, None)}
+FUNCTION_SETTINGS = {
+    "memory": (128, 10240),
+    "timeout": (1, MAX_FUNCTION_TIMEOUT),
+    "batch_size": (1, MAX_BATCH_SIZE),
+    "batching_window": (0, MAX_BATCHING_WINDOW),
+    "maximum_concurrency": (MIN_MAXIMUM_CONCURRENCY, MAX_MAXIMUM_CONCURRENCY),
+}
+QUEUE_SETTINGS = {
+    "visibility_timeout": (0, MAX_VISIBILITY_TIMEOUT),
+    "message_retention": (MIN_RETENTION, MAX_RETENTION),
+}
+SECTIONS = {"routes": ROUTE_SETTINGS, "functions": FUNCTION_SETTINGS, "queues": QUEUE_SETTINGS}
+
+
+def validate_capacity(capacity: Optional[dict]) -> dict:
+    """
+    Validates the `capacity` stack config
+
+    Args:
+        capacity (dict): The config, with `routes`, `functions` and `queues` maps of settings by name
+
+    Raises:
+        ValueError: If a section, setting or value is not supported
+
+    Returns:
+        dict: The config, an empty one when it is not set
+    """
+    capacity = capacity or {}
+    if not isinstance(capacity, dict):
+        raise ValueError(f"{CONFIG_KEY} has to be an object, got {type(capacity).__name__}")
+    for section, entries in capacity.items():
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown {CONFIG_KEY} section {section}, expected one of {', '.join(SECTIONS)}")
+        if not isinstance(entries, dict):
+            raise ValueError(f"{CONFIG_KEY}.{section} has to be an object")
+        for name, values in entries.items():
+            if not isinstance(values, dict):
+                raise ValueError(f"{CONFIG_KEY}.{section}.{name} has to be an object")
+            for key, value in values.items():
+                if key not in SECTIONS[section]:
+                    raise ValueError(f"Unknown setting {key} in {CONFIG_KEY}.{section}.{name}, expected one of {', '.join(SECTIONS[section])}")
+                low, high = SECTIONS[section][key]
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value < low or (high is not None and value > high):
+                    raise ValueError(f"{CONFIG_KEY}.{section}.{name}.{key} has to be a number from {low} to {high or 'unbounded'}, got {value!r}")
+
+    for name, values in capacity.get("functions", {}).items():
+        if values.get("batch_size", 0) > MAX_BATCH_SIZE_WITHOUT_WINDOW and values.get("batching_window", 0) < 1:
+            raise ValueError(f"{CONFIG_KEY}.functions.{name} needs a batching_window of at least 1 second for a batch_size above {MAX_BATCH_SIZE_WITHOUT_WINDOW}")
+    return capacity
+
+
+def settings(capacity: Optional[dict], section: str, name: str) -> dict:
+    """
+    Returns the settings of a route, function or queue, to pass to its helper as keyword arguments
+
+    Args:
+        capacity (dict): The validated `capacity` stack config
+        section (str): `routes`, `functions` or `queues`
+        name (str): The route key, function name or queue name
+
+    Returns:
+        dict: The settings, empty when none were planned
+    """
+    return dict((capacity or {}).get(section, {}).get(name, {}))
+
+
+def _route_rps(route: dict) -> float:
+    return route["rps"] * route.get("peak_multiplier", 1)
+
+
+def plan(spec: dict) -> Tuple[dict, List[str], dict]:
+    """
+    Sizes the routes, queues and functions for the expected load
+
+    Args:
+        spec (dict): The expected load, see the module docstring
+
+    Raises:
+        ValueError: If the spec is incomplete or the planned config is invalid
+
+    Returns:
+        tuple: The validated `capacity` stack config, the warnings and the (used, quota) of every account quota
+    """
+    region = spec.get("region")
+    quotas = {**DEFAULT_QUOTAS, "put_events_rate": PUT_EVENTS_RATE_BY_REGION.get(region, DEFAULT_QUOTAS["put_events_rate"]), **spec.get("quotas", {})}
+    routes = {route["route"]: route for route in spec.get("routes", [])}
+    capacity = {"routes": {}, "functions": {}, "queues": {}}
+    warnings = []
+
+    # HTTP API throttles, sized for the peak with headroom
+    total_rate = 0
+    put_events_rate = 0.0
+    for key, route in routes.items():
+        if route.get("rps", 0) <= 0:
+            raise ValueError(f"Route {key} needs a positive rps")
+        peak = _route_rps(route)
+        rate = math.ceil(peak * HEADROOM)
+        burst = min(math.ceil(rate * BURST_SECONDS), quotas["api_burst"])
+        capacity["routes"][key] = {"throttle_rate": rate, "throttle_burst": burst}
+        total_rate += rate
+
+        payload = route.get("payload_bytes", 0)
+        target = route.get("target", "EventBridge")
+        if target in ("EventBridge", "SQS") and payload > MAX_PAYLOAD_BYTES:
+            warnings.append(f"Route {key} payloads of {payload} bytes are larger than the {MAX_PAYLOAD_BYTES} bytes {target} accepts")
+        elif payload > MAX_API_PAYLOAD_BYTES:
+            warnings.append(f"Route {key} payloads of {payload} bytes are larger than the {MAX_API_PAYLOAD_BYTES} bytes the HTTP API accepts")
+        if target == "EventBridge":
+            # The integration makes one PutEvents call per request
+            put_events_rate += peak
+
+    if total_rate > quotas["api_rate"]:
+        warnings.append(f"Route throttles add up to {total_rate} requests/s, the account allows {quotas['api_rate']} per region")
+
+    # Queues and functions, sized for the share of the peak that reaches them
+    total_concurrency = 0
+    for consumer in spec.get("consumers", []):
+        function, queue = consumer["function"], consumer["queue"]
+        record_ms = consumer["record_ms"]
+        target_ms = consumer["latency_target_ms"]
+        if record_ms <= 0 or target_ms <= 0:
+            raise ValueError(f"Consumer {function} needs a positive record_ms and latency_target_ms")
+        if consumer.get("route") is not None and consumer["route"] not in routes:
+            raise ValueError(f"Consumer {function} reads from unknown route {consumer['route']}")
+        records_per_second = consumer.get("rps", 0)
+        if not records_per_second and consumer.get("route") is not None:
+            records_per_second = _route_rps(routes[consumer["route"]]) * consumer.get("share", 1)
+        if records_per_second <= 0:
+            raise ValueError(f"Consumer {function} needs a route with a positive share or a positive rps")
+
+        if record_ms > target_ms:
+            warnings.append(f"Function {function} takes {record_ms} ms per record, more than its {target_ms} ms latency target")
+        # Half of the latency target processes the batch, the rest waits for it to fill
+        batch_size = max(1, min(MAX_BATCH_SIZE, math.floor(target_ms * PROCESSING_SHARE / record_ms)))
+        batching_window = 0
+        if batch_size > MAX_BATCH_SIZE_WITHOUT_WINDOW:
+            batching_window = min(MAX_BATCHING_WINDOW, math.floor((target_ms - batch_size * record_ms) / 1000), math.ceil(batch_size / records_per_second))
+            if batching_window < 1:
+                batch_size, batching_window = MAX_BATCH_SIZE_WITHOUT_WINDOW, 0
+
+        # Little's law, records in flight are the arrival rate times the time in the function
+        concurrency = max(MIN_MAXIMUM_CONCURRENCY, math.ceil(records_per_second * record_ms / 1000 * HEADROOM))
+        if concurrency > MAX_MAXIMUM_CONCURRENCY:
+            warnings.append(f"Function {function} needs {concurrency} concurrent executions, an event source mapping scales to {MAX_MAXIMUM_CONCURRENCY}")
+            concurrency = MAX_MAXIMUM_CONCURRENCY
+        total_concurrency += concurrency
+
+        timeout = max(MIN_FUNCTION_TIMEOUT, math.ceil(batch_size * record_ms * TIMEOUT_SAFETY / 1000))
+        if timeout > MAX_FUNCTION_TIMEOUT:
+            warnings.append(f"Function {function} needs {timeout} seconds for a batch, functions time out after {MAX_FUNCTION_TIMEOUT}")
+            timeout = MAX_FUNCTION_TIMEOUT
+
+        function_settings = {"timeout": timeout, "batch_size": batch_size, "batching_window": batching_window, "maximum_concurrency": concurrency}
+        if consumer.get("memory") is not None:
+            function_settings["memory"] = consumer["memory"]
+        capacity["functions"][function] = function_settings
+
+        visibility_timeout = VISIBILITY_TIMEOUT_MULTIPLIER * timeout + batching_window
+        if visibility_timeout > MAX_VISIBILITY_TIMEOUT:
+            warnings.append(f"Queue {queue} needs a {visibility_timeout} second visibility timeout, SQS allows {MAX_VISIBILITY_TIMEOUT}")
+            visibility_timeout = MAX_VISIBILITY_TIMEOUT
+        # Messages outlive twice the time it takes to notice and fix a stopped consumer
+        retention = max(DEFAULT_RETENTION, math.ceil(consumer.get("recovery_hours", 24) * 3600 * 2))
+        if retention > MAX_RETENTION:
+            warnings.append(f"Queue {queue} needs {retention} seconds of retention for {consumer['recovery_hours']} recovery hours, SQS keeps messages {MAX_RETENTION}")
+            retention = MAX_RETENTION
+        capacity["queues"][queue] = {"visibility_timeout": visibility_timeout, "message_retention": retention}
+
+        put_events_rate += consumer.get("publish_rps", 0) * consumer.get("share", 1) / EVENTS_PER_PUT_EVENTS
+
+    available = quotas["lambda_concurrency"] - UNRESERVED_CONCURRENCY
+    if total_concurrency > available:
+        warnings.append(f"Functions need {total_concurrency} concurrent executions, the account has {available} besides the {UNRESERVED_CONCURRENCY} Lambda keeps unreserved")
+    put_events_rate = math.ceil(put_events_rate)
+    if put_events_rate > quotas["put_events_rate"]:
+        warnings.append(f"The peak needs {put_events_rate} PutEvents requests/s, the account allows {quotas['put_events_rate']} in {region or 'this region'}")
+
+    usage = {
+        "api_rate": (total_rate, quotas["api_rate"]),
+        "lambda_concurrency": (total_concurrency, available),
+        "put_events_rate": (put_events_rate, quotas["put_events_rate"]),
+    }
+    return validate_capacity({section: entries for section, entries in capacity.items() if entries}), warnings, usage
+
+
+def render(project: str, capacity: dict) -> str:
+    """Returns the `Pulumi.<stack>.yaml` fragment with the `capacity` stack config"""
+    import yaml  # pylint: disable=import-outside-toplevel
+    return yaml.safe_dump({"config": {f"{project}:{CONFIG_KEY}": capacity}}, sort_keys=False)
+
+
+def write(path: str, project: str, capacity: dict):
+    """
+    Sets the `capacity` stack config in a `Pulumi.<stack>.yaml` file
+
+    Only the lines of the `capacity` key are replaced, or added at the end of `config`, so the
+    comments, order and formatting of the rest of the file are kept.
+    """
+    import yaml  # pylint: disable=import-outside-toplevel
+    lines = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+
+    def indentation(line: str) -> int:
+        return len(line) - len(line.lstrip(" "))
+
+    def is_value(line: str) -> bool:
+        return bool(line.strip()) and not line.lstrip().startswith("#")
+
+    config = next((index for index, line in enumerate(lines) if re.match(r"config:\s*(#.*)?$", line)), None)
+    if config is None:
+        lines.append("config:")
+        config = len(lines) - 1
+
+    end = next((index for index in range(config + 1, len(lines)) if is_value(lines[index]) and indentation(lines[index]) == 0), len(lines))
+    while end > config + 1 and not lines[end - 1].strip():
+        end -= 1
+    indent = next((indentation(lines[index]) for index in range(config + 1, end) if is_value(lines[index])), 2)
+
+    key = f"{project}:{CONFIG_KEY}"
+    rendered = [" " * indent + line for line in yaml.safe_dump({key: capacity}, sort_keys=False).splitlines()]
+    start = next((index for index in range(config + 1, end) if indentation(lines[index]) == indent and re.match(rf"""["']?{re.escape(key)}["']?\s*:""", lines[index].lstrip())), None)
+    if start is None:
+        start = stop = end
+    else:
+        stop = next((index for index in range(start + 1, end) if is_value(lines[index]) and indentation(lines[index]) <= indent), end)
+        # Blank lines and comments in front of the next key belong to that key
+        while stop > start + 1 and (not lines[stop - 1].strip() or (lines[stop - 1].lstrip().startswith("#") and indentation(lines[stop - 1]) <= indent)):
+            stop -= 1
+
+    lines[start:stop] = rendered
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def main(argv: Optional[list] = None):
+    """Plans the capacity from the command line"""
+    parser = argparse.ArgumentParser(description="Derives the capacity stack config from the expected load.")
+    parser.add_argument("spec", help="JSON file with the expected load")
+    parser.add_argument("--stack", default="nonprod", help="The stack whose Pulumi.<stack>.yaml is read for the region and written with --write")
+    parser.add_argument("--write", action="store_true", help="Set the capacity config in Pulumi.<stack>.yaml instead of printing it")
+    parser.add_argument("--strict", action="store_true", help="Exit with an error when a quota would be exceeded")
+    args = parser.parse_args(argv)
+
+    import yaml  # pylint: disable=import-outside-toplevel
+    with open(os.path.join(PROJECT_DIR, "Pulumi.yaml"), encoding="utf-8") as file:
+        project = yaml.safe_load(file)["name"]
+    stack_file = os.path.join(PROJECT_DIR, f"Pulumi.{args.stack}.yaml")
+
+    with open(args.spec, encoding="utf-8") as file:
+        spec = json.load(file)
+    if "region" not in spec and os.path.exists(stack_file):
+        with open(stack_file, encoding="utf-8") as file:
+            spec["region"] = ((yaml.safe_load(file) or {}).get("config") or {}).get("aws:region")
+
+    capacity, warnings, usage = plan(spec)
+    for quota, (used, limit) in usage.items():
+        # The Lambda concurrency left besides the unreserved share is 0 or less for a small account quota
+        share = f"{used / limit:.0%}" if limit > 0 else "none available"
+        print(f"{quota}: {used} of {limit} ({share}, {limit - used} headroom)", file=sys.stderr)
+    for warning in warnings:
+        print(f"WARNING: {warning}", file=sys.stderr)
+
+    if args.write:
+        write(stack_file, project, capacity)
+        print(f"Updated {stack_file}", file=sys.stderr)
+    else:
+        print(render(project, capacity), end="")
+
+    if warnings and args.strict:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Decoder generator for discovered EventBridge schemas
+
+Turns the OpenAPI 3 (or JSONSchema Draft 4) schemas exported from the `discovered-schemas`
+registry into a module of slotted classes, one per object schema, that decode and strictly
+validate the `detail` of an event.  Required keys, JSON types, enums and nested objects are
+checked inline with generated code instead of a generic validator, and the JSON is parsed with
+`orjson` when it is installed.
+
+Every order is published with the same envelope `detail-type`, so the generated classes are
+told apart by the `detail-type` inside the detail, which the schemas declare as a one value
+enum.  The detail is read from the EventBridge event or, for queues fed by a projection, from
+the projected key whose path is `$.detail`.
+
+Usage:
+    python codegen.py schemas/*.json --projections src/projections.json --output src/order_models.py
+"""
+# pylint: disable=line-too-long
+
+import argparse
+import glob
+import json
+import keyword
+import os
+import re
+from typing import Dict, List, Optional
+
+import projections
+
+
+# The annotation of every JSON type and the check that rejects other values, bool is not an int in JSON
+PRIMITIVES = {
+    "string": ("str", "type({value}) is not str"),
+    "integer": ("int", "type({value}) is not int"),
+    "number": ("float", "type({value}) is not float and type({value}) is not int"),
+    "boolean": ("bool", "type({value}) is not bool"),
+}
+
+# The key of the detail that tells the kinds of orders apart
+DISCRIMINATOR = "detail-type"
+
+HEADER = '''"""
+Decoders for the {detail_types} events
+
+Generated by codegen.py from {sources}, do not edit.
+"""
+# pylint: disable=line-too-long,too-many-branches,too-many-instance-attributes,too-many-arguments,redefined-builtin
+
+from typing import List, Optional
+
+try:
+    from orjson import loads  # pylint: disable=no-name-in-module
+except ImportError:
+    from json import loads
+
+
+class DecodeError(ValueError):
+    """Raised when a message does not match its schema"""
+'''
+
+
+class Field:
+    """
+    A property of a generated class
+    """
+
+    def __init__(self, key: str, schema: dict, required: bool):
+        self.key = key
+        self.attribute = attribute_name(key)
+        self.schema = schema
+        self.required = required
+
+
+class Model:
+    """
+    An object schema that becomes a generated class
+    """
+
+    def __init__(self, name: str, source: str, fields: List[Field], closed: bool):
+        self.name = name
+        self.source = source
+        self.fields = fields
+        self.closed = closed
+
+
+def attribute_name(key: str) -> str:
+    """
+    Turns a JSON key into a Python attribute name, `detail-type` becomes `detail_type`
+
+    Args:
+        key (str): The JSON key
+
+    Returns:
+        str: The attribute name
+    """
+    name = re.sub(r"\W", "_", key)
+    if name[:1].isdigit():
+        name = f"_{name}"
+    return f"{name}_" if keyword.iskeyword(name) else name
+
+
+def class_name(name: str) -> str:
+    """
+    Turns a schema name into a class name, `pizza-order` becomes `PizzaOrder`
+
+    Args:
+        name (str): The schema or property name
+
+    Returns:
+        str: The class name
+    """
+    return "".join(part[:1].upper() + part[1:] for part in re.split(r"[^A-Za-z0-9]+", name) if part)
+
+
+class Generator:
+    """
+    Collects the object schemas of every document and renders them as one module
+    """
+
+    def __init__(self, detail_keys: Optional[List[str]] = None):
+        self.models: Dict[str, Model] = {}
+        self.detail_types: Dict[str, str] = {}
+        self.detail_keys = ["detail", *(detail_keys or [])]
+        self.sources: List[str] = []
+        self._pending = set()
+
+    def add_document(self, path: str, document: dict):
+        """
+        Adds the detail schema of an exported schema document and every object it references
+
+        Args:
+            path (str): The path of the document, used in the generated docstrings
+            document (dict): The OpenAPI 3 or JSONSchema Draft 4 document
+        """
+        root = projections.schema_root(document)
+        detail = root.get("properties", {}).get("detail")
+        if detail is None:
+            raise ValueError(f"{path} does not declare the detail of the event")
+
+        kinds = projections.dereference(document, projections.dereference(document, detail).get("properties", {}).get(DISCRIMINATOR, {})).get("enum", [])
+        detail_type = kinds[0] if len(kinds) == 1 else os.path.splitext(os.path.basename(path))[0]
+        if detail_type in self.detail_types:
+            raise ValueError(f"{path} declares the detail {DISCRIMINATOR} {detail_type} of another schema")
+        name = class_name(detail["$ref"].rsplit("/", 1)[-1]) if "$ref" in detail else class_name(detail_type)
+        self.detail_types[detail_type] = self._add_model(name, document, detail, path)
+        self.sources.append(os.path.basename(path))
+
+    def _add_model(self, name: str, document: dict, schema: dict, path: str) -> str:
+        if name in self._pending:
+            raise ValueError(f"Schema {name} in {path} references itself, recursive schemas are not supported")
+
+        schema = projections.dereference(document, schema)
+        required = set(schema.get("required", []))
+        self._pending.add(name)
+        fields = [Field(key, self._resolve(name, key, document, value, path), key in required) for key, value in schema.get("properties", {}).items()]
+        self._pending.discard(name)
+
+        existing = self.models.get(name)
+        if existing is not None:
+            if [(field.key, field.schema, field.required) for field in existing.fields] != [(field.key, field.schema, field.required) for field in fields]:
+                raise ValueError(f"Schema {name} in {path} differs from the one in {existing.source}")
+            return name
+
+        self.models[name] = Model(name, os.path.basename(path), fields, schema.get("additionalProperties") is False)
+        return name
+
+    def _resolve(self, parent: str, key: str, document: dict, schema: dict, path: str) -> dict:
+        # Nested objects are replaced by a reference to their generated class
+        if "$ref" in schema:
+            target = projections.dereference(document, schema)
+            if target.get("type", "object") == "object" and "properties" in target:
+                return {"class": self._add_model(class_name(schema["$ref"].rsplit("/", 1)[-1]), document, target, path)}
+            schema = target
+
+        if schema.get("type") == "object" and "properties" in schema:
+            return {"class": self._add_model(f"{parent}{class_name(key)}", document, schema, path)}
+        if schema.get("type") == "array" and "items" in schema:
+            return {"type": "array", "items": self._resolve(parent, key, document, schema["items"], path)}
+        if "enum" in schema:
+            return {"type": schema.get("type"), "enum": schema["enum"]}
+        return {"type": schema.get("type")}
+
+    # ----------------------------------------------------------------
+    # Rendering
+    # ----------------------------------------------------------------
+
+    def render(self) -> str:
+        """
+        Renders the generated module
+
+        Returns:
+            str: The Python source of the module
+        """
+        lines = [HEADER.format(detail_types=", ".join(sorted(self.detail_types)), sources=", ".join(self.sources)).rstrip("\n")]
+        for model in self.models.values():
+            lines.extend(["", *self._render_model(model)])
+
+        lines.extend(["", "", f"# Generated classes by the {DISCRIMINATOR} of the event detail", "DETAIL_TYPES = {"])
+        lines.extend(f"    {json.dumps(detail_type)}: {name}," for detail_type, name in sorted(self.detail_types.items()))
+        lines.extend([
+            "}",
+            "",
+            "# Keys that hold the event detail in the messages the rules deliver, the event's and the projections'",
+            f"DETAIL_KEYS = ({', '.join(json.dumps(key) for key in self.detail_keys)}{',' if len(self.detail_keys) == 1 else ''})",
+            "",
+            "",
+            "def find_detail(message):",
+            "    \"\"\"Returns the event detail of a decoded EventBridge event or projected message\"\"\"",
+            "    if type(message) is dict:",
+            "        for key in DETAIL_KEYS:",
+            "            if key in message:",
+            "                return message[key]",
+            "    raise DecodeError(\"Message has no event detail\")",
+            "",
+            "",
+            "def decode_detail(detail):",
+            f"    \"\"\"Builds the class of the {DISCRIMINATOR} of a decoded event detail\"\"\"",
+            "    try:",
+            f"        model = DETAIL_TYPES[detail[{json.dumps(DISCRIMINATOR)}]]",
+            "    except (TypeError, KeyError):",
+            f"        raise DecodeError(\"Detail has no known {DISCRIMINATOR}\") from None",
+            "    return model.from_dict(detail)",
+            "",
+            "",
+            "def decode_event(body):",
+            f"    \"\"\"Decodes a JSON EventBridge event, or a message projected from one, into the class of its detail's {DISCRIMINATOR}\"\"\"",
+            "    return decode_detail(find_detail(loads(body)))",
+        ])
+        return "\n".join(lines) + "\n"
+
+    def _annotation(self, schema: dict) -> str:
+        # Nested classes are rendered before the classes that use them
+        if "class" in schema:
+            return schema["class"]
+        if schema.get("type") == "array":
+            return f"List[{self._annotation(schema['items'])}]"
+        if schema.get("type") == "object":
+            return "dict"
+        return PRIMITIVES.get(schema.get("type"), ("object", None))[0]
+
+    def _render_check(self, schema: dict, value: str, label: str, indent: str) -> List[str]:
+        if "class" in schema:
+            return [f"{indent}{value} = {schema['class']}.from_dict({value})"]
+
+        if schema.get("type") == "array":
+            items = schema["items"]
+            lines = [
+                f"{indent}if type({value}) is not list:",
+                f"{indent}    raise DecodeError(\"{label} must be an array\")",
+            ]
+            if "class" in items:
+                lines.append(f"{indent}{value} = [{items['class']}.from_dict(item) for item in {value}]")
+            elif items.get("type") in PRIMITIVES:
+                lines.extend([
+                    f"{indent}for item in {value}:",
+                    f"{indent}    if {PRIMITIVES[items['type']][1].format(value='item')}:",
+                    f"{indent}        raise DecodeError(\"{label} items must be {items['type']}\")",
+                ])
+            return lines
+
+        if schema.get("type") == "object":
+            return [
+                f"{indent}if type({value}) is not dict:",
+                f"{indent}    raise DecodeError(\"{label} must be an object\")",
+            ]
+
+        lines = []
+        if schema.get("type") in PRIMITIVES:
+            lines.extend([
+                f"{indent}if {PRIMITIVES[schema['type']][1].format(value=value)}:",
+                f"{indent}    raise DecodeError(\"{label} must be {schema['type']}\")",
+            ])
+        if "enum" in schema:
+            allowed = ", ".join(repr(item) for item in schema["enum"])
+            lines.extend([
+                f"{indent}if {value} not in {{{allowed}}}:",
+                f"{indent}    raise DecodeError(f\"{label} must be one of {', '.join(map(str, schema['enum']))}, got {{{value}!r}}\")",
+            ])
+        return lines
+
+    def _render_model(self, model: Model) -> List[str]:
+        slots = ", ".join(json.dumps(field.attribute) for field in model.fields)
+        parameters = ", ".join(
+            f"{field.attribute}: {self._annotation(field.schema)}" if field.required else f"{field.attribute}: Optional[{self._annotation(field.schema)}] = None"
+            for field in _parameter_order(model))
+
+        lines = [
+            "",
+            f"class {model.name}:",
+            f'    """Generated from {model.source}"""',
+            "",
+            f"    __slots__ = ({slots}{',' if len(model.fields) == 1 else ''})",
+            "",
+            f"    def __init__(self, {parameters}):" if parameters else "    def __init__(self):",
+        ]
+        lines.extend(f"        self.{field.attribute} = {field.attribute}" for field in model.fields)
+        if not model.fields:
+            lines.append("        pass")
+
+        lines.extend([
+            "",
+            "    def __repr__(self) -> str:",
+            f"        return f\"{model.name}({', '.join(f'{field.attribute}={{self.{field.attribute}!r}}' for field in model.fields)})\"",
+            "",
+            "    def __eq__(self, other) -> bool:",
+            f"        return type(other) is {model.name} and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)",
+            "",
+            "    @classmethod",
+            f"    def from_dict(cls, data: dict) -> \"{model.name}\":",
+            "        \"\"\"Validates a decoded JSON object and builds the class from it\"\"\"",
+            "        if type(data) is not dict:",
+            f"            raise DecodeError(\"{model.name} must be an object\")",
+        ])
+
+        if model.closed:
+            keys = "{" + ", ".join(json.dumps(field.key) for field in model.fields) + "}" if model.fields else "set()"
+            lines.extend([
+                f"        unknown = data.keys() - {keys}",
+                "        if unknown:",
+                f"            raise DecodeError(f\"{model.name} has unknown keys: {{sorted(unknown)}}\")",
+            ])
+
+        for field in model.fields:
+            label = f"{model.name}.{field.key}"
+            if field.required:
+                lines.extend([
+                    "        try:",
+                    f"            {field.attribute} = data[{json.dumps(field.key)}]",
+                    "        except KeyError:",
+                    f"            raise DecodeError(\"{label} is required\") from None",
+                ])
+                lines.extend(self._render_check(field.schema, field.attribute, label, "        "))
+            else:
+                lines.extend([
+                    f"        {field.attribute} = data.get({json.dumps(field.key)})",
+                    f"        if {field.attribute} is not None:",
+                ])
+                lines.extend(self._render_check(field.schema, field.attribute, label, "            ") or ["            pass"])
+
+        # Positional arguments are cheaper than keywords on the hot path
+        arguments = ", ".join(field.attribute for field in _parameter_order(model))
+        lines.extend([
+            f"        return cls({arguments})",
+            "",
+            "    @classmethod",
+            f"    def decode(cls, body) -> \"{model.name}\":",
+            "        \"\"\"Decodes a JSON message body\"\"\"",
+            "        return cls.from_dict(loads(body))",
+            "",
+            "    @classmethod",
+            f"    def decode_event(cls, body) -> \"{model.name}\":",
+            "        \"\"\"Decodes the detail of a JSON EventBridge event or projected message\"\"\"",
+            "        return cls.from_dict(find_detail(loads(body)))",
+        ])
+        return lines
+
+
+def _parameter_order(model: Model) -> List[Field]:
+    # Optional fields have a default, so they come after the required ones
+    return sorted(model.fields, key=lambda field: not field.required)
+
+
+def projected_detail_keys(path: str) -> List[str]:
+    """
+    Returns the keys of the projections in a projections file that hold the whole event detail
+
+    Args:
+        path (str): The path of the JSON projections file
+
+    Returns:
+        list: The keys whose path is `$.detail`, in the order of the file
+    """
+    with open(path, encoding="utf-8") as projections_file:
+        projection_file = json.load(projections_file)
+    keys = []
+    for projection in projection_file.values():
+        keys.extend(key for key, key_path in projections.validate_projection(projection).items() if key_path == "$.detail" and key not in keys)
+    return keys
+
+
+def generate(patterns: List[str], output: Optional[str] = None, projections_file: Optional[str] = None) -> str:
+    """
+    Generates the decoder module for the schemas in the given files
+
+    Args:
+        patterns (list): Paths or glob patterns of the exported schema documents
+        output (str, optional): The path the module is written to
+        projections_file (str, optional): The projections of the rules, their `$.detail` keys are decoded too
+
+    Returns:
+        str: The Python source of the module
+    """
+    generator = Generator(projected_detail_keys(projections_file) if projections_file else None)
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            raise ValueError(f"No schemas found for {pattern}")
+        for path in paths:
+            with open(path, encoding="utf-8") as schema_file:
+                generator.add_document(path, json.load(schema_file))
+
+    source = generator.render()
+    compile(source, output or "<generated>", "exec")
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as output_file:
+            output_file.write(source)
+        print(f"Generated {len(generator.models)} classes for {', '.join(sorted(generator.detail_types))} in {output}")
+    return source
+
+
+def main(argv: Optional[list] = None):
+    """Generates the decoder module from the command line"""
+    parser = argparse.ArgumentParser(description="Generates slotted decoder classes from discovered EventBridge schemas.")
+    parser.add_argument("schemas", nargs="+", help="Exported OpenAPI 3 or JSONSchema Draft 4 documents, globs are expanded")
+    parser.add_argument("--projections", default=os.path.join("src", "projections.json"), help="The projections file of the rules, empty to only decode EventBridge events")
+    parser.add_argument("--output", default=os.path.join("src", "order_models.py"), help="The module to write")
+    args = parser.parse_args(argv)
+    generate(args.schemas, args.output, args.projections or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Concurrent multi-stack deployment driver
+
+Runs the `__main__.py` program for a list of stacks (per environment and region) with the
+Pulumi Automation API instead of one `pulumi up` at a time.  Stacks are grouped into waves
+from their dependencies, every wave is deployed on a bounded worker pool and the rollout
+stops at the first wave with a failure.
+
+A plan is a JSON file:
+
+    {
+        "stacks": [
+            {"name": "nonprod"},
+            {"name": "prod-east", "region": "us-east-2", "depends_on": ["nonprod"]},
+            {"name": "prod-west", "region": "us-west-2", "depends_on": ["nonprod"], "config": {"lambda_memory": "512"}}
+        ]
+    }
+
+Every stack runs in a workspace of its own, a temporary directory with a copy of
+`Pulumi.yaml` pointing back at the program and of the stack's `Pulumi.<stack>.yaml`.  The
+region and config of the plan are set there, so they are never written to the
+`Pulumi.<stack>.yaml` files of the repository and concurrent stacks do not share a file.
+
+Usage:
+    python deploy.py --plan stacks.json --operation up --workers 4
+    PULUMI_CONFIG_PASSPHRASE=... python deploy.py --stack nonprod --stack prod@us-east-2 --backend file://~/.pulumi-local --operation preview
+
+A `file://` backend keeps the state offline, but it encrypts secrets with a passphrase, so
+`PULUMI_CONFIG_PASSPHRASE` or `PULUMI_CONFIG_PASSPHRASE_FILE` has to be set, and the program
+still looks up the AWS account when `infra.py` is imported, so AWS credentials are needed
+even for a preview.
+"""
+# pylint: disable=line-too-long,too-many-arguments,too-many-instance-attributes,broad-except
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import yaml
+from pulumi import automation as auto
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ("up", "preview", "refresh", "destroy")
+PASSPHRASE_VARS = ("PULUMI_CONFIG_PASSPHRASE", "PULUMI_CONFIG_PASSPHRASE_FILE")
+
+
+class StackTarget:
+    """
+    A stack to deploy and the stacks that have to be deployed before it
+    """
+
+    def __init__(self, name: str, region: Optional[str] = None, depends_on: Optional[List[str]] = None, config: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.region = region
+        self.depends_on = list(depends_on or [])
+        self.config = dict(config or {})
+
+    @classmethod
+    def parse(cls, value: str) -> "StackTarget":
+        """
+        Parses a `name` or `name@region` command line value
+
+        Args:
+            value (str): The command line value
+
+        Returns:
+            StackTarget: The stack target
+        """
+        name, _, region = value.partition("@")
+        return cls(name, region=region or None)
+
+
+class StackResult:
+    """
+    The outcome of running an operation on a single stack
+    """
+
+    def __init__(self, name: str, status: str, duration: float = 0.0, changes: Optional[Dict[str, int]] = None, error: Optional[str] = None):
+        self.name = name
+        self.status = status
+        self.duration = duration
+        self.changes = changes or {}
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        """True if the operation succeeded"""
+        return self.status == "succeeded"
+
+
+def load_plan(path: str) -> List[StackTarget]:
+    """
+    Loads the stacks from a JSON plan file
+
+    Args:
+        path (str): The path of the plan file
+
+    Returns:
+        list: The stack targets
+    """
+    with open(path, encoding="utf-8") as plan_file:
+        plan = json.load(plan_file)
+    return [
+        StackTarget(stack["name"], region=stack.get("region"), depends_on=stack.get("depends_on"), config=stack.get("config"))
+        for stack in plan["stacks"]
+    ]
+
+
+def plan_waves(targets: List[StackTarget]) -> List[List[StackTarget]]:
+    """
+    Groups the stacks into waves, every stack is in a later wave than the stacks it depends on
+
+    Args:
+        targets (list): The stack targets
+
+    Returns:
+        list: The waves, each a list of stack targets
+    """
+    by_name = {target.name: target for target in targets}
+    for target in targets:
+        unknown = [name for name in target.depends_on if name not in by_name]
+        if unknown:
+            raise ValueError(f"Stack {target.name} depends on unknown stacks: {', '.join(unknown)}")
+
+    waves = []
+    deployed = set()
+    remaining = list(targets)
+    while remaining:
+        wave = [target for target in remaining if set(target.depends_on) <= deployed]
+        if not wave:
+            raise ValueError(f"Dependency cycle between stacks: {', '.join(target.name for target in remaining)}")
+        waves.append(wave)
+        deployed.update(target.name for target in wave)
+        remaining = [target for target in remaining if target.name not in deployed]
+    return waves
+
+
+class DeploymentDriver:
+    """
+    Runs an Automation API operation for many stacks of the `__main__.py` program concurrently
+    """
+
+    def __init__(self, operation: str = "up", workers: int = 4, backend_url: Optional[str] = None, work_dir: str = PROJECT_DIR, env_vars: Optional[Dict[str, str]] = None, on_output: Optional[Callable[[str, str], None]] = None):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unsupported operation: {operation}")
+
+        self.operation = operation
+        self.workers = workers
+        self.work_dir = work_dir
+        self.env_vars = dict(env_vars or {})
+        if backend_url is not None:
+            # e.g. file:///tmp/pulumi-state for an offline file backend
+            self.env_vars["PULUMI_BACKEND_URL"] = backend_url
+            if backend_url.startswith("file://") and not any(name in self.env_vars or name in os.environ for name in PASSPHRASE_VARS):
+                raise ValueError(f"The file backend encrypts secrets with a passphrase, set {' or '.join(PASSPHRASE_VARS)}")
+        self.on_output = on_output
+
+    def write_workspace(self, target: StackTarget, workspace_dir: str):
+        """
+        Writes the workspace of a stack, which runs the program in `work_dir`
+
+        Args:
+            target (StackTarget): The stack the workspace is for
+            workspace_dir (str): The directory to write `Pulumi.yaml` and `Pulumi.<stack>.yaml` to
+        """
+        with open(os.path.join(self.work_dir, "Pulumi.yaml"), encoding="utf-8") as project_file:
+            project = yaml.safe_load(project_file)
+
+        project["main"] = os.path.relpath(os.path.join(self.work_dir, project.get("main", ".")), workspace_dir)
+        options = project["runtime"].get("options", {}) if isinstance(project["runtime"], dict) else {}
+        if "virtualenv" in options:
+            options["virtualenv"] = os.path.join(self.work_dir, options["virtualenv"])
+        with open(os.path.join(workspace_dir, "Pulumi.yaml"), "w", encoding="utf-8") as project_file:
+            yaml.safe_dump(project, project_file, sort_keys=False)
+
+        stack_file = os.path.join(self.work_dir, f"Pulumi.{target.name}.yaml")
+        if os.path.exists(stack_file):
+            shutil.copy(stack_file, workspace_dir)
+
+    def _select_stack(self, target: StackTarget, workspace_dir: str) -> auto.Stack:
+        self.write_workspace(target, workspace_dir)
+        stack = auto.create_or_select_stack(
+            stack_name=target.name,
+            work_dir=workspace_dir,
+            opts=auto.LocalWorkspaceOptions(env_vars=self.env_vars),
+        )
+        if target.region is not None:
+            stack.set_config("aws:region", auto.ConfigValue(value=target.region))
+        for key, value in target.config.items():
+            stack.set_config(key, auto.ConfigValue(value=value))
+        return stack
+
+    def run_stack(self, target: StackTarget) -> StackResult:
+        """
+        Runs the operation on a single stack
+
+        Args:
+            target (StackTarget): The stack to run the operation on
+
+        Returns:
+            StackResult: The outcome of the operation
+        """
+        def on_output(line: str):
+            if self.on_output is not None:
+                self.on_output(target.name, line)
+
+        start = time.monotonic()
+        try:
+            with tempfile.TemporaryDirectory(prefix=f"pulumi-{target.name}-") as workspace_dir:
+                stack = self._select_stack(target, workspace_dir)
+                if self.operation == "preview":
+                    changes = stack.preview(on_output=on_output).change_summary
+                else:
+                    result = getattr(stack, self.operation)(on_output=on_output)
+                    changes = result.summary.resource_changes
+        except Exception as error:
+            return StackResult(target.name, "failed", time.monotonic() - start, error=str(error).strip().splitlines()[-1] if str(error).strip() else repr(error))
+
+        return StackResult(target.name, "succeeded", time.monotonic() - start, changes={str(op): count for op, count in (changes or {}).items()})
+
+    def run(self, targets: List[StackTarget], stop_on_failure: bool = True) -> List[StackResult]:
+        """
+        Runs the operation on every stack wave by wave
+
+        Args:
+            targets (list): The stack targets
+            stop_on_failure (bool): Skip the remaining waves once a stack fails. Defaults to True.
+
+        Returns:
+            list: The outcome of every stack in the order they were given
+        """
+        waves = plan_waves(targets)
+        if self.operation == "destroy":
+            # Tear down dependents before the stacks they depend on
+            waves.reverse()
+
+        results = {}
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for number, wave in enumerate(waves, start=1):
+                if failed and stop_on_failure:
+                    for target in wave:
+                        results[target.name] = StackResult(target.name, "skipped")
+                    continue
+
+                print(f"Wave {number}/{len(waves)}: {', '.join(target.name for target in wave)}")
+                for result in pool.map(self.run_stack, wave):
+                    results[result.name] = result
+                    failed = failed or not result.succeeded
+
+        return [results[target.name] for target in targets]
+
+
+def format_summary(results: List[StackResult]) -> str:
+    """
+    Formats the per stack duration and resource changes as a table
+
+    Args:
+        results (list): The outcome of every stack
+
+    Returns:
+        str: The summary table
+    """
+    rows = [("STACK", "STATUS", "DURATION", "CHANGES")]
+    for result in results:
+        changes = ", ".join(f"{op}={count}" for op, count in sorted(result.changes.items())) or "-"
+        if result.error:
+            changes = result.error
+        rows.append((result.name, result.status, f"{result.duration:.1f}s", changes))
+
+    widths = [max(len(row[column]) for row in rows) for column in range(3)]
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(row[:3], widths)) + "  " + row[3]
+        for row in rows
+    )
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Deploys the stacks from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Runs the Pulumi program for many stacks concurrently.",
+        epilog="A file:// backend needs PULUMI_CONFIG_PASSPHRASE or PULUMI_CONFIG_PASSPHRASE_FILE, and the program needs AWS credentials to look up the account, even for a preview.")
+    parser.add_argument("--plan", help="JSON plan file with the stacks, their regions, config and dependencies")
+    parser.add_argument("--stack", action="append", default=[], help="A stack as name or name@region, can be repeated")
+    parser.add_argument("--operation", choices=OPERATIONS, default="preview", help="The operation to run on every stack")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of stacks running at the same time")
+    parser.add_argument("--backend", help="Backend URL, for example file:///tmp/pulumi-state")
+    parser.add_argument("--continue-on-failure", action="store_true", help="Keep rolling out later waves after a failure")
+    parser.add_argument("--quiet", action="store_true", help="Do not stream the Pulumi output")
+    args = parser.parse_args(argv)
+
+    targets = load_plan(args.plan) if args.plan else []
+    targets.extend(StackTarget.parse(value) for value in args.stack)
+    if not targets:
+        parser.error("no stacks given, use --plan or --stack")
+
+    try:
+        driver = DeploymentDriver(
+            operation=args.operation,
+            workers=args.workers,
+            backend_url=args.backend,
+            on_output=None if args.quiet else lambda name, line: print(f"[{name}] {line.rstrip()}"),
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    results = driver.run(targets, stop_on_failure=not args.continue_on_failure)
+
+    print(format_summary(results))
+    return 0 if all(result.succeeded for result in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
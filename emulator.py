@@ -0,0 +1,737 @@
+"""
+In-process pipeline emulator
+
+Emulates the HTTP API -> EventBridge -> Rule -> SQS -> Lambda pipeline that is
+created by `infra.py` without deploying anything.  `PipelineEmulator` exposes the
+same helper functions as `infra.py` (`create_event_bus`, `create_http_api`,
+`create_sqs_queue`, `create_rule_and_sqs_target` and `create_lambda_function`)
+so the definition in `pipeline.py` that `__main__.py` deploys is built against it,
+and then invokes the real Lambda handler with SQS shaped batches.
+
+Records the handler fails are received again, like after their visibility timeout,
+until they reach `max_receives` and are counted as failed.  Time is not simulated, so a
+redelivered message goes to the back of its queue instead of waiting for the timeout.
+
+Usage:
+    python emulator.py --count 1000 --detail-type NewOrder
+    python emulator.py --count 1000 --capacity capacity.json
+"""
+# pylint: disable=line-too-long,invalid-name,too-many-arguments,too-many-locals,too-many-instance-attributes,unused-argument
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import capacity
+import event_patterns
+import pipeline
+import projections
+
+
+AWS_ACCOUNT_ID = "000000000000"
+AWS_REGION = "us-east-2"
+ENVIRONMENT = "local"
+APP_NAME = "pineapple-pizza"
+
+# https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html#events-sqs-eventsource
+DEFAULT_BATCH_SIZE = 10
+# https://docs.aws.amazon.com/lambda/latest/dg/configuration-function-common.html#configuration-timeout-console
+DEFAULT_TIMEOUT = 3
+# The queues have no redrive policy, so in AWS a failing message is received until its retention
+# expires, the emulator gives up after this many receives
+DEFAULT_MAX_RECEIVES = 3
+
+
+class LocalEventBus:
+    """
+    Stand in for the `infra.EventBus` component, with the outputs the pipeline definition reads
+    """
+
+    def __init__(self, name: str, api_role_arn: str):
+        self.name = name
+        self.api_role_arn = api_role_arn
+
+
+class LambdaContext:
+    """
+    Minimal stand in for the Lambda context object
+
+    https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
+    """
+
+    def __init__(self, function_name: str, memory: int, timeout: int = 3):
+        self.function_name = function_name
+        self.function_version = "$LATEST"
+        self.invoked_function_arn = f"arn:aws:lambda:{AWS_REGION}:{AWS_ACCOUNT_ID}:function:{function_name}"
+        self.memory_limit_in_mb = memory
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f"/aws/lambda/{function_name}"
+        self.log_stream_name = "local"
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        """Returns the number of milliseconds left before the execution times out"""
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class Report:
+    """
+    End to end throughput and latency of an emulator run
+    """
+
+    def __init__(self, published: int, failed_puts: int, unrouted: int, filtered: int, processed: int, retried: int, failed: int, pending: int, elapsed: float, handler_time: float, latencies: list):
+        self.published = published
+        self.failed_puts = failed_puts
+        self.unrouted = unrouted
+        self.filtered = filtered
+        self.processed = processed
+        self.retried = retried
+        self.failed = failed
+        self.pending = pending
+        self.elapsed = elapsed
+        self.handler_time = handler_time
+        self.latencies = sorted(latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Processed records per second, end to end"""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Returns the end to end latency percentile in milliseconds"""
+        if not self.latencies:
+            return 0.0
+        index = min(len(self.latencies) - 1, int(round(percent / 100 * (len(self.latencies) - 1))))
+        return self.latencies[index] * 1000
+
+    def to_dict(self) -> dict:
+        """Returns the report as a dict"""
+        return {
+            "published": self.published,
+            "failed_puts": self.failed_puts,
+            "unrouted": self.unrouted,
+            "filtered": self.filtered,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "pending": self.pending,
+            "elapsed_seconds": round(self.elapsed, 4),
+            "handler_seconds": round(self.handler_time, 4),
+            "throughput_per_second": round(self.throughput, 2),
+            "latency_ms": {
+                "p50": round(self.percentile(50), 3),
+                "p90": round(self.percentile(90), 3),
+                "p99": round(self.percentile(99), 3),
+                "max": round(self.latencies[-1] * 1000, 3) if self.latencies else 0.0,
+            },
+        }
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class ConditionalCheckFailedException(Exception):
+    """Raised by `LocalDynamoDB` like the botocore error of the same name"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.response = {"Error": {"Code": "ConditionalCheckFailedException", "Message": message}}
+
+
+class LocalDynamoDB:
+    """
+    In-memory stand-in for the DynamoDB client calls of `src/idempotency.py`
+
+    Condition expressions are limited to `attribute_exists`, `attribute_not_exists` and
+    comparisons joined by `AND`/`OR` without parentheses.  Like DynamoDB, expired items are
+    still returned until TTL deletes them, which the stand-in never does.
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def create_table(self, table_name: str):
+        """Creates an empty table keyed on `id`"""
+        self.tables.setdefault(table_name, {})
+
+    def put_item(self, TableName: str, Item: dict, ConditionExpression: Optional[str] = None, ExpressionAttributeNames: Optional[dict] = None, ExpressionAttributeValues: Optional[dict] = None, **kwargs) -> dict:
+        """Writes an item, if the condition holds for the current one"""
+        table = self.tables[TableName]
+        key = Item["id"]["S"]
+        if ConditionExpression and not _condition_holds(ConditionExpression, table.get(key), ExpressionAttributeNames or {}, ExpressionAttributeValues or {}):
+            raise ConditionalCheckFailedException("The conditional request failed")
+        table[key] = json.loads(json.dumps(Item))
+        return {}
+
+    def get_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        """Reads an item"""
+        item = self.tables[TableName].get(Key["id"]["S"])
+        return {} if item is None else {"Item": json.loads(json.dumps(item))}
+
+    def delete_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        """Deletes an item"""
+        self.tables[TableName].pop(Key["id"]["S"], None)
+        return {}
+
+
+class LocalEvents:
+    """
+    Stand-in for the EventBridge client, `PutEvents` routes the entries through the emulated rules
+
+    `throttle(count)` makes the next `count` entries fail, to exercise partial failure retries.
+    """
+
+    def __init__(self, emulator: "PipelineEmulator"):
+        self.emulator = emulator
+        self.calls = 0
+        self._throttled = 0
+
+    def throttle(self, count: int):
+        """Fails the next entries with `ThrottlingException`"""
+        self._throttled += count
+
+    def put_events(self, Entries: list, **kwargs) -> dict:
+        """Puts a batch of events"""
+        if len(Entries) > 10:
+            raise ValueError("PutEvents accepts at most 10 entries")
+        self.calls += 1
+        results = []
+        for entry in Entries:
+            if self._throttled:
+                self._throttled -= 1
+                results.append({"ErrorCode": "ThrottlingException", "ErrorMessage": "Rate exceeded"})
+            else:
+                results.append(self.emulator._put_event(entry))  # pylint: disable=protected-access
+        return {"FailedEntryCount": sum("ErrorCode" in result for result in results), "Entries": results}
+
+
+class LocalSQS:
+    """
+    Stand-in for the SQS client, `SendMessageBatch` appends to the emulated queues
+
+    `throttle(count)` makes the next `count` entries fail without a sender fault.
+    """
+
+    def __init__(self, emulator: "PipelineEmulator"):
+        self.emulator = emulator
+        self.calls = 0
+        self._throttled = 0
+
+    def throttle(self, count: int):
+        """Fails the next entries with a retryable error"""
+        self._throttled += count
+
+    def send_message_batch(self, QueueUrl: str, Entries: list, **kwargs) -> dict:
+        """Sends a batch of messages"""
+        if len(Entries) > 10:
+            raise ValueError("SendMessageBatch accepts at most 10 entries")
+        self.calls += 1
+        queue_arn = next((arn for arn in self.emulator.queues if queue_url(arn) == QueueUrl), None)
+        successful, failed = [], []
+        for entry in Entries:
+            if queue_arn is None:
+                failed.append({"Id": entry["Id"], "SenderFault": True, "Code": "AWS.SimpleQueueService.NonExistentQueue"})
+            elif self._throttled:
+                self._throttled -= 1
+                failed.append({"Id": entry["Id"], "SenderFault": False, "Code": "ServiceUnavailable"})
+            else:
+                message_id = self.emulator._send_message(queue_arn, entry["MessageBody"])  # pylint: disable=protected-access
+                successful.append({"Id": entry["Id"], "MessageId": message_id})
+        return {"Successful": successful, "Failed": failed}
+
+
+def queue_url(queue_arn: str) -> str:
+    """Returns the URL of a queue like `infra.sqs_queue_url`"""
+    _, _, _, region, account_id, queue_name = queue_arn.split(":")
+    return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+
+def _attribute_value(value: dict):
+    if "N" in value:
+        return float(value["N"])
+    return next(iter(value.values()))
+
+
+def _condition_holds(expression: str, item: Optional[dict], names: dict, values: dict) -> bool:
+    comparisons = {
+        "=": lambda a, b: a == b,
+        "<>": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+    }
+
+    def term_holds(term: str) -> bool:
+        term = term.strip()
+        for function, expected in (("attribute_not_exists", False), ("attribute_exists", True)):
+            if term.startswith(f"{function}("):
+                name = names.get(term[len(function) + 1:-1].strip(), term[len(function) + 1:-1].strip())
+                return (item is not None and name in item) is expected
+
+        attribute, operator, placeholder = term.split()
+        name = names.get(attribute, attribute)
+        if item is None or name not in item:
+            return False
+        return comparisons[operator](_attribute_value(item[name]), _attribute_value(values[placeholder]))
+
+    return any(
+        all(term_holds(term) for term in alternative.split(" AND "))
+        for alternative in expression.split(" OR ")
+    )
+
+
+class PipelineEmulator:
+    """
+    Emulates the resources created by `infra.py` in memory
+    """
+
+    def __init__(self, environment: str = ENVIRONMENT, app_name: str = APP_NAME, base_dir: Optional[str] = None, max_receives: int = DEFAULT_MAX_RECEIVES):
+        self.environment = environment
+        self.max_receives = max_receives
+        self.stack_name = f"{environment}-{app_name}"
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        self.buses = {}
+        self.routes = {}
+        self.queues = {}
+        self.functions = []
+        self.dynamodb = LocalDynamoDB()
+        self.events = LocalEvents(self)
+        self.sqs = LocalSQS(self)
+        # When the first record was published and when the queues were drained
+        self.started = None
+        self.finished = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.published = 0
+        self.failed_puts = 0
+        self.unrouted = 0
+        self.filtered = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.handler_time = 0.0
+        self.latencies = []
+        self.started = None
+        self.finished = None
+
+    # ----------------------------------------------------------------
+    # Helpers mirroring infra.py
+    # ----------------------------------------------------------------
+
+    def create_event_bus(self, name: str, archive_retention: Optional[int] = 7, enable_schema_discoverer: Optional[bool] = False) -> "LocalEventBus":
+        """Emulates `infra.create_event_bus`, returns the EventBridge Event Bus"""
+        bus_name = f"{self.stack_name}-bus"
+        self.buses.setdefault(bus_name, [])
+        return LocalEventBus(bus_name, f"arn:aws:iam::{AWS_ACCOUNT_ID}:role/{self.stack_name}-bus-api-role")
+
+    def create_http_api(self, name: str, authorizer_type: str, authorizer_uri: str, authorizer_audience: str, bus_name: str, api_url: str, api_path: Optional[str], route53_zone_name: str, certificate_name: str, authorizer_scopes: str = None, log_retention_days: int = 7, integration: Optional[str] = "EventBridge", queue_arn: Optional[str] = None, routes: Optional[list] = None, throttle_burst: Optional[int] = None, throttle_rate: Optional[float] = None, bus_role_arn: Optional[str] = None) -> str:
+        """Emulates `infra.create_http_api`, returns the API ID"""
+        if routes is None:
+            routes = [{"route": api_path, "target": integration, "queue_arn": queue_arn}]
+
+        for route in routes:
+            target = route.get("target") or "EventBridge"
+            scopes = route.get("scopes") or authorizer_scopes
+            # The scopes the JWT authorizer asks for, one of them has to be granted
+            scopes = [scopes] if isinstance(scopes, str) else list(scopes or [])
+            if target == "SQS":
+                self.routes[route["route"]] = {"integration": target, "queue_arn": route["queue_arn"], "parameters": pipeline.SQS_REQUEST_PARAMETERS, "scopes": scopes}
+            elif target == "Lambda":
+                self.routes[route["route"]] = {"integration": target, "function_arn": route["function_arn"], "parameters": {}, "scopes": scopes}
+            else:
+                parameters = {"EventBusName": bus_name, **pipeline.EVENTBRIDGE_REQUEST_PARAMETERS}
+                if route.get("detail_type"):
+                    parameters["DetailType"] = route["detail_type"]
+                if route.get("source"):
+                    parameters["Source"] = route["source"]
+                self.routes[route["route"]] = {"integration": target, "parameters": parameters, "scopes": scopes}
+        return f"{name}-local"
+
+    def create_sqs_queue(self, name: str, visibility_timeout: Optional[int] = None, message_retention: Optional[int] = None) -> str:
+        """Emulates `infra.create_sqs_queue`, returns the SQS Queue ARN"""
+        queue_arn = f"arn:aws:sqs:{AWS_REGION}:{AWS_ACCOUNT_ID}:{self.stack_name}-{name}-queue"
+        self.queues[queue_arn] = deque()
+        return queue_arn
+
+    def create_rule_and_sqs_target(self, name: str, bus_name: str, rule_pattern: str, queue_target_arn: str, enabled: Optional[bool] = True, input_path: Optional[str] = None, projection: Optional[dict] = None, projection_samples: Optional[list] = None) -> str:
+        """Emulates `infra.create_rule_and_sqs_target`, returns the Event Rule ARN"""
+        if input_path is not None and projection is not None:
+            raise ValueError("Only one of input_path and projection can be set on an Event Target")
+        if projection is not None:
+            projections.validate_projection(projection)
+            if projection_samples:
+                projections.check_projection(projection, projection_samples)
+        rule_arn = f"arn:aws:events:{AWS_REGION}:{AWS_ACCOUNT_ID}:rule/{bus_name}/{self.stack_name}-{name}-rule"
+        self.buses.setdefault(bus_name, []).append({
+            "arn": rule_arn,
+            "pattern": event_patterns.validate_pattern(rule_pattern),
+            "target": queue_target_arn,
+            "input_path": input_path,
+            "projection": projection,
+            "enabled": enabled,
+        })
+        return rule_arn
+
+    def create_lambda_function(self, function_name: str, runtime: str, code_source: str, handler: str, memory: int, queue_arn: str, layer_arns: Optional[str] = None, x_ray: Optional[bool] = False, insights: Optional[bool] = False, powertools: Optional[bool] = False, architecture: Optional[str] = "x86_64", requirements: Optional[str] = None, filter_patterns: Optional[list] = None, message_projection: Optional[dict] = None, idempotency: Optional[bool] = False, idempotency_key: Optional[str] = "messageId", idempotency_ttl: Optional[int] = 3600, publish_bus_name: Optional[str] = None, publish_queue_arns: Optional[list] = None, timeout: Optional[int] = None, batch_size: Optional[int] = None, batching_window: Optional[int] = None, maximum_concurrency: Optional[int] = None) -> str:
+        """Emulates `infra.create_lambda_function`, returns the Lambda Function ARN"""
+        name = f"{self.stack_name}-{function_name}"
+        function_arn = f"arn:aws:lambda:{AWS_REGION}:{AWS_ACCOUNT_ID}:function:{name}"
+
+        environment = {
+            "IDEMPOTENCY_TABLE": None, "IDEMPOTENCY_KEY": None, "IDEMPOTENCY_TTL": None,
+            "PUBLISH_BUS_NAME": publish_bus_name,
+            "PUBLISH_QUEUE_URLS": ",".join(queue_url(arn) for arn in publish_queue_arns) if publish_queue_arns else None,
+        }
+        if idempotency is True:
+            table_name = f"{self.stack_name}-{function_name}-idempotency"
+            self.dynamodb.create_table(table_name)
+            environment.update({"IDEMPOTENCY_TABLE": table_name, "IDEMPOTENCY_KEY": idempotency_key, "IDEMPOTENCY_TTL": str(idempotency_ttl)})
+        self.functions.append({
+            "name": name,
+            "arn": function_arn,
+            "memory": memory or 128,
+            "queue_arn": queue_arn,
+            "batch_size": batch_size or DEFAULT_BATCH_SIZE,
+            "timeout": timeout or DEFAULT_TIMEOUT,
+            "filters": event_patterns.sqs_filter_patterns(filter_patterns or [], message_projection),
+            "handler": self._load_handler(name, code_source, handler, memory or 128, environment),
+        })
+        return function_arn
+
+    def _load_handler(self, name: str, code_source: str, handler: str, memory: int, environment: dict) -> Callable:
+        code_dir = os.path.normpath(os.path.join(self.base_dir, code_source))
+        module_name, function = handler.rsplit(".", 1)
+
+        # Reserved runtime environment variables the handler may read on import
+        os.environ.setdefault("AWS_REGION", AWS_REGION)
+        os.environ.setdefault("AWS_DEFAULT_REGION", AWS_REGION)
+        os.environ.setdefault("ENVIRONMENT", self.environment)
+        # These differ per function, so every handler is loaded with its own
+        os.environ["AWS_LAMBDA_FUNCTION_NAME"] = name
+        os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"] = str(memory)
+
+        # Variables set by infra.py differ per function, so they replace the ones of the previous function
+        for key, value in environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+        if code_dir not in sys.path:
+            sys.path.insert(0, code_dir)
+        if environment.get("IDEMPOTENCY_TABLE"):
+            idempotency = importlib.import_module("idempotency")
+            idempotency.client_factory = lambda: self.dynamodb
+        if environment.get("PUBLISH_BUS_NAME") or environment.get("PUBLISH_QUEUE_URLS"):
+            publisher = importlib.import_module("publisher")
+            publisher.client_factory = lambda service: {"events": self.events, "sqs": self.sqs}[service]
+            publisher._CLIENTS.clear()  # pylint: disable=protected-access
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(code_dir, *module_name.split(".")) + ".py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return getattr(module, function)
+
+    # ----------------------------------------------------------------
+    # HTTP API -> EventBridge
+    # ----------------------------------------------------------------
+
+    def request(self, route_key: str, body: str, headers: Optional[dict] = None, query: Optional[dict] = None) -> dict:
+        """
+        Sends a request to the emulated HTTP API
+
+        Args:
+            route_key (str): The route, for example `POST /event`
+            body (str): The raw request body
+            headers (dict): Request headers
+            query (dict): Query string parameters
+
+        Returns:
+            dict: The PutEvents or SendMessage response the integration would return
+        """
+        if self.started is None:
+            self.started = time.perf_counter()
+
+        route = self.routes.get(route_key) or self.routes.get("$default")
+        if route is None:
+            return {"message": "Not Found"}
+
+        request_id = str(uuid.uuid4())
+        context = {
+            "body": body,
+            "headers": {key.lower(): value for key, value in (headers or {}).items()},
+            "query": query or {},
+            "request_id": request_id,
+        }
+        entry = {key: _resolve_parameter(value, context) for key, value in route["parameters"].items()}
+
+        if route["integration"] == "SQS":
+            self.published += 1
+            message_id = self._send_message(route["queue_arn"], entry["MessageBody"])
+            return {"MessageId": message_id}
+
+        if route["integration"] == "Lambda":
+            return self._invoke_http(route, route_key, context)
+
+        result = self._put_event(entry)
+        return {"FailedEntryCount": int("ErrorCode" in result), "Entries": [result]}
+
+    def _put_event(self, entry: dict) -> dict:
+        try:
+            detail = json.loads(entry["Detail"])
+        except (TypeError, ValueError):
+            self.failed_puts += 1
+            return {"ErrorCode": "MalformedDetail", "ErrorMessage": "Detail is malformed."}
+
+        event = {
+            "version": "0",
+            "id": str(uuid.uuid4()),
+            "detail-type": entry["DetailType"],
+            "source": entry["Source"],
+            "account": AWS_ACCOUNT_ID,
+            "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "region": AWS_REGION,
+            "resources": entry.get("Resources", []),
+            "detail": detail,
+        }
+        self.published += 1
+        self._route(entry["EventBusName"], event)
+        return {"EventId": event["id"]}
+
+    def _route(self, bus_name: str, event: dict):
+        delivered = False
+        for rule in self.buses.get(bus_name, []):
+            if rule["enabled"] and event_patterns.matches(rule["pattern"], event):
+                self._send_message(rule["target"], json.dumps(_transform_input(rule, event)))
+                delivered = True
+        if not delivered:
+            self.unrouted += 1
+
+    def _send_message(self, queue_arn: str, body: str) -> str:
+        now = time.time()
+        message = {
+            "messageId": str(uuid.uuid4()),
+            "receiptHandle": uuid.uuid4().hex,
+            "body": body,
+            "attributes": {
+                "ApproximateReceiveCount": "1",
+                "SentTimestamp": str(int(now * 1000)),
+                "SenderId": AWS_ACCOUNT_ID,
+                "ApproximateFirstReceiveTimestamp": str(int(now * 1000)),
+            },
+            "messageAttributes": {},
+            "md5OfBody": hashlib.md5(body.encode()).hexdigest(),
+            "eventSource": "aws:sqs",
+            "eventSourceARN": queue_arn,
+            "awsRegion": AWS_REGION,
+        }
+        self.queues[queue_arn].append((time.perf_counter(), message))
+        return message["messageId"]
+
+    def _invoke_http(self, route: dict, route_key: str, context: dict):
+        function = next(function for function in self.functions if function["arn"] == route["function_arn"])
+        method, _, path = route_key.partition(" ")
+
+        # https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-lambda.html
+        event = {
+            "version": "2.0",
+            "routeKey": route_key,
+            "rawPath": path,
+            "rawQueryString": "&".join(f"{key}={value}" for key, value in context["query"].items()),
+            "headers": context["headers"],
+            "queryStringParameters": context["query"] or None,
+            "requestContext": {
+                "accountId": AWS_ACCOUNT_ID,
+                "requestId": context["request_id"],
+                "routeKey": route_key,
+                "stage": self.environment,
+                "http": {"method": method, "path": path, "sourceIp": context["headers"].get("x-forwarded-for", "127.0.0.1")},
+            },
+            "body": context["body"],
+            "isBase64Encoded": False,
+        }
+
+        start = time.perf_counter()
+        response = function["handler"](event, LambdaContext(function["name"], function["memory"], function["timeout"]))
+        self.handler_time += time.perf_counter() - start
+        return response
+
+    # ----------------------------------------------------------------
+    # SQS -> Lambda
+    # ----------------------------------------------------------------
+
+    def drain(self):
+        """
+        Invokes the Lambda handlers until every consumed queue is empty
+        """
+        while True:
+            invoked = False
+            for function in self.functions:
+                queue = self.queues[function["queue_arn"]]
+                batch = self._poll(function, queue)
+                if batch:
+                    self._invoke(function, batch)
+                    invoked = True
+                elif queue:
+                    invoked = True
+            if not invoked:
+                break
+        self.finished = time.perf_counter()
+
+    def _poll(self, function: dict, queue: deque) -> list:
+        # Like the event source mapping, messages that match no filter are deleted and do not count towards the batch
+        batch = []
+        while queue and len(batch) < function["batch_size"]:
+            enqueued, message = queue.popleft()
+            if function["filters"] and not any(event_patterns.matches(pattern, _filter_record(message)) for pattern in function["filters"]):
+                self.filtered += 1
+                continue
+            batch.append((enqueued, message))
+        return batch
+
+    def _invoke(self, function: dict, batch: list):
+        event = {"Records": [message for _, message in batch]}
+        context = LambdaContext(function["name"], function["memory"], function["timeout"])
+
+        start = time.perf_counter()
+        failed_ids = set()
+        try:
+            response = function["handler"](event, context)
+            if isinstance(response, dict):
+                failed_ids = {item["itemIdentifier"] for item in response.get("batchItemFailures", [])}
+        except Exception as error:  # pylint: disable=broad-except
+            print(f" ! {function['name']} failed: {error!r}")
+            failed_ids = {message["messageId"] for _, message in batch}
+        end = time.perf_counter()
+
+        self.handler_time += end - start
+        for enqueued, message in batch:
+            if message["messageId"] in failed_ids:
+                self._redeliver(function["queue_arn"], enqueued, message)
+            else:
+                self.processed += 1
+                self.latencies.append(end - enqueued)
+
+    def _redeliver(self, queue_arn: str, enqueued: float, message: dict):
+        receives = int(message["attributes"]["ApproximateReceiveCount"])
+        if receives >= self.max_receives:
+            self.failed += 1
+            return
+        # Received again once the visibility timeout expires, with the same message id and body
+        attributes = {**message["attributes"], "ApproximateReceiveCount": str(receives + 1)}
+        self.queues[queue_arn].append((enqueued, {**message, "receiptHandle": uuid.uuid4().hex, "attributes": attributes}))
+        self.retried += 1
+
+    def report(self) -> Report:
+        """
+        Returns the throughput and latency report for everything sent so far
+        """
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        consumed = {function["queue_arn"] for function in self.functions}
+        pending = sum(len(queue) for arn, queue in self.queues.items() if arn in consumed)
+        return Report(self.published, self.failed_puts, self.unrouted, self.filtered, self.processed, self.retried, self.failed, pending, elapsed, self.handler_time, self.latencies)
+
+    def load_test(self, route_key: str, bodies, headers: Optional[dict] = None, drain_every: Optional[int] = None) -> Report:
+        """
+        Sends every body through the pipeline and drains the queues
+
+        Args:
+            route_key (str): The route, for example `POST /event`
+            bodies (iterable): Raw request bodies to send
+            headers (dict): Request headers sent with every request
+            drain_every (int): Drain the queues after this many requests, defaults to draining once at the end
+
+        Returns:
+            Report: Throughput and latency report
+        """
+        self._reset_counters()
+        for index, body in enumerate(bodies, start=1):
+            self.request(route_key, body, headers=headers)
+            if drain_every and index % drain_every == 0:
+                self.drain()
+        self.drain()
+        return self.report()
+
+
+def _transform_input(rule: dict, event: dict):
+    if rule["projection"] is not None:
+        return projections.project(rule["projection"], event)
+    if rule["input_path"] is not None:
+        return projections.resolve(rule["input_path"], event)
+    return event
+
+
+def _filter_record(message: dict) -> dict:
+    # The poller matches against the parsed body when it is JSON, the raw string otherwise
+    try:
+        body = json.loads(message["body"])
+    except ValueError:
+        body = message["body"]
+    return {**message, "body": body}
+
+
+def _resolve_parameter(value: str, context: dict) -> str:
+    if not isinstance(value, str) or not value.startswith("$"):
+        return value
+    if value == "$request.body":
+        return context["body"]
+    if value.startswith("$request.header."):
+        return context["headers"].get(value[len("$request.header."):].lower())
+    if value.startswith("$request.querystring."):
+        return context["query"].get(value[len("$request.querystring."):])
+    if value == "$context.requestId":
+        return context["request_id"]
+    return value
+
+
+def build_pizza_pipeline(emulator: PipelineEmulator, memory: int = 256, capacity_config: Optional[dict] = None) -> PipelineEmulator:
+    """
+    Builds the pipeline of `pipeline.py`, the one `__main__.py` deploys, against the emulator
+
+    Args:
+        emulator (PipelineEmulator): The emulator
+        memory (int): The `lambda_memory` stack config, the capacity config takes precedence
+        capacity_config (dict, optional): The `capacity` stack config, planned by `capacity.py`
+
+    Returns:
+        PipelineEmulator: The emulator
+    """
+    pipeline.define_pizza_pipeline(emulator, {"lambda_memory": memory}, capacity.validate_capacity(capacity_config))
+    return emulator
+
+
+def main(argv: Optional[list] = None):
+    """Runs a local load test against the emulated pizza pipeline"""
+    parser = argparse.ArgumentParser(description="Emulates the HTTP API -> EventBridge -> SQS -> Lambda pipeline in process.")
+    parser.add_argument("--count", type=int, default=1000, help="Number of requests to send")
+    parser.add_argument("--detail-type", default="NewOrder", help="The `detail-type` of the request body")
+    parser.add_argument("--memory", type=int, default=256, help="Lambda memory passed to the handler context")
+    parser.add_argument("--drain-every", type=int, default=None, help="Drain the queues after this many requests")
+    parser.add_argument("--max-receives", type=int, default=DEFAULT_MAX_RECEIVES, help="Receives of a failing message before it is counted as failed")
+    parser.add_argument("--capacity", default=None, help="A capacity spec, like capacity.json, planned and applied as the stack's capacity config")
+    args = parser.parse_args(argv)
+
+    capacity_config = None
+    if args.capacity:
+        with open(args.capacity, encoding="utf-8") as spec_file:
+            capacity_config, _, _ = capacity.plan(json.load(spec_file))
+    emulator = build_pizza_pipeline(PipelineEmulator(max_receives=args.max_receives), memory=args.memory, capacity_config=capacity_config)
+    bodies = (
+        json.dumps({"source": "Pizza", "detail-type": args.detail_type, "order": {"id": index, "toppings": ["pineapple", "ham"]}})
+        for index in range(args.count)
+    )
+    print(emulator.load_test("POST /event", bodies, headers={"x-forwarded-for": "127.0.0.1"}, drain_every=args.drain_every))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+EventBridge event pattern matching
+
+A small, dependency free implementation of the EventBridge pattern syntax used by
+the `rule_pattern` argument of `infra.create_rule_and_sqs_target` and the
+`filter_patterns` of `infra.create_lambda_function`.  It allows the same JSON
+patterns that are deployed to be validated and evaluated locally.
+"""
+# pylint: disable=line-too-long,too-many-return-statements
+
+import ipaddress
+import json
+import re
+from typing import Any, Iterator, Optional, Tuple, Union
+
+
+NUMERIC_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+# https://docs.aws.amazon.com/lambda/latest/dg/invocation-eventfiltering.html
+MAX_FILTER_PATTERNS = 5
+FILTER_PATTERN_MAX_LENGTH = 4096
+# Filters rules allow that Lambda event filtering does not
+SQS_UNSUPPORTED_FILTERS = ("wildcard", "cidr")
+
+
+def load_pattern(pattern: Union[str, dict]) -> dict:
+    """
+    Loads an event pattern that was passed either as a JSON string or a dict
+
+    Args:
+        pattern (str | dict): The event pattern
+
+    Returns:
+        dict: The event pattern as a dict
+    """
+    if isinstance(pattern, str):
+        return json.loads(pattern)
+    return pattern
+
+
+def validate_pattern(pattern: Union[str, dict], max_length: Optional[int] = None) -> dict:
+    """
+    Validates an EventBridge event pattern without deploying it
+
+    Args:
+        pattern (str | dict): The event pattern as a JSON string or dict
+        max_length (int, optional): The maximum length of the pattern as JSON
+
+    Raises:
+        ValueError: If the pattern is not valid
+
+    Returns:
+        dict: The event pattern as a dict
+    """
+    try:
+        loaded = load_pattern(pattern)
+    except ValueError as error:
+        raise ValueError(f"Event pattern is not valid JSON: {error}") from error
+
+    if not isinstance(loaded, dict) or not loaded:
+        raise ValueError("Event pattern must be a non empty JSON object")
+    if max_length is not None and len(json.dumps(loaded, separators=(",", ":"))) > max_length:
+        raise ValueError(f"Event pattern is longer than {max_length} characters")
+
+    _validate_object(loaded, "")
+    return loaded
+
+
+def _validate_object(pattern: dict, path: str):
+    for key, expected in pattern.items():
+        key_path = f"{path}.{key}" if path else key
+        if key == "$or":
+            if not isinstance(expected, list) or len(expected) < 2 or not all(isinstance(item, dict) and item for item in expected):
+                raise ValueError(f"Event pattern {key_path} must be an array of at least two non empty objects")
+            for item in expected:
+                _validate_object(item, path)
+        elif isinstance(expected, dict):
+            if not expected:
+                raise ValueError(f"Event pattern {key_path} must not be an empty object")
+            _validate_object(expected, key_path)
+        elif isinstance(expected, list):
+            if not expected:
+                raise ValueError(f"Event pattern {key_path} must not be an empty array")
+            for rule in expected:
+                if isinstance(rule, dict):
+                    _validate_filter(rule, key_path)
+                elif isinstance(rule, list):
+                    raise ValueError(f"Event pattern {key_path} can not contain nested arrays")
+        else:
+            raise ValueError(f"Event pattern {key_path} must be an array or an object, got {json.dumps(expected)}")
+
+
+def _validate_filter(rule: dict, path: str):
+    if len(rule) != 1:
+        raise ValueError(f"Event pattern {path} filters must have exactly one operator: {json.dumps(rule)}")
+    (operator, operand), = rule.items()
+
+    if operator == "exists":
+        if not isinstance(operand, bool):
+            raise ValueError(f"Event pattern {path} exists must be true or false")
+    elif operator in ("prefix", "suffix"):
+        if isinstance(operand, dict):
+            if list(operand) != ["equals-ignore-case"] or not isinstance(operand["equals-ignore-case"], str):
+                raise ValueError(f"Event pattern {path} {operator} only supports a string or equals-ignore-case")
+        elif not isinstance(operand, str):
+            raise ValueError(f"Event pattern {path} {operator} must be a string")
+    elif operator == "equals-ignore-case":
+        if not isinstance(operand, str):
+            raise ValueError(f"Event pattern {path} equals-ignore-case must be a string")
+    elif operator == "wildcard":
+        if not isinstance(operand, str):
+            raise ValueError(f"Event pattern {path} wildcard must be a string")
+        if "**" in operand:
+            raise ValueError(f"Event pattern {path} wildcard can not have consecutive wildcard characters")
+    elif operator == "cidr":
+        try:
+            ipaddress.ip_network(operand, strict=False)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Event pattern {path} cidr must be an IPv4 or IPv6 CIDR block: {error}") from error
+    elif operator == "anything-but":
+        if isinstance(operand, dict):
+            if list(operand) not in (["prefix"], ["suffix"], ["equals-ignore-case"], ["wildcard"]):
+                raise ValueError(f"Event pattern {path} anything-but only supports prefix, suffix, equals-ignore-case or wildcard filters")
+            _validate_filter(operand, path)
+        elif isinstance(operand, list):
+            if not operand or any(isinstance(item, (dict, list)) for item in operand):
+                raise ValueError(f"Event pattern {path} anything-but must be a non empty array of values")
+    elif operator == "numeric":
+        if not isinstance(operand, list) or not operand or len(operand) % 2:
+            raise ValueError(f"Event pattern {path} numeric must be operator and value pairs")
+        for index in range(0, len(operand), 2):
+            if operand[index] not in NUMERIC_OPERATORS:
+                raise ValueError(f"Event pattern {path} numeric operator {operand[index]} is not supported")
+            if isinstance(operand[index + 1], bool) or not isinstance(operand[index + 1], (int, float)):
+                raise ValueError(f"Event pattern {path} numeric value {operand[index + 1]} must be a number")
+    else:
+        raise ValueError(f"Event pattern {path} filter {operator} is not supported")
+
+
+def _filters(pattern: dict, path: str = "") -> Iterator[Tuple[str, str]]:
+    """Yields the path and operator of every filter in a valid pattern, including nested ones"""
+    for key, expected in pattern.items():
+        key_path = f"{path}.{key}" if path else key
+        if key == "$or":
+            for item in expected:
+                yield from _filters(item, path)
+        elif isinstance(expected, dict):
+            yield from _filters(expected, key_path)
+        else:
+            for rule in expected:
+                while isinstance(rule, dict):
+                    (operator, operand), = rule.items()
+                    yield key_path, operator
+                    rule = operand
+
+
+def sqs_filter_patterns(filter_patterns: list, projection: Optional[dict] = None) -> list:
+    """
+    Validates the filter patterns of a SQS Event Source Mapping
+
+    Every pattern is written against the message the rule delivers, like a rule pattern, and
+    is nested under the `body` of the SQS record it is matched against.  That message is the
+    EventBridge event, or the projected message when the Event Target has a projection, in
+    which case the patterns may only use the keys of the projection.  Lambda event filtering
+    has no `wildcard` or `cidr` filters, patterns that use them are rejected.
+
+    Args:
+        filter_patterns (list): Patterns as JSON strings or dicts
+        projection (dict, optional): The projection of the Event Target that feeds the queue
+
+    Raises:
+        ValueError: If there are too many patterns or a pattern is not valid
+
+    Returns:
+        list: The SQS record patterns as dicts
+    """
+    if len(filter_patterns) > MAX_FILTER_PATTERNS:
+        raise ValueError(f"At most {MAX_FILTER_PATTERNS} filter patterns are allowed per event source, got {len(filter_patterns)}")
+
+    record_patterns = []
+    for filter_pattern in filter_patterns:
+        body_pattern = validate_pattern(filter_pattern)
+        for path, operator in _filters(body_pattern):
+            if operator in SQS_UNSUPPORTED_FILTERS:
+                raise ValueError(f"Filter pattern {path} uses {operator}, which Lambda event filtering does not support")
+        if projection is not None:
+            unknown = sorted(_top_level_keys(body_pattern) - set(projection))
+            if unknown:
+                raise ValueError(f"Filter pattern keys {', '.join(unknown)} are not in the projected message, which only has {', '.join(projection)}")
+        record_pattern = {"body": body_pattern}
+        validate_pattern(record_pattern, max_length=FILTER_PATTERN_MAX_LENGTH)
+        record_patterns.append(record_pattern)
+    return record_patterns
+
+
+def _top_level_keys(pattern: dict) -> set:
+    """The event keys a pattern reads, including the ones inside `$or`"""
+    keys = set()
+    for key, expected in pattern.items():
+        if key == "$or":
+            for item in expected:
+                keys |= _top_level_keys(item)
+        else:
+            keys.add(key)
+    return keys
+
+
+def matches(pattern: Union[str, dict], event: dict) -> bool:
+    """
+    Checks if an event matches an EventBridge event pattern
+
+    https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-event-patterns.html
+
+    Args:
+        pattern (str | dict): The event pattern as a JSON string or dict
+        event (dict): The event to match against
+
+    Returns:
+        bool: True if the event matches the pattern
+    """
+    return _match_object(load_pattern(pattern), event)
+
+
+def _match_object(pattern: dict, event: Any) -> bool:
+    if not isinstance(event, dict):
+        return False
+
+    for key, expected in pattern.items():
+        if key == "$or":
+            if not any(_match_object(item, event) for item in expected):
+                return False
+            continue
+
+        present = key in event
+        value = event.get(key)
+
+        if isinstance(expected, dict):
+            if not present or not _match_object(expected, value):
+                return False
+            continue
+
+        if not any(_match_value(rule, present, value) for rule in expected):
+            return False
+
+    return True
+
+
+def _match_value(rule: Any, present: bool, value: Any) -> bool:
+    if isinstance(rule, dict):
+        return _match_filter(rule, present, value)
+
+    if not present:
+        return False
+
+    # Arrays in the event match when any of their elements match
+    if isinstance(value, list):
+        return any(_match_value(rule, True, item) for item in value)
+
+    return rule == value
+
+
+def _match_filter(rule: dict, present: bool, value: Any) -> bool:
+    (operator, operand), = rule.items()
+
+    if operator == "exists":
+        return present is bool(operand)
+
+    if not present:
+        return False
+
+    if isinstance(value, list):
+        return any(_match_filter(rule, True, item) for item in value)
+
+    if operator == "prefix":
+        if isinstance(operand, dict):
+            return isinstance(value, str) and value.lower().startswith(operand["equals-ignore-case"].lower())
+        return isinstance(value, str) and value.startswith(operand)
+
+    if operator == "suffix":
+        if isinstance(operand, dict):
+            return isinstance(value, str) and value.lower().endswith(operand["equals-ignore-case"].lower())
+        return isinstance(value, str) and value.endswith(operand)
+
+    if operator == "equals-ignore-case":
+        return isinstance(value, str) and value.lower() == operand.lower()
+
+    if operator == "wildcard":
+        return isinstance(value, str) and _wildcard_regex(operand).fullmatch(value) is not None
+
+    if operator == "cidr":
+        return _match_cidr(operand, value)
+
+    if operator == "anything-but":
+        if isinstance(operand, dict):
+            return not _match_filter(operand, True, value)
+        if isinstance(operand, list):
+            return value not in operand
+        return value != operand
+
+    if operator == "numeric":
+        return _match_numeric(operand, value)
+
+    raise ValueError(f"Unsupported pattern filter: {operator}")
+
+
+def _wildcard_regex(wildcard: str) -> re.Pattern:
+    # `*` matches any characters, `\\*` is a literal asterisk
+    parts = re.split(r"(?<!\\)\*", wildcard)
+    return re.compile(".*".join(re.escape(part.replace("\\*", "*")) for part in parts), re.DOTALL)
+
+
+def _match_cidr(cidr: str, value: Any) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        return ipaddress.ip_address(value) in ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        return False
+
+
+def _match_numeric(conditions: list, value: Any) -> bool:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+
+    for index in range(0, len(conditions), 2):
+        operator, operand = conditions[index], conditions[index + 1]
+        if not NUMERIC_OPERATORS[operator](value, operand):
+            return False
+    return True
@@ -6,12 +6,21 @@ Returns:
 # pylint: disable=line-too-long,invalid-name,too-many-arguments,too-many-locals
 
 from typing import Optional
+import json
+import re
 import sys
 import pulumi
 import pulumi_aws as aws
+import event_patterns
+import layers
+import profiler
+import projections
+from pipeline import EVENTBRIDGE_REQUEST_PARAMETERS, SQS_REQUEST_PARAMETERS
 
 
 conf = pulumi.Config()
+profiler.configure(conf)
+
 AWS_ACCOUNT_ID = (aws.get_caller_identity()).account_id
 AWS_REGION = (aws.get_region()).name
 
@@ -23,97 +32,156 @@ INSIGHTS_LAYER_X86 = f"arn:aws:lambda:{AWS_REGION}:580247275435:layer:LambdaInsi
 INSIGHTS_LAYER_ARM64 = f"arn:aws:lambda:{AWS_REGION}:580247275435:layer:LambdaInsightsExtension-Arm64:2"
 POWERTOOLS_LAYER = f"arn:aws:lambda:{AWS_REGION}:017000801446:layer:AWSLambdaPowertoolsPython:15"
 
+# Type token prefix of the component resources below
+COMPONENT_TYPE = "http-eventbridge-lambda:index"
 
-# ----------------------------------------------------------------
-# EventBridge Event Bus
-# ----------------------------------------------------------------
 
-def create_event_bus(name: str, archive_retention: Optional[int] = 7, enable_schema_discoverer: Optional[bool] = False) -> str:
+def _child_opts(parent: Optional[pulumi.Resource], *moved_from: str, renamed_from: Optional[str] = None, **kwargs) -> pulumi.ResourceOptions:
     """
-    Creates an EventBridge Event Bus
+    Resource options for a resource created inside a component
+
+    Before the components existed every resource was registered at the root of the stack or
+    under another AWS resource.  The alias keeps the old URN so existing stacks are not replaced.
 
     Args:
-        resource_name (str): A name that will be used to create the EventBridge Event Bus
+        parent (pulumi.Resource): The component the resource is created in
+        moved_from (str): The "type::name" chain of the old parent, empty when it was at the root of the stack
+        renamed_from (str, optional): The old name of the resource, when it was renamed
+        kwargs: Any other resource options
 
     Returns:
-        str: EventBridge Event Bus ARN
+        pulumi.ResourceOptions: The resource options
     """
+    if parent is None:
+        if renamed_from is not None:
+            kwargs["aliases"] = [pulumi.Alias(name=renamed_from)]
+        return pulumi.ResourceOptions(**kwargs)
+
+    if moved_from:
+        types = "$".join(old_parent.split("::")[0] for old_parent in moved_from)
+        old_parent_name = moved_from[-1].split("::")[1]
+        old_parent = f"urn:pulumi:{ENVIRONMENT}::{APP_NAME}::{types}::{old_parent_name}"
+    else:
+        old_parent = pulumi.ROOT_STACK_RESOURCE
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventbus/
-    event_bus = aws.cloudwatch.EventBus(
-        f"{name}EventBus",
-        name=f"{STACK_NAME}-bus",
-    )
+    aliases = [pulumi.Alias(parent=old_parent)]
+    if renamed_from is not None:
+        aliases.extend([pulumi.Alias(name=renamed_from), pulumi.Alias(name=renamed_from, parent=old_parent)])
+    return pulumi.ResourceOptions(parent=parent, aliases=aliases, **kwargs)
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventarchive/
-    event_archive = aws.cloudwatch.EventArchive(
-        f"{name}EventArchive",
-        name=f"archive-{STACK_NAME}",
-        event_source_arn=event_bus.arn,
-        retention_days=archive_retention,
-        opts=pulumi.ResourceOptions(
-            parent=event_bus)
-    )
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/schemas/discoverer/
-    if enable_schema_discoverer:
-        schema_discoverer = aws.schemas.Discoverer(
-            "eventBusSchemaDiscoverer",
-            source_arn=event_bus.arn,
-            description="Auto discover event schemas",
-            opts=pulumi.ResourceOptions(
-                parent=event_bus)
+# ----------------------------------------------------------------
+# EventBridge Event Bus
+# ----------------------------------------------------------------
+
+class EventBus(pulumi.ComponentResource):
+    """
+    EventBridge Event Bus with its archive, optional schema discoverer and the role the HTTP API uses to put events
+    """
+
+    def __init__(self, name: str, archive_retention: Optional[int] = 7, enable_schema_discoverer: Optional[bool] = False, opts: Optional[pulumi.ResourceOptions] = None):
+        super().__init__(f"{COMPONENT_TYPE}:EventBus", name, None, opts)
+
+        old_bus = f"aws:cloudwatch/eventBus:EventBus::{name}EventBus"
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventbus/
+        event_bus = aws.cloudwatch.EventBus(
+            f"{name}EventBus",
+            name=f"{STACK_NAME}-bus",
+            opts=_child_opts(self)
         )
-        pulumi.export("SchemaDiscoverer", schema_discoverer.arn)
 
-    api_assume_role = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
-        actions=["sts:AssumeRole"],
-        principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
-            type="Service",
-            identifiers=["apigateway.amazonaws.com"]
-        )],
-    )])
+        # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventarchive/
+        event_archive = aws.cloudwatch.EventArchive(
+            f"{name}EventArchive",
+            name=f"archive-{STACK_NAME}",
+            event_source_arn=event_bus.arn,
+            retention_days=archive_retention,
+            opts=_child_opts(self, old_bus)
+        )
 
-    bus_policy = aws.iam.get_policy_document(statements=[
-        aws.iam.GetPolicyDocumentStatementArgs(
-            sid="HttpApiToEventbridge",
-            actions=[
-                "events:PutEvents"
-            ],
-            resources=[
-                event_bus.arn
+        # https://www.pulumi.com/registry/packages/aws/api-docs/schemas/discoverer/
+        if enable_schema_discoverer:
+            schema_discoverer = aws.schemas.Discoverer(
+                "eventBusSchemaDiscoverer",
+                source_arn=event_bus.arn,
+                description="Auto discover event schemas",
+                opts=_child_opts(self, old_bus)
+            )
+            pulumi.export("SchemaDiscoverer", schema_discoverer.arn)
+
+        api_assume_role = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
+            actions=["sts:AssumeRole"],
+            principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+                type="Service",
+                identifiers=["apigateway.amazonaws.com"]
+            )],
+        )])
+
+        bus_policy = aws.iam.get_policy_document_output(statements=[
+            aws.iam.GetPolicyDocumentStatementArgs(
+                sid="HttpApiToEventbridge",
+                actions=[
+                    "events:PutEvents"
+                ],
+                resources=[
+                    event_bus.arn
+                ],
+            )]
+        )
+
+        bus_managed_policy = aws.iam.Policy(
+            f"{name}HttpToEventbridge",
+            path="/",
+            policy=bus_policy.json,
+            opts=_child_opts(self, old_bus)
+        )
+
+        api_role = aws.iam.Role(
+            "apiBusRole",
+            assume_role_policy=api_assume_role.json,
+            name=f"{STACK_NAME}-bus-api-role",
+            managed_policy_arns=[
+                bus_managed_policy
             ],
-        )]
-    )
+            opts=_child_opts(self, old_bus)
+        )
 
-    bus_managed_policy = aws.iam.Policy(
-        f"{name}HttpToEventbridge",
-        path="/",
-        policy=bus_policy.json,
-        opts=pulumi.ResourceOptions(
-            parent=event_bus)
-    )
+        self.name = event_bus.name
+        self.arn = event_bus.arn
+        self.archive_arn = event_archive.arn
+        self.api_role_arn = api_role.arn
+        self.register_outputs({
+            "name": self.name,
+            "arn": self.arn,
+            "archive_arn": self.archive_arn,
+            "api_role_arn": self.api_role_arn,
+        })
 
-    aws.iam.Role(
-        "apiBusRole",
-        assume_role_policy=api_assume_role.json,
-        name=f"{STACK_NAME}-bus-api-role",
-        managed_policy_arns=[
-            bus_managed_policy
-        ],
-        opts=pulumi.ResourceOptions(parent=event_bus)
-    )
+
+def create_event_bus(name: str, archive_retention: Optional[int] = 7, enable_schema_discoverer: Optional[bool] = False) -> EventBus:
+    """
+    Creates an EventBridge Event Bus
+
+    Args:
+        resource_name (str): A name that will be used to create the EventBridge Event Bus
+
+    Returns:
+        EventBus: The Event Bus, pass its `name` to the rules and its `api_role_arn` to `create_http_api`
+    """
+    event_bus = EventBus(name, archive_retention=archive_retention,
+                         enable_schema_discoverer=enable_schema_discoverer)
 
     pulumi.export('BusArn', event_bus.arn)
-    pulumi.export('BusArchiveArn', event_archive.arn)
-    return event_bus.name
+    pulumi.export('BusArchiveArn', event_bus.archive_arn)
+    return event_bus
 
 # ----------------------------------------------------------------
 # API DOMAIN NAME MAPPING FUNCTION
 # ----------------------------------------------------------------
 
 
-def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, stage_id, zone_id: str) -> str:
+def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, stage_id, zone_id: str, parent: Optional[pulumi.Resource] = None) -> str:
     """
         Creates an API Domain Name Mapping
 
@@ -123,6 +191,7 @@ def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, sta
         api_id (str): The API ID
         stage_id (str): The API Stage ID
         zone_id (str): The Route53 Zone ID
+        parent (pulumi.Resource, optional): The component the resources are created in
 
     Returns:
         str: API Domain Name Mapping ARN
@@ -144,6 +213,8 @@ def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, sta
 
     print("API Domain Name Mapping to be Created: " + domain_name)
 
+    old_domain_name = "aws:apigatewayv2/domainName:DomainName::api-domain-name"
+
     # https: // www.pulumi.com/registry/packages/aws/api-docs/apigateway/domainname/
     api_domain_name = aws.apigatewayv2.DomainName(
         "api-domain-name",
@@ -152,17 +223,18 @@ def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, sta
             certificate_arn=certificate_arn,
             endpoint_type="REGIONAL",
             security_policy="TLS_1_2",
-        )
+        ),
+        opts=_child_opts(parent)
     )
 
+    # The mapping and the record only need the domain name to exist, so they are created side by side
     # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/apimapping/
-    api_domain_mapping = aws.apigatewayv2.ApiMapping(
+    aws.apigatewayv2.ApiMapping(
         "httpApiDomainMapping",
         api_id=api_id,
-        domain_name=domain_name,
+        domain_name=api_domain_name.domain_name,
         stage=stage_id,
-        opts=pulumi.ResourceOptions(
-            depends_on=[api_domain_name], parent=api_domain_name)
+        opts=_child_opts(parent, old_domain_name)
     )
 
     # https://www.pulumi.com/registry/packages/aws/api-docs/route53/record/
@@ -176,8 +248,7 @@ def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, sta
             zone_id=api_domain_name.domain_name_configuration.hosted_zone_id,
             evaluate_target_health=False,
         )],
-        opts=pulumi.ResourceOptions(
-            depends_on=[api_domain_mapping], parent=api_domain_mapping)
+        opts=_child_opts(parent, old_domain_name, "aws:apigatewayv2/apiMapping:ApiMapping::httpApiDomainMapping")
     )
 
     pulumi.export(
@@ -191,6 +262,466 @@ def create_api_domain_mapping(cert_name: str, domain_name: str, api_id: str, sta
 # ----------------------------------------------------------------
 # HTTP API Gateway
 # ----------------------------------------------------------------
+
+# https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-aws-services-reference.html
+INTEGRATION_EVENTBRIDGE = "EventBridge"
+INTEGRATION_SQS = "SQS"
+INTEGRATION_LAMBDA = "Lambda"
+
+DEFAULT_DETAIL_TYPE = EVENTBRIDGE_REQUEST_PARAMETERS['DetailType']
+DEFAULT_EVENT_SOURCE = EVENTBRIDGE_REQUEST_PARAMETERS['Source']
+
+
+def sqs_queue_url(queue_arn: str) -> str:
+    """
+    Builds the SQS Queue URL from its ARN
+
+    Args:
+        queue_arn (str): The SQS Queue ARN
+
+    Returns:
+        str: SQS Queue URL
+    """
+    def to_url(arn: str) -> str:
+        _, _, _, region, account_id, queue_name = arn.split(":")
+        return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+    return pulumi.Output.from_input(queue_arn).apply(to_url)
+
+
+def create_api_sqs_role(name: str, queue_arns: list, parent: Optional[pulumi.Resource] = None) -> str:
+    """
+    Creates the IAM Role API Gateway uses to send messages to SQS Queues
+
+    Args:
+        name (str): A name that will be used to create the IAM Role
+        queue_arns (list): The SQS Queue ARNs the API may send to
+        parent (pulumi.Resource, optional): The component the resources are created in
+
+    Returns:
+        str: IAM Role ARN
+    """
+    api_assume_role = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
+        actions=["sts:AssumeRole"],
+        principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+            type="Service",
+            identifiers=["apigateway.amazonaws.com"]
+        )],
+    )])
+
+    send_message_policy = aws.iam.get_policy_document_output(statements=[
+        aws.iam.GetPolicyDocumentStatementArgs(
+            sid="HttpApiToSqs",
+            actions=[
+                "sqs:SendMessage"
+            ],
+            resources=queue_arns,
+        )]
+    )
+
+    # https://www.pulumi.com/registry/packages/aws/api-docs/iam/role/
+    api_queue_role = aws.iam.Role(
+        f"{name}ApiQueueRole",
+        name_prefix=f"role-{STACK_NAME}",
+        assume_role_policy=api_assume_role.json,
+        inline_policies=[
+            aws.iam.RoleInlinePolicyArgs(
+                name="HttpApiToSqs",
+                policy=send_message_policy.json,
+            )
+        ],
+        opts=pulumi.ResourceOptions(parent=parent)
+    )
+    return api_queue_role.arn
+
+
+def create_api_sqs_integration(resource_name: str, api_id: str, queue_arn: str, credentials_arn: str, parent: Optional[pulumi.Resource] = None, renamed_from: Optional[str] = None) -> aws.apigatewayv2.Integration:
+    """
+    Creates an API Gateway Integration that sends the request body straight to a SQS Queue
+
+    Args:
+        resource_name (str): The name of the Integration resource
+        api_id (str): The API ID
+        queue_arn (str): The SQS Queue ARN
+        credentials_arn (str): The IAM Role ARN from `create_api_sqs_role`
+        parent (pulumi.Resource, optional): The component the resources are created in
+        renamed_from (str, optional): The old name of the Integration, when it was renamed
+
+    Returns:
+        aws.apigatewayv2.Integration: The SQS-SendMessage Integration
+    """
+    # https://docs.aws.amazon.com/AWSSimpleQueueService/latest/APIReference/API_SendMessage.html
+    # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/integration/
+    return aws.apigatewayv2.Integration(
+        resource_name,
+        api_id=api_id,
+        credentials_arn=credentials_arn,
+        integration_type="AWS_PROXY",
+        integration_subtype="SQS-SendMessage",
+        payload_format_version="1.0",
+        passthrough_behavior="WHEN_NO_MATCH",
+        request_parameters={
+            'QueueUrl': sqs_queue_url(queue_arn),
+            **SQS_REQUEST_PARAMETERS,
+        },
+        opts=pulumi.ResourceOptions(parent=parent, aliases=[pulumi.Alias(name=renamed_from)] if renamed_from is not None and renamed_from != resource_name else None)
+    )
+
+
+def _route_slug(route_key: str) -> str:
+    """POST /orders/{id} -> PostOrdersId"""
+    return "".join(part.capitalize() for part in re.findall(r"[A-Za-z0-9]+", route_key))
+
+
+def _positional_resource_name(base: str, route: dict, first: bool) -> str:
+    """
+    The name a route table resource had before the names were derived from the route key
+
+    The first resource of a kind kept the base name and the others were suffixed with the route
+    they were created for, so the names changed when the routes were reordered.  It is only used
+    for the aliases that keep the resources of existing stacks.
+    """
+    return base if first else f"{base}{_route_slug(route['route'])}"
+
+
+def _integration_slug(key: tuple) -> str:
+    """
+    The part of the Integration name that is derived from its `integration_key`
+
+    ("EventBridge", "PizzaOrder", "pizza.pineapple.events") -> PizzaorderPizzaPineappleEvents,
+    ("SQS", "arn:aws:sqs:us-east-2:123456789012:orders") -> Orders
+    """
+    if key[0] == INTEGRATION_EVENTBRIDGE:
+        return _route_slug(f"{key[1]} {key[2]}")
+    return _route_slug(key[1].rsplit(":", 1)[-1])
+
+
+def _scope_list(scopes) -> list:
+    """A single scope, a list of scopes or None as a list"""
+    if scopes is None:
+        return []
+    return [scopes] if isinstance(scopes, str) else list(scopes)
+
+
+def _integration_key(route: dict) -> tuple:
+    """
+    The logical integration of a route, routes with the same key share one Integration
+
+    An ARN that is still an output can not be compared before it resolves, so routes to it
+    share an integration through their `integration_name` and get their own without one.
+    """
+    if route["target"] == INTEGRATION_EVENTBRIDGE:
+        return (INTEGRATION_EVENTBRIDGE, route["detail_type"], route["source"])
+    arn = route["queue_arn"] if route["target"] == INTEGRATION_SQS else route["function_arn"]
+    if route["integration_name"] is not None:
+        return (route["target"], route["integration_name"])
+    return (route["target"], arn if isinstance(arn, str) else route["route"])
+
+
+def build_route_table(routes: list, authorizer_type: str, authorizer_uri: str, authorizer_audience: str, authorizer_scopes: str = None) -> list:
+    """
+    Fills in the defaults of a route table and validates it
+
+    Every route is a dict with:
+        route (str): The route key, for example `POST /orders`
+        target (str): `EventBridge`, `SQS` or `Lambda`. Defaults to `EventBridge`
+        detail_type (str): The EventBridge `DetailType` for `EventBridge` targets
+        source (str): The EventBridge `Source` for `EventBridge` targets
+        queue_arn (str): The SQS Queue ARN for `SQS` targets
+        function_arn (str): The Lambda Function ARN for `Lambda` targets
+        integration_name (str): Routes to `SQS` or `Lambda` with the same name share one Integration
+        authorization (str): `JWT` or `NONE`. Defaults to the API `authorizer_type`
+        authorizer_uri (str): The JWT issuer, defaults to the API `authorizer_uri`
+        authorizer_audience (str): The JWT audience, defaults to the API `authorizer_audience`
+        scopes (list): The authorization scopes or a single scope, defaults to the API `authorizer_scopes`
+        throttle_burst (int): The route burst limit
+        throttle_rate (float): The route rate limit in requests per second
+
+    Args:
+        routes (list): The route table
+        authorizer_type (str): The default type of authorizer
+        authorizer_uri (str): The default URI of the authorizer
+        authorizer_audience (str): The default audience of the authorizer
+        authorizer_scopes (str): The default scope or scopes of the authorizer
+
+    Returns:
+        list: The route table with every key filled in, and the `integration_key` and the slugs
+            the resources of every route are named after
+    """
+    table = []
+    for route in routes:
+        entry = {
+            "target": INTEGRATION_EVENTBRIDGE,
+            "detail_type": DEFAULT_DETAIL_TYPE,
+            "source": DEFAULT_EVENT_SOURCE,
+            "queue_arn": None,
+            "function_arn": None,
+            "integration_name": None,
+            "authorization": authorizer_type or "NONE",
+            "authorizer_uri": authorizer_uri,
+            "authorizer_audience": authorizer_audience,
+            "scopes": authorizer_scopes,
+            "throttle_burst": None,
+            "throttle_rate": None,
+            **{key: value for key, value in route.items() if value is not None},
+        }
+
+        if "route" not in entry:
+            raise ValueError(f"Route is missing its route key: {route}")
+        if entry["target"] not in (INTEGRATION_EVENTBRIDGE, INTEGRATION_SQS, INTEGRATION_LAMBDA):
+            raise ValueError(f"Unsupported API integration for {entry['route']}: {entry['target']}")
+        if entry["target"] == INTEGRATION_SQS and entry["queue_arn"] is None:
+            raise ValueError(f"A queue_arn is required for the SQS integration of {entry['route']}")
+        if entry["target"] == INTEGRATION_LAMBDA and entry["function_arn"] is None:
+            raise ValueError(f"A function_arn is required for the Lambda integration of {entry['route']}")
+        if entry["authorization"] not in ("JWT", "NONE"):
+            raise ValueError(f"Unsupported authorization for {entry['route']}: {entry['authorization']}")
+        if entry["route"] in (existing["route"] for existing in table):
+            raise ValueError(f"Duplicate route: {entry['route']}")
+
+        entry["scopes"] = _scope_list(entry["scopes"])
+        entry["integration_key"] = _integration_key(entry)
+        entry["route_slug"] = _route_slug(entry["route"])
+        entry["integration_slug"] = _integration_slug(entry["integration_key"])
+
+        # The resources are named after the slugs, which have to be as unique as what they are derived from
+        for existing in table:
+            if existing["route_slug"] == entry["route_slug"]:
+                raise ValueError(f"Routes {existing['route']} and {entry['route']} have the same name {entry['route_slug']}")
+            if existing["integration_slug"] == entry["integration_slug"] and existing["integration_key"] != entry["integration_key"]:
+                raise ValueError(f"Integrations of {existing['route']} and {entry['route']} have the same name {entry['integration_slug']}")
+        table.append(entry)
+    return table
+
+
+class HttpApi(pulumi.ComponentResource):
+    """
+    API Gateway HTTP API with a route table, JWT authorizers, a stage and a custom domain name
+
+    Routes are integrated with EventBridge, SQS or Lambda.  Routes with the same integration target
+    or the same JWT issuer and audience share a single Integration or Authorizer.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            authorizer_type: str,
+            authorizer_uri: str,
+            authorizer_audience: str,
+            bus_name: str,
+            api_url: str,
+            api_path: Optional[str],
+            route53_zone_name: str,
+            certificate_name: str,
+            authorizer_scopes: str = None,
+            log_retention_days: int = 7,
+            integration: Optional[str] = INTEGRATION_EVENTBRIDGE,
+            queue_arn: Optional[str] = None,
+            routes: Optional[list] = None,
+            throttle_burst: Optional[int] = None,
+            throttle_rate: Optional[float] = None,
+            bus_role_arn: Optional[str] = None,
+            opts: Optional[pulumi.ResourceOptions] = None):
+        super().__init__(f"{COMPONENT_TYPE}:HttpApi", name, None, opts)
+
+        if routes is None:
+            routes = [{"route": api_path, "target": integration, "queue_arn": queue_arn,
+                       "throttle_burst": throttle_burst, "throttle_rate": throttle_rate}]
+        route_table = build_route_table(
+            routes, authorizer_type, authorizer_uri, authorizer_audience, authorizer_scopes)
+        if bus_role_arn is None and any(route["target"] == INTEGRATION_EVENTBRIDGE for route in route_table):
+            raise ValueError("EventBridge routes need the bus_role_arn of the EventBus, see create_event_bus")
+
+        old_api = f"aws:apigatewayv2/api:Api::{name}HttpApi"
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/api/
+        api = aws.apigatewayv2.Api(
+            f"{name}HttpApi",
+            name=f"{STACK_NAME}-api",
+            protocol_type="HTTP",
+            opts=_child_opts(self)
+        )
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/loggroup/
+        logs = aws.cloudwatch.LogGroup(
+            f"{name}HttpApiLogs",
+            name=f"/aws/http/{STACK_NAME}-api",
+            retention_in_days=log_retention_days,
+            opts=_child_opts(self, old_api)
+        )
+
+        # JWT Authorizers, one per issuer and audience, the one of the API keeps the base name
+        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/authorizer/
+        authorizers = {}
+        for route in route_table:
+            key = (route["authorizer_uri"], route["authorizer_audience"])
+            if route["authorization"] != "JWT" or key in authorizers:
+                continue
+            authorizer_name = f"{name}HttpApiAuthorizer"
+            if key != (authorizer_uri, authorizer_audience):
+                authorizer_name += _route_slug(f"{key[0]} {key[1]}")
+            old_name = _positional_resource_name(f"{name}HttpApiAuthorizer", route, not authorizers)
+            authorizers[key] = aws.apigatewayv2.Authorizer(
+                authorizer_name,
+                api_id=api.id,
+                identity_sources=[
+                    "$request.header.Authorization"],
+                authorizer_type="JWT",
+                jwt_configuration=aws.apigatewayv2.AuthorizerJwtConfigurationArgs(
+                    issuer=route["authorizer_uri"],
+                    audiences=[
+                        route["authorizer_audience"]]
+                ),
+                opts=_child_opts(self, old_api, renamed_from=old_name if old_name != authorizer_name else None)
+            )
+
+        queue_arns = {route["integration_key"]: route["queue_arn"] for route in route_table if route["target"] == INTEGRATION_SQS}
+        queue_role_arn = None
+        if queue_arns:
+            queue_role_arn = create_api_sqs_role(name, list(queue_arns.values()), parent=self)
+
+        # Integrations, one per target, named after their integration key
+        # https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-aws-services-reference.html
+        # https://docs.aws.amazon.com/eventbridge/latest/APIReference/API_PutEvents.html
+        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/integration/
+        integrations = {}
+        for route in route_table:
+            key = route["integration_key"]
+            if key in integrations:
+                continue
+            first = not any(existing[0] == key[0] for existing in integrations)
+
+            if route["target"] == INTEGRATION_SQS:
+                print(f" * API Integration for {route['route']}: SQS-SendMessage")
+                integration_name = f"{name}ApiQueueIntegration{route['integration_slug']}"
+                old_name = _positional_resource_name(f"{name}ApiQueueIntegration", route, first)
+                integrations[key] = create_api_sqs_integration(
+                    integration_name,
+                    api_id=api.id, queue_arn=route["queue_arn"], credentials_arn=queue_role_arn, parent=self,
+                    renamed_from=old_name)
+
+            elif route["target"] == INTEGRATION_LAMBDA:
+                print(f" * API Integration for {route['route']}: Lambda")
+                integration_name = f"{name}ApiLambdaIntegration{route['integration_slug']}"
+                old_name = _positional_resource_name(f"{name}ApiLambdaIntegration", route, first)
+                integrations[key] = aws.apigatewayv2.Integration(
+                    integration_name,
+                    api_id=api.id,
+                    integration_type="AWS_PROXY",
+                    integration_method="POST",
+                    integration_uri=route["function_arn"],
+                    payload_format_version="2.0",
+                    opts=pulumi.ResourceOptions(parent=self, aliases=[pulumi.Alias(name=old_name)] if old_name != integration_name else None)
+                )
+
+                # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/permission/
+                aws.lambda_.Permission(
+                    f"{integration_name}Permission",
+                    action="lambda:InvokeFunction",
+                    function=route["function_arn"],
+                    principal="apigateway.amazonaws.com",
+                    source_arn=api.execution_arn.apply(
+                        lambda arn: f"{arn}/*/*"),
+                    opts=pulumi.ResourceOptions(parent=self, aliases=[pulumi.Alias(name=f"{old_name}Permission")] if old_name != integration_name else None)
+                )
+
+            else:
+                print(f" * API Integration for {route['route']}: EventBridge-PutEvents")
+                integration_name = f"{name}ApiEventBusIntegration{route['integration_slug']}"
+                old_name = _positional_resource_name(f"{name}ApiEventBusIntegration", route, first)
+                integrations[key] = aws.apigatewayv2.Integration(
+                    integration_name,
+                    api_id=api.id,
+                    credentials_arn=bus_role_arn,
+                    integration_type="AWS_PROXY",
+                    integration_subtype="EventBridge-PutEvents",
+                    payload_format_version="1.0",
+                    passthrough_behavior="WHEN_NO_MATCH",
+                    request_parameters={
+                        'EventBusName': bus_name,
+                        **EVENTBRIDGE_REQUEST_PARAMETERS,
+                        'DetailType': route["detail_type"],
+                        'Source': route["source"]
+                    },
+                    opts=_child_opts(self, old_api, renamed_from=old_name if old_name != integration_name else None)
+                )
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/route/
+        throttled_routes = []
+        for index, route in enumerate(route_table):
+            print(f"API Path Mapping: {route['route']}")
+            if route["authorization"] == "JWT":
+                print(f" * API Scopes: {route['scopes']}" if route["scopes"] else " * No API Scopes to be Added")
+                authorizer_id = authorizers[(route["authorizer_uri"], route["authorizer_audience"])].id
+            else:
+                authorizer_id = None
+
+            route_name = f"{name}HttpApiRoute{route['route_slug']}"
+            old_name = _positional_resource_name(f"{name}HttpApiRoute", route, index == 0)
+            api_route = aws.apigatewayv2.Route(
+                route_name,
+                api_id=api.id,
+                route_key=route["route"],
+                authorization_type=route["authorization"],
+                authorizer_id=authorizer_id,
+                authorization_scopes=route["scopes"] if route["authorization"] == "JWT" else None,
+                target=integrations[route["integration_key"]].id.apply(
+                    lambda id: f"integrations/{id}"),
+                opts=_child_opts(self, old_api, renamed_from=old_name if old_name != route_name else None)
+            )
+            if route["throttle_burst"] is not None or route["throttle_rate"] is not None:
+                throttled_routes.append((route, api_route))
+
+        # Route throttles live on the stage and can only be set once the route exists
+        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/stage/
+        api_stage = aws.apigatewayv2.Stage(
+            f"{name}HttpApiStage",
+            api_id=api.id,
+            auto_deploy=True,
+            name=ENVIRONMENT,
+            access_log_settings=aws.apigatewayv2.StageAccessLogSettingsArgs(
+                destination_arn=logs.arn,
+                format='{"requestId":"$context.requestId", "ip": "$context.identity.sourceIp", "requestTime":"$context.requestTime", "httpMethod":"$context.httpMethod","routeKey":"$context.routeKey", "status":"$context.status","protocol":"$context.protocol", "responseLength":"$context.responseLength","integrationRequestId":"$context.integration.requestId","integrationStatus":"$context.integration.integrationStatus","integrationLatency":"$context.integrationLatency","integrationErrorMessage":"$context.integrationErrorMessage","errorMessageString":"$context.error.message","authorizerError":"$context.authorizer.error"}'
+            ),
+            route_settings=[
+                aws.apigatewayv2.StageRouteSettingArgs(
+                    route_key=api_route.route_key,
+                    throttling_burst_limit=route["throttle_burst"],
+                    throttling_rate_limit=route["throttle_rate"],
+                )
+                for route, api_route in throttled_routes
+            ] or None,
+            opts=_child_opts(self, old_api)
+        )
+
+        print("API Domain Name Mapping to be Created: " + api_url)
+        print(" * Checking Route53 Zone")
+
+        # Lookup Route53 Zone ID
+        try:
+            zone_lookup = aws.route53.get_zone(name=route53_zone_name)
+            print(f" * Route53 Zone Exists: {zone_lookup.name}")
+            print(f" * Route53 Zone Id: {zone_lookup.id}")
+            ZONE_ID = zone_lookup.id
+
+            pulumi.export('Route53Id', zone_lookup.id)
+            pulumi.export('Route53NsAddresses', zone_lookup.name_servers)
+        except:
+            print("Route53 Zone does not exists and NEEDS to be created before running this.")
+            sys.exit()
+
+        self.domain_name = create_api_domain_mapping(
+            cert_name=certificate_name, domain_name=api_url, api_id=api.id, stage_id=api_stage.id, zone_id=ZONE_ID, parent=self)
+
+        self.api_id = api.id
+        self.stage_id = api_stage.id
+        self.register_outputs({
+            "api_id": self.api_id,
+            "stage_id": self.stage_id,
+            "domain_name": self.domain_name,
+        })
+
+
 def create_http_api(
         name: str,
         authorizer_type: str,
@@ -198,11 +729,17 @@ def create_http_api(
         authorizer_audience: str,
         bus_name: str,
         api_url: str,
-        api_path: str,
+        api_path: Optional[str],
         route53_zone_name: str,
         certificate_name: str,
         authorizer_scopes: str = None,
-        log_retention_days: int = 7) -> str:
+        log_retention_days: int = 7,
+        integration: Optional[str] = INTEGRATION_EVENTBRIDGE,
+        queue_arn: Optional[str] = None,
+        routes: Optional[list] = None,
+        throttle_burst: Optional[int] = None,
+        throttle_rate: Optional[float] = None,
+        bus_role_arn: Optional[str] = None) -> str:
     """
     Creates an API Gateway HTTP API
 
@@ -213,129 +750,351 @@ def create_http_api(
         authorizer_audience (str): The audience of the authorizer
         bus_name (str): The name of the EventBus
         api_url (str): The URL of the API Gateway
-        api_path (str): The path of the API Gateway
+        api_path (str): The path of the API Gateway, when there is a single route
         route53_zone_name (str): The name of the Route53 Zone
         certificate_name (str): The name of the certificate to use for the domain name mapping
         authorizer_scopes (str): The scopes of the authorizer
         log_retention_days (int): The number of days to retain the logs
+        integration (str): `EventBridge` to put the request on the EventBus or `SQS` to send it straight to `queue_arn`
+        queue_arn (str): The SQS Queue ARN for the `SQS` integration
+        routes (list): A route table for an API with many routes, replaces `api_path`, `integration` and `queue_arn`. See `build_route_table`
+        throttle_burst (int): The burst limit of the `api_path` route
+        throttle_rate (float): The rate limit of the `api_path` route in requests per second
+        bus_role_arn (str): The `api_role_arn` of the EventBus, required by `EventBridge` routes
 
     Returns:
         str: API Gateway HTTP API ID
 
     """
-
-    # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/api/
-    api = aws.apigatewayv2.Api(
-        f"{name}HttpApi",
-        name=f"{STACK_NAME}-api",
-        protocol_type="HTTP"
+    http_api = HttpApi(
+        name,
+        authorizer_type=authorizer_type,
+        authorizer_uri=authorizer_uri,
+        authorizer_audience=authorizer_audience,
+        bus_name=bus_name,
+        api_url=api_url,
+        api_path=api_path,
+        route53_zone_name=route53_zone_name,
+        certificate_name=certificate_name,
+        authorizer_scopes=authorizer_scopes,
+        log_retention_days=log_retention_days,
+        integration=integration,
+        queue_arn=queue_arn,
+        routes=routes,
+        throttle_burst=throttle_burst,
+        throttle_rate=throttle_rate,
+        bus_role_arn=bus_role_arn,
     )
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/loggroup/
-    logs = aws.cloudwatch.LogGroup(
-        f"{name}HttpApiLogs",
-        name=f"/aws/http/{STACK_NAME}-api",
-        retention_in_days=log_retention_days,
-        opts=pulumi.ResourceOptions(parent=api)
+    return http_api.api_id
+
+
+# ----------------------------------------------------------------
+# Lambda Dependency Layer
+# ----------------------------------------------------------------
+
+# Dependency layers by requirements hash, shared by every function with the same dependency set
+DEPENDENCY_LAYERS = {}
+
+
+def create_dependency_layer(requirements: str, runtime: str, architecture: Optional[str] = "x86_64") -> str:
+    """
+    Creates a Lambda Layer with the packages of a requirements file
+
+    The layer is built once per requirements hash and reused by every function that asks for it.
+
+    Args:
+        requirements (str): The path of the requirements file
+        runtime (str): The runtime of the Lambda Functions using the layer
+        architecture (str): The architecture of the Lambda Functions using the layer
+
+    Returns:
+        str: Lambda Layer Version ARN
+    """
+    zip_path, lock_hash = layers.build_layer(requirements, runtime, architecture)
+    if lock_hash in DEPENDENCY_LAYERS:
+        return DEPENDENCY_LAYERS[lock_hash]
+
+    # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/layerversion/
+    layer = aws.lambda_.LayerVersion(
+        f"deps{lock_hash[:12]}Layer",
+        layer_name=f"{STACK_NAME}-deps-{lock_hash[:12]}",
+        description=f"Dependencies from {requirements}",
+        code=pulumi.FileArchive(zip_path),
+        compatible_runtimes=[runtime],
+        compatible_architectures=[architecture],
     )
 
-    if authorizer_type == "JWT":
-        if authorizer_scopes is not None:
-            print("API Scopes to be Added: " + authorizer_scopes)
-            AUTHORIZER_SCOPES = [authorizer_scopes]
-        else:
-            print("No API Scopes to be Added")
-            AUTHORIZER_SCOPES = []
+    DEPENDENCY_LAYERS[lock_hash] = layer.arn
+    pulumi.export(f"DependencyLayer{lock_hash[:12]}", layer.arn)
+    return layer.arn
 
-        # JWT Authorizer
-        # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/authorizer/
-        api_authorizer = aws.apigatewayv2.Authorizer(
-            f"{name}HttpApiAuthorizer",
-            api_id=api.id,
-            identity_sources=[
-                "$request.header.Authorization"],
-            authorizer_type="JWT",
-            jwt_configuration=aws.apigatewayv2.AuthorizerJwtConfigurationArgs(
-                issuer=authorizer_uri,
-                audiences=[
-                    authorizer_audience]
-            ),
-            opts=pulumi.ResourceOptions(
-                depends_on=[api], parent=api)
-        )
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/stage/
-    api_stage = aws.apigatewayv2.Stage(
-        f"{name}HttpApiStage",
-        api_id=api.id,
-        auto_deploy=True,
-        name=ENVIRONMENT,
-        access_log_settings=aws.apigatewayv2.StageAccessLogSettingsArgs(
-            destination_arn=logs.arn,
-            format='{"requestId":"$context.requestId", "ip": "$context.identity.sourceIp", "requestTime":"$context.requestTime", "httpMethod":"$context.httpMethod","routeKey":"$context.routeKey", "status":"$context.status","protocol":"$context.protocol", "responseLength":"$context.responseLength","integrationRequestId":"$context.integration.requestId","integrationStatus":"$context.integration.integrationStatus","integrationLatency":"$context.integrationLatency","integrationErrorMessage":"$context.integrationErrorMessage","errorMessageString":"$context.error.message","authorizerError":"$context.authorizer.error"}'
+# ----------------------------------------------------------------
+# Lambda Function
+# ----------------------------------------------------------------
+
+def build_filter_criteria(filter_patterns: Optional[list], projection: Optional[dict] = None) -> Optional[aws.lambda_.EventSourceMappingFilterCriteriaArgs]:
+    """
+    Validates the filter patterns of a SQS Event Source Mapping and builds its filter criteria
+
+    The patterns use the same syntax as the `rule_pattern` of `create_rule_and_sqs_target` and are
+    matched against the message body, the EventBridge event or its projection.  Messages that match
+    none of the patterns are deleted from the queue by the poller without invoking the function.
+
+    Args:
+        filter_patterns (list): Patterns as JSON strings or dicts
+        projection (dict, optional): The projection of the Event Target that feeds the queue
+
+    Returns:
+        EventSourceMappingFilterCriteriaArgs: The filter criteria, None without patterns
+    """
+    if not filter_patterns:
+        return None
+    return aws.lambda_.EventSourceMappingFilterCriteriaArgs(filters=[
+        aws.lambda_.EventSourceMappingFilterCriteriaFilterArgs(pattern=json.dumps(record_pattern, separators=(",", ":")))
+        for record_pattern in event_patterns.sqs_filter_patterns(filter_patterns, projection)
+    ])
+
+
+def create_idempotency_table(function_name: str, parent: Optional[pulumi.Resource] = None) -> aws.dynamodb.Table:
+    """
+    Creates the on-demand DynamoDB table that records the processed records of a Lambda Function
+
+    Args:
+        function_name (str): The name of the Lambda Function
+        parent (pulumi.Resource, optional): The component the table is created in
+
+    Returns:
+        aws.dynamodb.Table: The idempotency table
+    """
+    # https://www.pulumi.com/registry/packages/aws/api-docs/dynamodb/table/
+    return aws.dynamodb.Table(
+        f"{function_name}IdempotencyTable",
+        name=f"{STACK_NAME}-{function_name}-idempotency",
+        billing_mode="PAY_PER_REQUEST",
+        hash_key="id",
+        attributes=[aws.dynamodb.TableAttributeArgs(
+            name="id",
+            type="S",
+        )],
+        ttl=aws.dynamodb.TableTtlArgs(
+            attribute_name="expiration",
+            enabled=True,
         ),
-        opts=pulumi.ResourceOptions(
-            depends_on=[api], parent=api)
+        opts=_child_opts(parent)
     )
 
-    # https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-aws-services-reference.html
-    # https://docs.aws.amazon.com/eventbridge/latest/APIReference/API_PutEvents.html
-    # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/integration/
 
-    api_bus_integration = aws.apigatewayv2.Integration(
-        f"{name}ApiEventBusIntegration",
-        api_id=api.id,
-        credentials_arn=f"arn:aws:iam::{AWS_ACCOUNT_ID}:role/{STACK_NAME}-bus-api-role",
-        integration_type="AWS_PROXY",
-        integration_subtype="EventBridge-PutEvents",
-        payload_format_version="1.0",
-        passthrough_behavior="WHEN_NO_MATCH",
-        request_parameters={
-            'EventBusName': bus_name,
-            'Detail': '$request.body',
-            'DetailType': 'PizzaOrder',
-            'Source': 'pizza.pineapple.events'
-        },
-        opts=pulumi.ResourceOptions(
-            depends_on=[api], parent=api)
-    )
+class ConsumerFunction(pulumi.ComponentResource):
+    """
+    Lambda Function with its execution role, triggered by a SQS Queue
+    """
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/apigatewayv2/route/
-    print(f"API Path Mapping: {api_path}")
-    aws.apigatewayv2.Route(
-        f"{name}HttpApiRoute",
-        api_id=api.id,
-        route_key=api_path,
-        authorization_type="JWT",
-        authorizer_id=api_authorizer.id.apply(
-            lambda id: f"{id}"),
-        authorization_scopes=AUTHORIZER_SCOPES,
-        target=api_bus_integration.id.apply(
-            lambda id: f"integrations/{id}"),
-        opts=pulumi.ResourceOptions(
-            depends_on=[api], parent=api)
-    )
+    def __init__(
+            self,
+            function_name: str,
+            runtime: str,
+            code_source: str,
+            handler: str,
+            memory: int,
+            queue_arn: str,
+            layer_arns: Optional[str] = None,
+            x_ray: Optional[bool] = False,
+            insights: Optional[bool] = False,
+            powertools: Optional[bool] = False,
+            architecture: Optional[str] = "x86_64",
+            requirements: Optional[str] = None,
+            filter_patterns: Optional[list] = None,
+            message_projection: Optional[dict] = None,
+            idempotency: Optional[bool] = False,
+            idempotency_key: Optional[str] = "messageId",
+            idempotency_ttl: Optional[int] = 3600,
+            publish_bus_name: Optional[str] = None,
+            publish_queue_arns: Optional[list] = None,
+            timeout: Optional[int] = None,
+            batch_size: Optional[int] = None,
+            batching_window: Optional[int] = None,
+            maximum_concurrency: Optional[int] = None,
+            opts: Optional[pulumi.ResourceOptions] = None):
+        super().__init__(f"{COMPONENT_TYPE}:ConsumerFunction", function_name, None, opts)
+
+        LAMBDA_MANAGED_POLICY_ARNS = []
+
+        print("Lambda Options")
+        print(f" * Lambda Architectures: {architecture}")
+
+        # Validated before any resource is registered, so a bad pattern fails the preview
+        FILTER_CRITERIA = build_filter_criteria(filter_patterns, message_projection)
+        if FILTER_CRITERIA is not None:
+            print(f" + Filtering Messages: {len(filter_patterns)} patterns")
+
+        if layer_arns is None:
+            LAMBDA_LAYERS = []
+        else:
+            LAMBDA_LAYERS = []
+            LAMBDA_LAYER_ARNS = layer_arns.replace(' ', '').split(',')
+            LAMBDA_LAYERS.extend(LAMBDA_LAYER_ARNS)
+            print(f" + Additional Layers: {LAMBDA_LAYERS}")
+
+        if requirements is not None:
+            LAMBDA_LAYERS.append(create_dependency_layer(
+                requirements, runtime=runtime, architecture=architecture))
+            print(f" + Adding Dependency Layer: {requirements}")
+
+        if x_ray is True:
+            print(" * Enabling AWS XRay Tracing")
+            TRACING_CONFIGURATION = aws.lambda_.FunctionTracingConfigArgs(
+                mode="Active")
+            LAMBDA_MANAGED_POLICY_ARNS.append(
+                "arn:aws:iam::aws:policy/AWSXrayWriteOnlyAccess")
+            print("   + Adding AWS XRay Managed Policy")
+        else:
+            TRACING_CONFIGURATION = None
+
+        if insights is True:
+            if architecture == "arm64":
+                LAMBDA_LAYERS.append(INSIGHTS_LAYER_ARM64)
+                print(" + Adding Cloudwatch Lambda Insights Layer - arm64")
+            else:
+                LAMBDA_LAYERS.append(INSIGHTS_LAYER_X86)
+                print(" + Adding Cloudwatch Lambda Insights Layer - x86-64")
+            print("   + Adding Cloudwatch Lambda Insights Managed Policy")
+            LAMBDA_MANAGED_POLICY_ARNS.append(
+                "arn:aws:iam::aws:policy/CloudWatchLambdaInsightsExecutionRolePolicy")
+
+        if powertools is True:
+            LAMBDA_LAYERS.append(POWERTOOLS_LAYER)
+            print(" + Adding AWS Python Powertools Lambda Layer")
+
+        lambda_assume_role_trust = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
+            actions=["sts:AssumeRole"],
+            principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+                type="Service",
+                identifiers=["lambda.amazonaws.com"]
+            )],
+        )])
 
-    print("API Domain Name Mapping to be Created: " + api_url)
-    print(" * Checking Route53 Zone")
+        sqs_trigger_policy = aws.iam.get_policy_document_output(statements=[aws.iam.GetPolicyDocumentStatementArgs(
+            actions=[
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+                "sqs:ReceiveMessage"
+            ],
+            resources=[queue_arn],
+        )])
 
-    # Lookup Route53 Zone ID
-    try:
-        zone_lookup = aws.route53.get_zone(name=route53_zone_name)
-        print(f" * Route53 Zone Exists: {zone_lookup.name}")
-        print(f" * Route53 Zone Id: {zone_lookup.id}")
-        ZONE_ID = zone_lookup.id
+        LAMBDA_INLINE_POLICIES = [
+            aws.iam.RoleInlinePolicyArgs(
+                name="SqsLambdaTrigger",
+                policy=sqs_trigger_policy.json,
+            )
+        ]
+        LAMBDA_ENVIRONMENT = {
+            "ENVIRONMENT": ENVIRONMENT
+        }
+
+        if idempotency is True:
+            idempotency_table = create_idempotency_table(function_name, parent=self)
+            print(f" + Adding Idempotency Table, key: {idempotency_key}, ttl: {idempotency_ttl}s")
+            LAMBDA_INLINE_POLICIES.append(aws.iam.RoleInlinePolicyArgs(
+                name="IdempotencyTable",
+                policy=aws.iam.get_policy_document_output(statements=[aws.iam.GetPolicyDocumentStatementArgs(
+                    actions=[
+                        "dynamodb:DeleteItem",
+                        "dynamodb:GetItem",
+                        "dynamodb:PutItem",
+                    ],
+                    resources=[idempotency_table.arn],
+                )]).json,
+            ))
+            LAMBDA_ENVIRONMENT.update({
+                "IDEMPOTENCY_TABLE": idempotency_table.name,
+                "IDEMPOTENCY_KEY": idempotency_key,
+                "IDEMPOTENCY_TTL": str(idempotency_ttl),
+            })
+
+        if publish_bus_name is not None or publish_queue_arns:
+            print(" + Allowing Outbound Publishing")
+            publish_statements = []
+            if publish_bus_name is not None:
+                publish_statements.append(aws.iam.GetPolicyDocumentStatementArgs(
+                    actions=["events:PutEvents"],
+                    resources=[pulumi.Output.concat("arn:aws:events:", AWS_REGION, ":", AWS_ACCOUNT_ID, ":event-bus/", publish_bus_name)],
+                ))
+                LAMBDA_ENVIRONMENT["PUBLISH_BUS_NAME"] = publish_bus_name
+            if publish_queue_arns:
+                publish_statements.append(aws.iam.GetPolicyDocumentStatementArgs(
+                    actions=["sqs:SendMessage"],
+                    resources=publish_queue_arns,
+                ))
+                LAMBDA_ENVIRONMENT["PUBLISH_QUEUE_URLS"] = pulumi.Output.all(
+                    *[sqs_queue_url(arn) for arn in publish_queue_arns]).apply(",".join)
+            LAMBDA_INLINE_POLICIES.append(aws.iam.RoleInlinePolicyArgs(
+                name="OutboundPublishing",
+                policy=aws.iam.get_policy_document_output(statements=publish_statements).json,
+            ))
+
+        old_role = f"aws:iam/role:Role::{function_name}LambdaRole"
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/iam/role/
+        lambda_role = aws.iam.Role(
+            f"{function_name}LambdaRole",
+            name_prefix=f"role-{STACK_NAME}",
+            assume_role_policy=lambda_assume_role_trust.json,
+            inline_policies=LAMBDA_INLINE_POLICIES,
+            managed_policy_arns=LAMBDA_MANAGED_POLICY_ARNS,
+            opts=_child_opts(self, delete_before_replace=True)
+        )
 
-        pulumi.export('Route53Id', zone_lookup.id)
-        pulumi.export('Route53NsAddresses', zone_lookup.name_servers)
-    except:
-        print("Route53 Zone does not exists and NEEDS to be created before running this.")
-        sys.exit()
+        # Attach the fullaccess policy to the Lambda role created above
+        aws.iam.RolePolicyAttachment(
+            f"{function_name}LambdaRoleAttachment",
+            role=lambda_role,
+            policy_arn=aws.iam.ManagedPolicy.AWS_LAMBDA_BASIC_EXECUTION_ROLE,
+            opts=_child_opts(self, old_role)
+        )
 
-    create_api_domain_mapping(
-        cert_name=certificate_name, domain_name=api_url, api_id=api.id, stage_id=api_stage.id, zone_id=ZONE_ID)
+        # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/function/
+        lambda_function = aws.lambda_.Function(
+            f"{function_name}LambdaFunction",
+            code=pulumi.AssetArchive({
+                ".": pulumi.FileArchive(f"{code_source}"),
+            }),
+            runtime=runtime,
+            role=lambda_role.arn,
+            name=f"{STACK_NAME}-{function_name}",
+            handler=handler,
+            layers=LAMBDA_LAYERS,
+            memory_size=memory,
+            timeout=timeout,
+            tracing_config=TRACING_CONFIGURATION,
+            environment=aws.lambda_.FunctionEnvironmentArgs(
+                variables=LAMBDA_ENVIRONMENT),
+            opts=_child_opts(self)
+        )
+
+        # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/eventsourcemapping/
+        aws.lambda_.EventSourceMapping(
+            f"{function_name}LambdaSourceMapping",
+            event_source_arn=queue_arn,
+            function_name=lambda_function.arn,
+            batch_size=batch_size,
+            maximum_batching_window_in_seconds=batching_window,
+            scaling_config=aws.lambda_.EventSourceMappingScalingConfigArgs(
+                maximum_concurrency=maximum_concurrency) if maximum_concurrency is not None else None,
+            filter_criteria=FILTER_CRITERIA,
+            # Duplicates and records locked by another invocation are retried on their own
+            function_response_types=["ReportBatchItemFailures"] if idempotency is True else None,
+            opts=_child_opts(self, f"aws:lambda/function:Function::{function_name}LambdaFunction")
+        )
 
-    return api.id
+        self.arn = lambda_function.arn
+        self.role_arn = lambda_role.arn
+        self.register_outputs({
+            "arn": self.arn,
+            "role_arn": self.role_arn,
+        })
 
 
 def create_lambda_function(
@@ -349,7 +1108,19 @@ def create_lambda_function(
         x_ray: Optional[bool] = False,
         insights: Optional[bool] = False,
         powertools: Optional[bool] = False,
-        architecture: Optional[str] = "x86_64") -> str:
+        architecture: Optional[str] = "x86_64",
+        requirements: Optional[str] = None,
+        filter_patterns: Optional[list] = None,
+        message_projection: Optional[dict] = None,
+        idempotency: Optional[bool] = False,
+        idempotency_key: Optional[str] = "messageId",
+        idempotency_ttl: Optional[int] = 3600,
+        publish_bus_name: Optional[str] = None,
+        publish_queue_arns: Optional[list] = None,
+        timeout: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        batching_window: Optional[int] = None,
+        maximum_concurrency: Optional[int] = None) -> str:
     """
     Creates a Lambda Function
 
@@ -364,170 +1135,141 @@ def create_lambda_function(
         insights (bool): Enable Lambda Insights
         powertools (bool): Enable PowerTools
         architecture (str): The architecture of the Lambda Function
+        requirements (str): A requirements file whose packages are added as a shared dependency layer
+        filter_patterns (list): Event patterns a message has to match to invoke the function
+        message_projection (dict): The projection of the Event Target that feeds the queue, the filter patterns are checked against it
+        idempotency (bool): Create a DynamoDB table to skip records that were already processed
+        idempotency_key (str): JMESPath expression over the SQS record that identifies it, the body is searched as JSON
+        idempotency_ttl (int): Seconds a processed record is remembered
+        publish_bus_name (str): Event Bus the function may publish to with `PutEvents`
+        publish_queue_arns (list): SQS Queues the function may send messages to
+        timeout (int): Seconds before an invocation times out
+        batch_size (int): The most records in a batch, above 10 needs a `batching_window`
+        batching_window (int): Seconds the poller waits to fill a batch
+        maximum_concurrency (int): The most concurrent invocations the event source mapping makes
 
     Returns:
         str: Lambda Function ARN
 
     """
-    LAMBDA_MANAGED_POLICY_ARNS = []
-
-    print("Lambda Options")
-    print(f" * Lambda Architectures: {architecture}")
+    lambda_function = ConsumerFunction(
+        function_name,
+        runtime=runtime,
+        code_source=code_source,
+        handler=handler,
+        memory=memory,
+        queue_arn=queue_arn,
+        layer_arns=layer_arns,
+        x_ray=x_ray,
+        insights=insights,
+        powertools=powertools,
+        architecture=architecture,
+        requirements=requirements,
+        filter_patterns=filter_patterns,
+        message_projection=message_projection,
+        idempotency=idempotency,
+        idempotency_key=idempotency_key,
+        idempotency_ttl=idempotency_ttl,
+        publish_bus_name=publish_bus_name,
+        publish_queue_arns=publish_queue_arns,
+        timeout=timeout,
+        batch_size=batch_size,
+        batching_window=batching_window,
+        maximum_concurrency=maximum_concurrency,
+    )
 
-    if layer_arns is None:
-        LAMBDA_LAYERS = []
-    else:
-        LAMBDA_LAYERS = []
-        LAMBDA_LAYER_ARNS = layer_arns.replace(' ', '').split(',')
-        LAMBDA_LAYERS.extend(LAMBDA_LAYER_ARNS)
-        print(f" + Additional Layers: {LAMBDA_LAYERS}")
-
-    if x_ray is True:
-        print(" * Enabling AWS XRay Tracing")
-        TRACING_CONFIGURATION = aws.lambda_.FunctionTracingConfigArgs(
-            mode="Active")
-        LAMBDA_MANAGED_POLICY_ARNS.append(
-            "arn:aws:iam::aws:policy/AWSXrayWriteOnlyAccess")
-        print("   + Adding AWS XRay Managed Policy")
-    else:
-        TRACING_CONFIGURATION = None
+    pulumi.export('LambdaFunctionArn', lambda_function.arn)
+    return lambda_function.arn
 
-    if insights is True:
-        if architecture == "arm64":
-            LAMBDA_LAYERS.append(INSIGHTS_LAYER_ARM64)
-            print(" + Adding Cloudwatch Lambda Insights Layer - arm64")
-        else:
-            LAMBDA_LAYERS.append(INSIGHTS_LAYER_X86)
-            print(" + Adding Cloudwatch Lambda Insights Layer - x86-64")
-        print("   + Adding Cloudwatch Lambda Insights Managed Policy")
-        LAMBDA_MANAGED_POLICY_ARNS.append(
-            "arn:aws:iam::aws:policy/CloudWatchLambdaInsightsExecutionRolePolicy")
 
-    if powertools is True:
-        LAMBDA_LAYERS.append(POWERTOOLS_LAYER)
-        print(" + Adding AWS Python Powertools Lambda Layer")
+# ----------------------------------------------------------------
+# SQS Queue, Queue Policy and Event Rule
+# ----------------------------------------------------------------
 
-    lambda_assume_role_trust = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
-        actions=["sts:AssumeRole"],
-        principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
-            type="Service",
-            identifiers=["lambda.amazonaws.com"]
-        )],
-    )])
+class EventQueue(pulumi.ComponentResource):
+    """
+    SQS Queue that EventBridge is allowed to send to, with an optional Event Rule and Event Target feeding it
+    """
 
-    sqs_trigger_policy = aws.iam.get_policy_document(statements=[aws.iam.GetPolicyDocumentStatementArgs(
-        actions=[
-            "sqs:DeleteMessage",
-            "sqs:GetQueueAttributes",
-            "sqs:ReceiveMessage"
-        ],
-        resources=[queue_arn],
-    )])
+    def __init__(
+            self,
+            name: str,
+            bus_name: Optional[str] = None,
+            rule_pattern: Optional[str] = None,
+            enabled: Optional[bool] = True,
+            input_path: Optional[str] = None,
+            projection: Optional[dict] = None,
+            projection_samples: Optional[list] = None,
+            visibility_timeout: Optional[int] = None,
+            message_retention: Optional[int] = None,
+            opts: Optional[pulumi.ResourceOptions] = None):
+        super().__init__(f"{COMPONENT_TYPE}:EventQueue", name, None, opts)
+
+        print("SQS Queue")
+        sqs_queue = aws.sqs.Queue(
+            f"{name}Queue",
+            name=f"{STACK_NAME}-{name}-queue",
+            visibility_timeout_seconds=visibility_timeout,
+            message_retention_seconds=message_retention,
+            opts=_child_opts(self)
+        )
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/iam/role/
-    lambda_role = aws.iam.Role(
-        f"{function_name}LambdaRole",
-        name_prefix=f"role-{STACK_NAME}",
-        assume_role_policy=lambda_assume_role_trust.json,
-        inline_policies=[
-            aws.iam.RoleInlinePolicyArgs(
-                name="SqsLambdaTrigger",
-                policy=sqs_trigger_policy.json,
-            )
-        ],
-        managed_policy_arns=LAMBDA_MANAGED_POLICY_ARNS,
-        opts=pulumi.ResourceOptions(
-            delete_before_replace=True)
-    )
+        sqs_queue_policy = aws.iam.get_policy_document_output(statements=[
+            aws.iam.GetPolicyDocumentStatementArgs(
+                sid="HttpApiToSqs",
+                principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+                    type="Service",
+                    identifiers=["events.amazonaws.com"],
+                )],
+                conditions=[aws.iam.GetPolicyDocumentStatementConditionArgs(
+                    test="ArnEquals",
+                    variable="aws:SourceArn",
+                    values=[
+                        sqs_queue.arn
+                    ],
+                )]
+            )]
+        )
 
-    # Attach the fullaccess policy to the Lambda role created above
-    aws.iam.RolePolicyAttachment(
-        f"{function_name}LambdaRoleAttachment",
-        role=lambda_role,
-        policy_arn=aws.iam.ManagedPolicy.AWS_LAMBDA_BASIC_EXECUTION_ROLE,
-        opts=pulumi.ResourceOptions(
-            parent=lambda_role)
-    )
+        # https://www.pulumi.com/registry/packages/aws/api-docs/sqs/queuepolicy/
+        aws.sqs.QueuePolicy(
+            f"{name}QueuePolicy",
+            queue_url=sqs_queue.id,
+            policy=sqs_queue_policy.json,
+            opts=_child_opts(self, f"aws:sqs/queue:Queue::{name}Queue")
+        )
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/function/
-    lambda_function = aws.lambda_.Function(
-        f"{function_name}LambdaFunction",
-        code=pulumi.AssetArchive({
-            ".": pulumi.FileArchive(f"{code_source}"),
-        }),
-        runtime=runtime,
-        role=lambda_role.arn,
-        name=f"{STACK_NAME}-{function_name}",
-        handler=handler,
-        layers=LAMBDA_LAYERS,
-        memory_size=memory,
-        tracing_config=TRACING_CONFIGURATION,
-        environment=aws.lambda_.FunctionEnvironmentArgs(
-            variables={
-                "ENVIRONMENT": ENVIRONMENT
-            }),
-        opts=pulumi.ResourceOptions(
-            depends_on=[lambda_role])
-    )
+        print(f" + Name: {STACK_NAME}-{name}-queue")
 
-    # https://www.pulumi.com/registry/packages/aws/api-docs/lambda/eventsourcemapping/
-    aws.lambda_.EventSourceMapping(
-        f"{function_name}LambdaSourceMapping",
-        event_source_arn=queue_arn,
-        function_name=lambda_function.arn,
-        opts=pulumi.ResourceOptions(
-            parent=lambda_function)
-    )
+        self.arn = sqs_queue.arn
+        self.url = sqs_queue.id
+        self.rule_arn = None
+        if rule_pattern is not None:
+            self.rule_arn = create_event_rule_target(
+                name, bus_name=bus_name, rule_pattern=rule_pattern, queue_target_arn=sqs_queue.arn, enabled=enabled,
+                input_path=input_path, projection=projection, projection_samples=projection_samples, parent=self)
 
-    pulumi.export('LambdaFunctionArn', lambda_function.arn)
-    return lambda_function.arn
+        self.register_outputs({
+            "arn": self.arn,
+            "url": self.url,
+            "rule_arn": self.rule_arn,
+        })
 
 
-# ----------------------------------------------------------------
-# SQS Queue and Queue Policy
-# ----------------------------------------------------------------
-def create_sqs_queue(name: str) -> str:
+def create_sqs_queue(name: str, visibility_timeout: Optional[int] = None, message_retention: Optional[int] = None) -> str:
     """
     Creates a SQS Queue
 
     Args:
         name (str): A name that will be used to create the SQS Queue
+        visibility_timeout (int): Seconds a received message is hidden, at least six times the timeout of its function
+        message_retention (int): Seconds a message is kept
 
     Returns:
         str: SQS Queue ARN
     """
-    print("SQS Queue")
-    sqs_queue = aws.sqs.Queue(
-        f"{name}Queue",
-        name=f"{STACK_NAME}-{name}-queue",
-    )
+    sqs_queue = EventQueue(name, visibility_timeout=visibility_timeout, message_retention=message_retention)
 
-    sqs_queue_policy = aws.iam.get_policy_document(statements=[
-        aws.iam.GetPolicyDocumentStatementArgs(
-            sid="HttpApiToSqs",
-            principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
-                type="Service",
-                identifiers=["events.amazonaws.com"],
-            )],
-            conditions=[aws.iam.GetPolicyDocumentStatementConditionArgs(
-                test="ArnEquals",
-                variable="aws:SourceArn",
-                values=[
-                    sqs_queue.arn
-                ],
-            )]
-        )]
-    )
-
-    # https://www.pulumi.com/registry/packages/aws/api-docs/sqs/queuepolicy/
-    aws.sqs.QueuePolicy(
-        f"{name}QueuePolicy",
-        queue_url=sqs_queue.id,
-        policy=sqs_queue_policy.json,
-        opts=pulumi.ResourceOptions(parent=sqs_queue)
-    )
-
-    print(f" + Name: {STACK_NAME}-{name}-queue")
     pulumi.export(f"sqs{name}", sqs_queue.arn)
     return sqs_queue.arn
 
@@ -536,9 +1278,50 @@ def create_sqs_queue(name: str) -> str:
 # Event Rule and Event Target
 # ----------------------------------------------------------------
 
-def create_rule_and_sqs_target(name: str, bus_name: str, rule_pattern: str, queue_target_arn: str, enabled: Optional[bool] = True,) -> str:
+def build_input_transformer(input_path: Optional[str] = None, projection: Optional[dict] = None, projection_samples: Optional[list] = None) -> Optional[aws.cloudwatch.EventTargetInputTransformerArgs]:
     """
-    Creates a Event Rule and Event Target for a SQS Queue
+    Validates the payload slimming options of an Event Target and builds its input transformer
+
+    Args:
+        input_path (str, optional): JSON path of the part of the event that is sent, for example `$.detail`
+        projection (dict, optional): Message keys mapped to JSON paths in the event
+        projection_samples (list, optional): Sample events and discovered schemas the projection is checked against
+
+    Raises:
+        ValueError: If both are set or the projection does not match the samples
+
+    Returns:
+        EventTargetInputTransformerArgs: The input transformer, None without a projection
+    """
+    if input_path is not None and projection is not None:
+        raise ValueError("Only one of input_path and projection can be set on an Event Target")
+    if input_path is not None and not projections.PATH_PATTERN.match(input_path):
+        raise ValueError(f"Input path {input_path} must be a JSON path like $.detail")
+    if projection is None:
+        return None
+
+    if projection_samples:
+        projections.check_projection(projection, projection_samples)
+        print(f" * Projection Checked: {', '.join(projection_samples)}")
+    input_paths, input_template = projections.input_transformer(projection)
+    return aws.cloudwatch.EventTargetInputTransformerArgs(
+        input_paths=input_paths,
+        input_template=input_template,
+    )
+
+
+def create_event_rule_target(
+        name: str,
+        bus_name: str,
+        rule_pattern: str,
+        queue_target_arn: str,
+        enabled: Optional[bool] = True,
+        input_path: Optional[str] = None,
+        projection: Optional[dict] = None,
+        projection_samples: Optional[list] = None,
+        parent: Optional[pulumi.Resource] = None) -> str:
+    """
+    Creates the Event Rule and Event Target resources for a SQS Queue
 
     Args:
         name (str): A name that will be used to create the Event Rule and Event Target
@@ -546,10 +1329,16 @@ def create_rule_and_sqs_target(name: str, bus_name: str, rule_pattern: str, queu
         rule_pattern (str): Rule Pattern as a JSON string
         queue_target_arn (str): The SQS Queue ARN
         enabled (bool, optional): [description]. Defaults to True.
+        input_path (str, optional): Only send this part of the event, for example `$.detail`
+        projection (dict, optional): Only send these fields of the event, message keys mapped to JSON paths
+        projection_samples (list, optional): JSON files with sample events or discovered schemas to check the projection against
+        parent (pulumi.Resource, optional): The component the resources are created in
 
     Returns:
         str: Events Rule ARN
     """
+    event_patterns.validate_pattern(rule_pattern)
+    input_transformer = build_input_transformer(input_path, projection, projection_samples)
 
     # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventrule/
     event_rule = aws.cloudwatch.EventRule(
@@ -558,6 +1347,7 @@ def create_rule_and_sqs_target(name: str, bus_name: str, rule_pattern: str, queu
         event_bus_name=bus_name,
         is_enabled=enabled,
         event_pattern=rule_pattern,
+        opts=_child_opts(parent)
     )
 
     # https://www.pulumi.com/registry/packages/aws/api-docs/cloudwatch/eventtarget/
@@ -566,9 +1356,41 @@ def create_rule_and_sqs_target(name: str, bus_name: str, rule_pattern: str, queu
         arn=queue_target_arn,
         event_bus_name=bus_name,
         rule=event_rule.name,
-        opts=pulumi.ResourceOptions(
-            parent=event_rule)
+        input_path=input_path,
+        input_transformer=input_transformer,
+        # Without a component the target stays a child of its rule, where it has always been
+        opts=_child_opts(parent, f"aws:cloudwatch/eventRule:EventRule::{name}Rule") if parent is not None else pulumi.ResourceOptions(parent=event_rule)
     )
 
     pulumi.export(f"eventRule{name}", event_rule.arn)
     return event_rule.arn
+
+
+def create_rule_and_sqs_target(
+        name: str,
+        bus_name: str,
+        rule_pattern: str,
+        queue_target_arn: str,
+        enabled: Optional[bool] = True,
+        input_path: Optional[str] = None,
+        projection: Optional[dict] = None,
+        projection_samples: Optional[list] = None) -> str:
+    """
+    Creates a Event Rule and Event Target for a SQS Queue
+
+    Args:
+        name (str): A name that will be used to create the Event Rule and Event Target
+        bus_name (str): The EventBridge Bus Name
+        rule_pattern (str): Rule Pattern as a JSON string
+        queue_target_arn (str): The SQS Queue ARN
+        enabled (bool, optional): [description]. Defaults to True.
+        input_path (str, optional): Only send this part of the event, for example `$.detail`
+        projection (dict, optional): Only send these fields of the event, message keys mapped to JSON paths
+        projection_samples (list, optional): JSON files with sample events or discovered schemas to check the projection against
+
+    Returns:
+        str: Events Rule ARN
+    """
+    return create_event_rule_target(
+        name, bus_name=bus_name, rule_pattern=rule_pattern, queue_target_arn=queue_target_arn, enabled=enabled,
+        input_path=input_path, projection=projection, projection_samples=projection_samples)
@@ -0,0 +1,177 @@
+"""
+Lambda dependency layer builder
+
+Resolves a requirements file into a Lambda layer zip that is shared by every function
+with the same dependency set.  The zip is keyed on a hash of the normalized requirements,
+the runtime and the architecture, so it is only rebuilt when that hash changes.  That hash
+only stands for the installed packages when every requirement is pinned with `==`, so
+unpinned requirements are rejected (`pip-compile` or `pip freeze` pins the transitive ones).
+Top level test directories, caches and byte code for other Python versions are stripped to
+keep the layer small.
+"""
+# pylint: disable=line-too-long
+
+import compileall
+import hashlib
+import os
+import py_compile
+import shutil
+import re
+import subprocess
+import sys
+import tempfile
+import zipfile
+from typing import Tuple
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".layers")
+
+# https://docs.aws.amazon.com/lambda/latest/dg/python-package.html#python-package-native-libraries
+PLATFORMS = {
+    "x86_64": "manylinux2014_x86_64",
+    "arm64": "manylinux2014_aarch64",
+}
+
+# Test directories are only pruned next to the packages, inside a package they may be imported (`numpy.testing`)
+PRUNED_DIRECTORIES = {"__pycache__"}
+PRUNED_TOP_LEVEL_DIRECTORIES = {"tests", "test", "testing"}
+PRUNED_SUFFIXES = (".pyc", ".pyo", ".pyi")
+
+# Keeps the zip byte for byte identical between builds, so the layer is only replaced when the content changes
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+
+
+def read_requirements(requirements: str) -> list:
+    """
+    Reads a requirements file without comments, blank lines and ordering differences
+
+    Args:
+        requirements (str): The path of the requirements file
+
+    Raises:
+        ValueError: If a requirement is not pinned to a version with `==`
+
+    Returns:
+        list: The sorted requirement lines
+    """
+    with open(requirements, encoding="utf-8") as requirements_file:
+        lines = sorted({line for line in (line.split("#", 1)[0].strip() for line in requirements_file) if line})
+
+    unpinned = [line for line in lines if not re.search(r"===?\s*[^\s;,]+", line)]
+    if unpinned:
+        raise ValueError(f"Requirements in {requirements} must be pinned with ==, the layer hash can not see new versions of: {', '.join(unpinned)}")
+    return lines
+
+
+def requirements_hash(requirements: str, runtime: str, architecture: str = "x86_64") -> str:
+    """
+    Hashes a requirements file together with the runtime and architecture it is built for
+
+    Args:
+        requirements (str): The path of the requirements file
+        runtime (str): The Lambda runtime, for example `python3.9`
+        architecture (str): The Lambda architecture, `x86_64` or `arm64`
+
+    Returns:
+        str: The SHA256 hex digest
+    """
+    digest = hashlib.sha256()
+    for line in [runtime, architecture, *read_requirements(requirements)]:
+        digest.update(line.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def build_layer(requirements: str, runtime: str, architecture: str = "x86_64", cache_dir: str = CACHE_DIR) -> Tuple[str, str]:
+    """
+    Builds the layer zip for a requirements file, reusing the cached zip when the hash has not changed
+
+    Args:
+        requirements (str): The path of the requirements file
+        runtime (str): The Lambda runtime, for example `python3.9`
+        architecture (str): The Lambda architecture, `x86_64` or `arm64`
+        cache_dir (str): The directory the layer zips are cached in
+
+    Returns:
+        tuple: The path of the layer zip and the requirements hash
+    """
+    lock_hash = requirements_hash(requirements, runtime, architecture)
+    zip_path = os.path.join(cache_dir, f"{lock_hash}.zip")
+    if os.path.exists(zip_path):
+        print(f" * Dependency Layer Cached: {lock_hash[:12]}")
+        return zip_path, lock_hash
+
+    print(f" + Building Dependency Layer: {lock_hash[:12]}")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Every build has its own directory and the zip appears under its final name in one rename,
+    # so concurrent builds of the same layer (stacks deployed side by side) never see a partial zip
+    build_dir = tempfile.mkdtemp(prefix=f"{lock_hash[:12]}.", suffix=".build", dir=cache_dir)
+    try:
+        _install(requirements, runtime, architecture, build_dir)
+        write_zip(build_dir, f"{build_dir}.zip")
+        os.replace(f"{build_dir}.zip", zip_path)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        if os.path.exists(f"{build_dir}.zip"):
+            os.remove(f"{build_dir}.zip")
+    return zip_path, lock_hash
+
+
+def _install(requirements: str, runtime: str, architecture: str, build_dir: str):
+    """Installs, prunes and compiles the requirements into `build_dir/python`"""
+    python_version = runtime.replace("python", "")
+    site_packages = os.path.join(build_dir, "python")
+    os.makedirs(site_packages)
+
+    subprocess.run([
+        sys.executable, "-m", "pip", "install",
+        "--requirement", requirements,
+        "--target", site_packages,
+        "--platform", PLATFORMS[architecture],
+        "--implementation", "cp",
+        "--python-version", python_version,
+        "--only-binary=:all:",
+        "--no-compile",
+        "--quiet",
+    ], check=True)
+
+    prune(site_packages)
+    if python_version == f"{sys.version_info.major}.{sys.version_info.minor}":
+        # Byte code is only shipped when it matches the runtime, /opt is read only so Lambda can not cache it itself
+        compileall.compile_dir(site_packages, quiet=1, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+
+
+def prune(site_packages: str):
+    """
+    Removes top level test directories, caches and byte code from the installed packages
+
+    Args:
+        site_packages (str): The directory the packages were installed into
+    """
+    for root, directories, files in os.walk(site_packages):
+        pruned = PRUNED_DIRECTORIES | PRUNED_TOP_LEVEL_DIRECTORIES if root == site_packages else PRUNED_DIRECTORIES
+        for directory in [directory for directory in directories if directory in pruned]:
+            shutil.rmtree(os.path.join(root, directory))
+            directories.remove(directory)
+        for file_name in files:
+            if file_name.endswith(PRUNED_SUFFIXES):
+                os.remove(os.path.join(root, file_name))
+
+
+def write_zip(source_dir: str, zip_path: str):
+    """
+    Zips a directory with sorted entries and fixed timestamps
+
+    Args:
+        source_dir (str): The directory to zip, its contents are at the root of the zip
+        zip_path (str): The path of the zip to write
+    """
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as layer_zip:
+        for root, directories, files in os.walk(source_dir):
+            directories.sort()
+            for file_name in sorted(files):
+                path = os.path.join(root, file_name)
+                info = zipfile.ZipInfo(os.path.relpath(path, source_dir), date_time=ZIP_TIMESTAMP)
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as source:
+                    layer_zip.writestr(info, source.read())
@@ -0,0 +1,528 @@
+"""
+Open-loop load generator
+
+Drives the HTTP API created by `infra.create_http_api` with an open-loop arrival pattern:
+requests are sent on a schedule that does not wait for earlier responses, so a slow API
+builds a queue instead of slowing the generator down.  Latency is recorded in HDR
+histograms twice, as service time from the moment a request was sent, and as response time
+from the moment it was scheduled.  The response time is corrected for coordinated omission,
+it includes the time a request waited for the pool or the event loop.
+
+The API sits behind a JWT authorizer, so requests carry tokens minted from a local RSA
+signing key.  `--local` serves the emulated pipeline from `emulator.py` over HTTP behind an
+authorizer that trusts the key's JWKS.  For a deployed stage, export the issuer discovery
+documents with `--export-issuer`, host them at the issuer URL and point the authorizer of a
+test stack at it (`api_authorizer_uri`), or pass a token issued by the real issuer with
+`--token`.
+
+Usage:
+    python loadgen.py --local --pattern poisson --rate 200 --duration 30
+    python loadgen.py --key loadgen.pem --issuer https://issuer.example.com/ --export-issuer ./issuer
+    python loadgen.py --url https://api.example.com/event --key loadgen.pem --issuer https://issuer.example.com/ --audience urn:example:audience --pattern ramp --rate 10 --peak-rate 200 --duration 300
+"""
+# pylint: disable=line-too-long,too-many-arguments,too-many-locals,too-many-instance-attributes
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Iterator, List, Optional
+
+import aiohttp
+import jwt
+from aiohttp import web
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from hdrh.histogram import HdrHistogram
+
+from emulator import PipelineEmulator, build_pizza_pipeline
+
+
+PATTERNS = ("constant", "poisson", "ramp", "spike")
+
+# Ramps and spikes go to this multiple of the base rate unless a peak rate is given
+DEFAULT_PEAK_MULTIPLIER = 5
+# The spike runs for this part of the run, starting at SPIKE_START of the duration
+SPIKE_START = 0.4
+SPIKE_LENGTH = 0.2
+
+# Histograms track 1 microsecond to 60 seconds with 3 significant digits
+HISTOGRAM_MAX_MICROSECONDS = 60 * 1000 * 1000
+HISTOGRAM_SIGNIFICANT_DIGITS = 3
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# ----------------------------------------------------------------
+# JWT minting
+# ----------------------------------------------------------------
+
+class SigningKey:
+    """
+    RSA key that mints RS256 tokens and publishes its public half as a JWKS
+    """
+
+    def __init__(self, private_key):
+        self.private_key = private_key
+        public = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+        # RFC 7638 thumbprint, so the key id is stable for the same key
+        thumbprint = json.dumps({"e": public["e"], "kty": public["kty"], "n": public["n"]}, separators=(",", ":"), sort_keys=True)
+        self.kid = base64.urlsafe_b64encode(hashlib.sha256(thumbprint.encode("utf-8")).digest()).rstrip(b"=").decode("ascii")
+        self.jwk = {**public, "kid": self.kid, "use": "sig", "alg": "RS256"}
+
+    @classmethod
+    def generate(cls, bits: int = 2048) -> "SigningKey":
+        """Generates a new key"""
+        return cls(rsa.generate_private_key(public_exponent=65537, key_size=bits))
+
+    @classmethod
+    def load(cls, path: str) -> "SigningKey":
+        """Loads a PEM encoded private key"""
+        with open(path, "rb") as file:
+            return cls(serialization.load_pem_private_key(file.read(), password=None))
+
+    @classmethod
+    def load_or_generate(cls, path: str) -> "SigningKey":
+        """Loads the key at `path`, generating and saving it first when it does not exist"""
+        if os.path.exists(path):
+            return cls.load(path)
+        key = cls.generate()
+        key.save(path)
+        return key
+
+    def save(self, path: str):
+        """Saves the private key as PEM, readable by the owner only"""
+        pem = self.private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as file:
+            file.write(pem)
+
+    def jwks(self) -> dict:
+        """Returns the JSON Web Key Set with the public key"""
+        return {"keys": [self.jwk]}
+
+    def mint(self, issuer: str, audience: Optional[str], subject: str = "loadgen", scopes: Optional[str] = None, ttl: int = 3600) -> str:
+        """
+        Mints a token the API Gateway JWT authorizer accepts when its issuer serves this key
+
+        Args:
+            issuer (str): The `iss` claim, the `authorizer_uri` of the API
+            audience (str): The `aud` claim, the `authorizer_audience` of the API
+            subject (str): The `sub` claim
+            scopes (str): Space separated scopes, checked against `authorizer_scopes`
+            ttl (int): Seconds until the token expires
+
+        Returns:
+            str: The encoded token
+        """
+        now = int(time.time())
+        claims = {"iss": issuer, "sub": subject, "iat": now, "nbf": now, "exp": now + ttl, "jti": str(uuid.uuid4())}
+        if audience:
+            claims["aud"] = audience
+        if scopes:
+            claims["scope"] = scopes
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": self.kid})
+
+
+def discovery_document(issuer: str) -> dict:
+    """Returns the OpenID discovery document API Gateway reads to find the JWKS of an issuer"""
+    return {
+        "issuer": issuer,
+        "jwks_uri": issuer.rstrip("/") + "/.well-known/jwks.json",
+        "id_token_signing_alg_values_supported": ["RS256"],
+        "response_types_supported": ["token"],
+        "subject_types_supported": ["public"],
+    }
+
+
+def export_issuer(key: SigningKey, issuer: str, directory: str) -> List[str]:
+    """
+    Writes the discovery document and JWKS to host at the issuer URL
+
+    Args:
+        key (SigningKey): The signing key
+        issuer (str): The issuer URL the documents are hosted at
+        directory (str): The directory to write `.well-known/` to
+
+    Returns:
+        list: The written paths
+    """
+    well_known = os.path.join(directory, ".well-known")
+    os.makedirs(well_known, exist_ok=True)
+    paths = []
+    for name, document in (("openid-configuration", discovery_document(issuer)), ("jwks.json", key.jwks())):
+        path = os.path.join(well_known, name)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(document, file, indent=2)
+        paths.append(path)
+    return paths
+
+
+# ----------------------------------------------------------------
+# Local HTTP stand-in
+# ----------------------------------------------------------------
+
+class LocalHttpApi:
+    """
+    Serves the routes of a `PipelineEmulator` over HTTP behind a JWT authorizer
+
+    The authorizer checks tokens like the API Gateway JWT authorizer does, against the JWKS
+    it serves itself, so tokens minted with the same `SigningKey` are accepted.  A route that
+    has scopes needs a token with one of them, `scopes` replaces the scopes of every route.  The server
+    runs on its own thread and event loop, so it does not compete with the generator's loop.
+    """
+
+    def __init__(self, emulator: PipelineEmulator, key: SigningKey, audience: Optional[str] = None, scopes: Optional[str] = None, host: str = "127.0.0.1", port: int = 0):
+        self.emulator = emulator
+        self.key = key
+        self.audience = audience
+        self.scopes = set(scopes.split()) if scopes else set()
+        self.host = host
+        self.port = port
+        self.url = None
+        self.issuer = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def __enter__(self) -> "LocalHttpApi":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self) -> str:
+        """
+        Starts serving, returns the base URL which is also the issuer of the authorizer
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        self.url = f"http://{self.host}:{self.port}"
+        self.issuer = self.url + "/"
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(sock, ready), name="local-http-api", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        """Stops serving"""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def _serve(self, sock: socket.socket, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get("/.well-known/openid-configuration", self._discovery)
+        app.router.add_get("/.well-known/jwks.json", self._jwks)
+        for route_key in self.emulator.routes:
+            if route_key == "$default":
+                app.router.add_route("*", "/{path:.*}", self._handle)
+            else:
+                method, _, path = route_key.partition(" ")
+                app.router.add_route(method, path, self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.SockSite(self._runner, sock).start())
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _discovery(self, _request: web.Request) -> web.Response:
+        return web.json_response(discovery_document(self.issuer))
+
+    async def _jwks(self, _request: web.Request) -> web.Response:
+        return web.json_response(self.key.jwks())
+
+    def route_scopes(self, route_key: str) -> set:
+        """The scopes a token needs one of to call a route"""
+        return self.scopes or set(self.emulator.routes.get(route_key, {}).get("scopes", []))
+
+    def _authorize(self, request: web.Request, scopes: set) -> Optional[web.Response]:
+        # https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-jwt-authorizer.html
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return web.json_response({"message": "Unauthorized"}, status=401)
+        try:
+            if jwt.get_unverified_header(token).get("kid") != self.key.kid:
+                raise jwt.InvalidTokenError("Unknown kid")
+            claims = jwt.decode(
+                token, self.key.private_key.public_key(), algorithms=["RS256"], issuer=self.issuer,
+                audience=self.audience, options={"verify_aud": self.audience is not None, "require": ["exp", "iss"]})
+        except jwt.InvalidTokenError:
+            return web.json_response({"message": "Unauthorized"}, status=401)
+        granted = set(claims.get("scope", "").split()) | set(claims.get("scp", []))
+        if scopes and not scopes & granted:
+            return web.json_response({"message": "Forbidden"}, status=403)
+        return None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        route_key = f"{request.method} {request.path}"
+        if route_key not in self.emulator.routes:
+            route_key = "$default"
+        denied = self._authorize(request, self.route_scopes(route_key))
+        if denied is not None:
+            return denied
+        response = self.emulator.request(route_key, await request.text(), headers=dict(request.headers), query=dict(request.query))
+        if response == {"message": "Not Found"}:
+            return web.json_response(response, status=404)
+        if isinstance(response, dict) and "statusCode" in response:
+            # Lambda proxy integration response
+            return web.Response(status=response["statusCode"], text=response.get("body") or "", headers=response.get("headers"))
+        return web.json_response(response)
+
+
+# ----------------------------------------------------------------
+# Arrival patterns
+# ----------------------------------------------------------------
+
+def rate_at(pattern: str, offset: float, rate: float, peak_rate: float, duration: float) -> float:
+    """Returns the requests per second a pattern asks for at `offset` seconds into the run"""
+    if pattern == "ramp":
+        return rate + (peak_rate - rate) * offset / duration
+    if pattern == "spike":
+        start = duration * SPIKE_START
+        return peak_rate if start <= offset < start + duration * SPIKE_LENGTH else rate
+    return rate
+
+
+def arrivals(pattern: str, rate: float, duration: float, peak_rate: Optional[float] = None, seed: Optional[int] = None) -> Iterator[float]:
+    """
+    Yields the send times of an open-loop run, in seconds from its start
+
+    Args:
+        pattern (str): `constant`, `poisson` (exponential gaps at `rate`), `ramp` (linear from `rate` to `peak_rate`) or `spike` (`peak_rate` for part of the run)
+        rate (float): Requests per second, the starting rate of a ramp
+        duration (float): Length of the run in seconds
+        peak_rate (float): Requests per second at the end of a ramp or during a spike
+        seed (int): Seed of the Poisson gaps, for repeatable runs
+
+    Yields:
+        float: Seconds from the start of the run
+    """
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown pattern {pattern}, expected one of {', '.join(PATTERNS)}")
+    if rate <= 0 or duration <= 0:
+        raise ValueError("The rate and the duration must be positive")
+    peak_rate = peak_rate or rate * DEFAULT_PEAK_MULTIPLIER
+    if peak_rate <= 0:
+        raise ValueError("The peak rate must be positive")
+
+    rng = random.Random(seed)
+    offset = 0.0
+    while offset < duration:
+        yield offset
+        current = rate_at(pattern, offset, rate, peak_rate, duration)
+        offset += rng.expovariate(current) if pattern == "poisson" else 1 / current
+
+
+# ----------------------------------------------------------------
+# Open-loop runner
+# ----------------------------------------------------------------
+
+class LoadReport:
+    """
+    Outcome and latency histograms of a load run
+    """
+
+    def __init__(self):
+        self.service = HdrHistogram(1, HISTOGRAM_MAX_MICROSECONDS, HISTOGRAM_SIGNIFICANT_DIGITS)
+        self.response = HdrHistogram(1, HISTOGRAM_MAX_MICROSECONDS, HISTOGRAM_SIGNIFICANT_DIGITS)
+        self.statuses = Counter()
+        self.sent = 0
+        # Time between the first and the last scheduled send
+        self.scheduled_seconds = 0.0
+        self.elapsed = 0.0
+        self.max_dispatch_lag = 0.0
+
+    def record(self, status, service_seconds: float, response_seconds: float):
+        """Records a completed request, also when it failed"""
+        self.statuses[str(status)] += 1
+        self.service.record_value(min(max(1, int(service_seconds * 1e6)), HISTOGRAM_MAX_MICROSECONDS))
+        self.response.record_value(min(max(1, int(response_seconds * 1e6)), HISTOGRAM_MAX_MICROSECONDS))
+
+    @property
+    def completed(self) -> int:
+        """Requests that got a response or failed"""
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self) -> int:
+        """Requests without a 2xx response"""
+        return sum(count for status, count in self.statuses.items() if not status.startswith("2"))
+
+    @staticmethod
+    def _percentiles(histogram: HdrHistogram) -> dict:
+        latency = {f"p{percentile:g}": round(histogram.get_value_at_percentile(percentile) / 1000, 3) for percentile in PERCENTILES}
+        latency["max"] = round(histogram.get_max_value() / 1000, 3)
+        return latency
+
+    def to_dict(self) -> dict:
+        """Returns the report as a dict"""
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "offered_per_second": round((self.sent - 1) / self.scheduled_seconds, 2) if self.scheduled_seconds else 0.0,
+            "throughput_per_second": round(self.completed / self.elapsed, 2) if self.elapsed else 0.0,
+            "elapsed_seconds": round(self.elapsed, 4),
+            "max_dispatch_lag_ms": round(self.max_dispatch_lag * 1000, 3),
+            "response_time_ms": self._percentiles(self.response),
+            "service_time_ms": self._percentiles(self.service),
+            "hdr": {"response_time_us": self.response.encode().decode("ascii"), "service_time_us": self.service.encode().decode("ascii")},
+        }
+
+    def __str__(self) -> str:
+        report = self.to_dict()
+        del report["hdr"]
+        return json.dumps(report, indent=2)
+
+
+async def _send(session: aiohttp.ClientSession, pool: asyncio.Semaphore, method: str, url: str, body: str, headers: dict, scheduled: float, report: LoadReport):
+    loop = asyncio.get_running_loop()
+    async with pool:
+        # Waiting for a connection counts in the response time only
+        sent = loop.time()
+        try:
+            async with session.request(method, url, data=body, headers=headers) as response:
+                await response.read()
+                status = response.status
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except aiohttp.ClientError as error:
+            status = type(error).__name__
+        finished = loop.time()
+    report.record(status, finished - sent, finished - scheduled)
+
+
+async def run_load(url: str, schedule, bodies, tokens: Optional[list] = None, method: str = "POST", connections: int = 100, timeout: float = 10.0, headers: Optional[dict] = None) -> LoadReport:
+    """
+    Sends a request at every time of the schedule, without waiting for earlier responses
+
+    Args:
+        url (str): The full URL of the route
+        schedule (iterable): Send times in seconds from the start, see `arrivals`
+        bodies (iterable): Request bodies, one per send time
+        tokens (list): Bearer tokens, used round robin
+        method (str): The HTTP method
+        connections (int): Size of the connection pool, requests beyond it wait for a connection
+        timeout (float): Seconds on the wire before a request counts as timed out
+        headers (dict): Extra headers sent with every request
+
+    Returns:
+        LoadReport: Outcomes, service time and coordinated-omission corrected response time
+    """
+    report = LoadReport()
+    base_headers = {"Content-Type": "application/json", **(headers or {})}
+    request_headers = [{**base_headers, "Authorization": f"Bearer {token}"} for token in tokens] if tokens else [base_headers]
+
+    pool = asyncio.Semaphore(connections)
+    connector = aiohttp.TCPConnector(limit=connections, keepalive_timeout=30, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        loop = asyncio.get_running_loop()
+        pending = set()
+        start = loop.time()
+        for index, (offset, body) in enumerate(zip(schedule, bodies)):
+            scheduled = start + offset
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                report.max_dispatch_lag = max(report.max_dispatch_lag, -delay)
+            task = asyncio.create_task(_send(session, pool, method, url, body, request_headers[index % len(request_headers)], scheduled, report))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            report.sent += 1
+            report.scheduled_seconds = offset
+        if pending:
+            await asyncio.wait(pending)
+        report.elapsed = loop.time() - start
+    return report
+
+
+def pizza_bodies(detail_type: str = "NewOrder") -> Iterator[str]:
+    """Yields request bodies shaped like the orders the pizza API receives"""
+    index = 0
+    while True:
+        yield json.dumps({"source": "Pizza", "detail-type": detail_type, "order": {"id": index, "toppings": ["pineapple", "ham"]}})
+        index += 1
+
+
+def main(argv: Optional[list] = None):
+    """Runs a load test from the command line"""
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the HTTP API with JWT minting and HDR latency histograms.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Full URL of the route on a deployed stage")
+    target.add_argument("--local", action="store_true", help="Serve the emulated pipeline over HTTP and load it")
+    target.add_argument("--export-issuer", metavar="DIR", help="Write the issuer discovery documents of --key to DIR and exit")
+    parser.add_argument("--route", default="POST /event", help="Route key, its method is used for --url and its path for --local")
+    parser.add_argument("--pattern", choices=PATTERNS, default="constant", help="Arrival pattern")
+    parser.add_argument("--rate", type=float, default=50, help="Requests per second, the starting rate of a ramp")
+    parser.add_argument("--peak-rate", type=float, default=None, help=f"Requests per second at the end of a ramp or during a spike, defaults to {DEFAULT_PEAK_MULTIPLIER}x --rate")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send for")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the Poisson gaps")
+    parser.add_argument("--connections", type=int, default=100, help="Size of the connection pool")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds before a request times out")
+    parser.add_argument("--key", default=None, help="PEM signing key, generated and saved when missing, ephemeral for --local when omitted")
+    parser.add_argument("--issuer", default=None, help="The `iss` of minted tokens, the `api_authorizer_uri` of the stack")
+    parser.add_argument("--audience", default=None, help="The `aud` of minted tokens, the `api_authorizer_audience` of the stack")
+    parser.add_argument("--scopes", default=None, help="Space separated scopes of minted tokens, the scopes of the route for --local when omitted")
+    parser.add_argument("--subjects", type=int, default=10, help="Distinct `sub` claims, tokens are minted before the run")
+    parser.add_argument("--token", default=None, help="Use this token instead of minting")
+    parser.add_argument("--detail-type", default="NewOrder", help="The `detail-type` of the request bodies")
+    parser.add_argument("--json", action="store_true", help="Print the full report, including the encoded HDR histograms")
+    args = parser.parse_args(argv)
+
+    if args.export_issuer:
+        if not args.key or not args.issuer:
+            parser.error("--export-issuer needs --key and --issuer")
+        for path in export_issuer(SigningKey.load_or_generate(args.key), args.issuer, args.export_issuer):
+            print(path)
+        return
+
+    key = SigningKey.load_or_generate(args.key) if args.key else None
+    method, _, path = args.route.partition(" ")
+    ttl = int(args.duration + args.timeout) + 300
+    schedule = arrivals(args.pattern, args.rate, args.duration, args.peak_rate, args.seed)
+
+    if args.local:
+        emulator = build_pizza_pipeline(PipelineEmulator())
+        with LocalHttpApi(emulator, key or SigningKey.generate(), audience=args.audience) as api:
+            # Without --scopes the tokens get the scopes of the route, like a client registered for it
+            scopes = args.scopes or " ".join(sorted(api.route_scopes(args.route)))
+            tokens = [args.token] if args.token else [api.key.mint(api.issuer, args.audience, f"loadgen-{index}", scopes, ttl) for index in range(args.subjects)]
+            report = asyncio.run(run_load(api.url + path, schedule, pizza_bodies(args.detail_type), tokens, method, args.connections, args.timeout))
+        emulator.drain()
+        print(json.dumps({"load": report.to_dict() if args.json else json.loads(str(report)), "pipeline": emulator.report().to_dict()}, indent=2))
+        return
+
+    if args.token:
+        tokens = [args.token]
+    elif key and args.issuer:
+        tokens = [key.mint(args.issuer, args.audience, f"loadgen-{index}", args.scopes, ttl) for index in range(args.subjects)]
+    else:
+        parser.error("--url needs --token, or --key and --issuer to mint tokens")
+    report = asyncio.run(run_load(args.url, schedule, pizza_bodies(args.detail_type), tokens, method, args.connections, args.timeout))
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+The pizza pipeline definition
+
+The bus, API, queues, rules and functions of the stack, written once against the `create_*`
+helpers.  `__main__.py` passes the `infra` module to deploy them and `emulator.py` passes a
+`PipelineEmulator`, which has the same helpers, to run them locally, so the two can not drift.
+
+    define_pizza_pipeline(infra, config, capacity_config)
+"""
+# pylint: disable=line-too-long
+
+import json
+import os
+from typing import Optional
+
+import capacity
+import projections
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECTIONS_FILE = os.path.join(PROJECT_DIR, "src", "projections.json")
+
+# Stack config keys the definition reads, a missing key is None
+CONFIG_KEYS = (
+    "api_authorizer_uri",
+    "authorizer_audience",
+    "api_url",
+    "route53_zone_name",
+    "certificate_name",
+    "lambda_memory",
+    "projection_samples",
+)
+
+# The `request_parameters` of the API integrations, shared by `infra.create_http_api` and the emulator.
+# An EventBridge-PutEvents integration adds the `EventBusName` and a route can override `DetailType` and `Source`.
+# https://docs.aws.amazon.com/apigateway/latest/developerguide/http-api-develop-integrations-aws-services-reference.html
+EVENTBRIDGE_REQUEST_PARAMETERS = {
+    'Detail': '$request.body',
+    'DetailType': 'PizzaOrder',
+    'Source': 'pizza.pineapple.events'
+}
+
+# A SQS-SendMessage integration adds the `QueueUrl`
+SQS_REQUEST_PARAMETERS = {
+    'MessageBody': '$request.body',
+}
+
+
+def define_pizza_pipeline(helpers, config: Optional[dict] = None, capacity_config: Optional[dict] = None) -> dict:
+    """
+    Creates the pizza pipeline with the given helpers
+
+    Args:
+        helpers: The `infra` module, or a `PipelineEmulator`
+        config (dict, optional): Values of the `CONFIG_KEYS` stack config
+        capacity_config (dict, optional): The validated `capacity` stack config, the helper defaults apply without it
+
+    Returns:
+        dict: The bus name, queue ARNs and Lambda Function ARN
+    """
+    config = config or {}
+
+    # ----------------------------------------------------------------
+    # Create EventBridge Bus - Single Instance for Stack
+    # ----------------------------------------------------------------
+
+    event_bus = helpers.create_event_bus(
+        name="pizza-bus",
+        archive_retention=7,
+        enable_schema_discoverer=True,
+    )
+    bus_name = event_bus.name
+
+    # ----------------------------------------------------------------
+    # Create HTTP API - Single Instance for Stack
+    # ----------------------------------------------------------------
+
+    helpers.create_http_api(
+        name="pizza-api",
+        authorizer_type="JWT",
+        authorizer_uri=config.get('api_authorizer_uri'),
+        authorizer_audience=config.get('authorizer_audience'),
+        bus_name=bus_name,
+        bus_role_arn=event_bus.api_role_arn,
+        api_url=config.get('api_url'),
+        api_path="POST /event",
+        route53_zone_name=config.get('route53_zone_name'),
+        certificate_name=config.get('certificate_name'),
+        **capacity.settings(capacity_config, "routes", "POST /event"),
+    )
+
+    # ----------------------------------------------------------------
+    # SQS - Single or Mulitple Instances for Stack
+    # ----------------------------------------------------------------
+
+    new_pizza_queue = helpers.create_sqs_queue(name="NewPizza", **capacity.settings(capacity_config, "queues", "NewPizza"))
+    cancel_pizza_queue = helpers.create_sqs_queue(name="CancelPizza", **capacity.settings(capacity_config, "queues", "CancelPizza"))
+
+    # ----------------------------------------------------------------
+    # EventBridge Rules/Targets - Single or Mulitple Instances for Stack
+    # ----------------------------------------------------------------
+
+    new_pizza_pattern = json.dumps({
+        "source": ["pizza.pineapple.events"],
+        "detail": {
+            "source": ["Pizza"],
+            "detail-type": ["NewOrder"]
+        }
+    })
+    # Only the fields the consumer reads are sent to the queue, decoded by src/projection_decoder.py
+    pizza_order_projection = projections.load_projection(PROJECTIONS_FILE, "PizzaOrder")
+    helpers.create_rule_and_sqs_target(
+        name="NewPizza", bus_name=bus_name, rule_pattern=new_pizza_pattern, queue_target_arn=new_pizza_queue,
+        projection=pizza_order_projection,
+        projection_samples=config.get("projection_samples"))
+
+    cancel_pizza_pattern = json.dumps({
+        "source": ["pizza.pineapple.events"],
+        "detail": {
+            "source": ["Pizza"],
+            "detail-type": ["CancelOrder"]
+        }
+    })
+    helpers.create_rule_and_sqs_target(
+        name="CancelPizza", bus_name=bus_name, rule_pattern=cancel_pizza_pattern, queue_target_arn=cancel_pizza_queue)
+
+    # ----------------------------------------------------------------
+    # Lambda - Single or Mulitple Instances for Stack
+    # ----------------------------------------------------------------
+
+    do_stuff_capacity = capacity.settings(capacity_config, "functions", "doStuff")
+    do_stuff_function = helpers.create_lambda_function(
+        function_name="doStuff",
+        runtime="python3.9",
+        code_source="./src",
+        handler="lambda_function.lambda_handler",
+        memory=do_stuff_capacity.pop("memory", config.get('lambda_memory')),
+        queue_arn=new_pizza_queue,
+        # The NewPizza rule delivers the projected message, not the EventBridge event
+        message_projection=pizza_order_projection,
+        # layer_arns=LAMBDA.get("layer_arns"),
+        requirements="./requirements-lambda.txt",
+        # The EventBridge event id is the same for every redelivery of a message
+        idempotency=True,
+        idempotency_key="body.id",
+        x_ray=True,
+        insights=True,
+        powertools=True,
+        **do_stuff_capacity,
+    )
+
+    return {
+        "bus_name": bus_name,
+        "new_pizza_queue": new_pizza_queue,
+        "cancel_pizza_queue": cancel_pizza_queue,
+        "do_stuff_function": do_stuff_function,
+    }
@@ -0,0 +1,260 @@
+"""
+Resource registration profiler
+
+Wraps resource registration and provider invokes to record when every resource was
+registered and when its registration finished, the dependency edges between resources
+and the latency of every invoke.  At the end of the program it writes a Chrome trace
+(open it in chrome://tracing or https://ui.perfetto.dev) and a critical path report.
+
+It is enabled with the `profile` stack config flag, nothing is wrapped when it is off:
+
+    pulumi config set profile true
+    pulumi config set profile_output ./profile
+"""
+# pylint: disable=line-too-long,protected-access
+
+import asyncio
+import atexit
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import pulumi
+import pulumi.resource
+import pulumi.runtime
+
+
+class _Profiler:
+    """
+    Records resource registrations and invokes for a single program run
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.origin = time.perf_counter()
+        self.resources: Dict[int, dict] = {}
+        self.invokes: List[dict] = []
+        self._register_resource = pulumi.resource.register_resource
+        self._invoke = pulumi.runtime.invoke
+        # Older SDKs have no output or async invokes
+        self._invoke_output = getattr(pulumi.runtime, "invoke_output", None)
+        self._invoke_async = getattr(pulumi.runtime, "invoke_async", None)
+
+    def now(self) -> float:
+        """Seconds since the profiler was enabled"""
+        return time.perf_counter() - self.origin
+
+    # ----------------------------------------------------------------
+    # Wrappers
+    # ----------------------------------------------------------------
+
+    def register_resource(self, res, ty, name, custom, *args, **kwargs):
+        """Wraps `pulumi.runtime.resource.register_resource`"""
+        record = {
+            "type": ty,
+            "name": name,
+            "custom": custom,
+            "urn": None,
+            "start": self.now(),
+            "end": None,
+            "depends_on": set(),
+        }
+        self.resources[id(res)] = record
+        self._register_resource(res, ty, name, custom, *args, **kwargs)
+
+        props, opts = args[2], args[3]
+        depends_on = opts.depends_on if opts is not None else None
+        dependencies = [resource for resource in (depends_on if isinstance(depends_on, list) else [depends_on]) if isinstance(resource, pulumi.Resource)]
+        if opts is not None and isinstance(opts.parent, pulumi.CustomResource):
+            dependencies.append(opts.parent)
+
+        # Wrapping the tracking in an output makes the engine wait for it before the program exits
+        pulumi.Output.from_input(asyncio.ensure_future(
+            self._track(res, record, _find_outputs(props), dependencies)))
+
+    async def _track(self, res, record: dict, outputs: list, dependencies: list):
+        for output in outputs:
+            dependencies.extend(await output.resources())
+        record["depends_on"] = {id(resource) for resource in dependencies if resource is not res}
+        record["urn"] = await res.urn.future()
+        record["end"] = self.now()
+
+    def invoke(self, tok, *args, **kwargs):
+        """Wraps `pulumi.runtime.invoke`"""
+        start = self.now()
+        try:
+            return self._invoke(tok, *args, **kwargs)
+        finally:
+            self.invokes.append({"token": tok, "start": start, "end": self.now()})
+
+    def invoke_output(self, tok, *args, **kwargs):
+        """Wraps `pulumi.runtime.invoke_output`, the invoke ends when its output resolves"""
+        record = {"token": tok, "start": self.now(), "end": None}
+        self.invokes.append(record)
+
+        def resolved(value):
+            record["end"] = self.now()
+            return value
+
+        return self._invoke_output(tok, *args, **kwargs).apply(resolved)
+
+    async def invoke_async(self, tok, *args, **kwargs):
+        """Wraps `pulumi.runtime.invoke_async`"""
+        start = self.now()
+        try:
+            return await self._invoke_async(tok, *args, **kwargs)
+        finally:
+            self.invokes.append({"token": tok, "start": start, "end": self.now()})
+
+    # ----------------------------------------------------------------
+    # Reports
+    # ----------------------------------------------------------------
+
+    def finish(self):
+        """Writes the trace and the critical path report"""
+        end = self.now()
+        for record in self.resources.values():
+            if record["end"] is None:
+                record["end"] = end
+            if record["urn"] is None:
+                record["urn"] = f"{record['type']}::{record['name']}"
+        # An output invoke that never resolved, like an unknown during a preview
+        for invoke in self.invokes:
+            if invoke["end"] is None:
+                invoke["end"] = end
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        trace_path = os.path.join(self.output_dir, "pulumi-trace.json")
+        with open(trace_path, "w", encoding="utf-8") as trace_file:
+            json.dump(self.trace(), trace_file)
+
+        report_path = os.path.join(self.output_dir, "critical-path.txt")
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            report_file.write(self.report())
+
+        print(f"Profile written to {trace_path} and {report_path}")
+
+    def trace(self) -> dict:
+        """Returns the recorded timings in the Chrome trace-event format"""
+        events = []
+        lanes: List[float] = []
+        for record in sorted(self.resources.values(), key=lambda record: record["start"]):
+            lane = next((index for index, busy_until in enumerate(lanes) if busy_until <= record["start"]), len(lanes))
+            if lane == len(lanes):
+                lanes.append(0.0)
+            lanes[lane] = record["end"]
+            events.append({
+                "name": f"{record['name']} ({record['type']})",
+                "cat": "resource" if record["custom"] else "component",
+                "ph": "X",
+                "ts": int(record["start"] * 1e6),
+                "dur": int((record["end"] - record["start"]) * 1e6),
+                "pid": 1,
+                "tid": lane + 1,
+                "args": {
+                    "urn": record["urn"],
+                    "depends_on": [self.resources[dependency]["urn"] for dependency in record["depends_on"] if dependency in self.resources],
+                },
+            })
+
+        for invoke in self.invokes:
+            events.append({
+                "name": invoke["token"],
+                "cat": "invoke",
+                "ph": "X",
+                "ts": int(invoke["start"] * 1e6),
+                "dur": int((invoke["end"] - invoke["start"]) * 1e6),
+                "pid": 2,
+                "tid": 1,
+            })
+
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "resources"}})
+        events.append({"name": "process_name", "ph": "M", "pid": 2, "args": {"name": "invokes"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def critical_path(self) -> List[dict]:
+        """
+        Returns the chain of resources that gated the last resource to finish
+
+        Starting from the resource that finished last, it repeatedly follows the dependency that finished last.
+        """
+        if not self.resources:
+            return []
+
+        chain = []
+        current = max(self.resources.values(), key=lambda record: record["end"])
+        while current is not None:
+            chain.append(current)
+            dependencies = [self.resources[dependency] for dependency in current["depends_on"] if dependency in self.resources]
+            current = max(dependencies, key=lambda record: record["end"]) if dependencies else None
+        chain.reverse()
+        return chain
+
+    def report(self) -> str:
+        """Returns the critical path report as text"""
+        lines = ["Critical Path", "-------------"]
+        for record in self.critical_path():
+            lines.append(f"{record['start']:9.3f}s  {record['end'] - record['start']:9.3f}s  {record['urn']}")
+
+        lines.extend(["", "Slowest Resources", "-----------------"])
+        for record in sorted(self.resources.values(), key=lambda record: record["start"] - record["end"])[:10]:
+            lines.append(f"{record['end'] - record['start']:9.3f}s  {record['urn']}")
+
+        totals: Dict[str, list] = {}
+        for invoke in self.invokes:
+            totals.setdefault(invoke["token"], []).append(invoke["end"] - invoke["start"])
+        lines.extend(["", "Invokes", "-------"])
+        for token, durations in sorted(totals.items(), key=lambda item: -sum(item[1])):
+            lines.append(f"{sum(durations):9.3f}s  {len(durations):4d} calls  {token}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _find_outputs(value: Any) -> list:
+    if isinstance(value, pulumi.Output):
+        return [value]
+    # A resource passed as an input, like a Policy in `managed_policy_arns`, is resolved to its ID
+    if isinstance(value, pulumi.CustomResource):
+        return [value.id]
+    if isinstance(value, dict):
+        return [output for item in value.values() for output in _find_outputs(item)]
+    if isinstance(value, (list, tuple)):
+        return [output for item in value for output in _find_outputs(item)]
+    return []
+
+
+_PROFILER: Optional[_Profiler] = None
+
+
+def enable(output_dir: str = "."):
+    """
+    Starts profiling resource registrations and invokes for the rest of the program
+
+    Args:
+        output_dir (str): The directory the trace and the report are written to
+    """
+    global _PROFILER  # pylint: disable=global-statement
+    if _PROFILER is not None:
+        return
+
+    _PROFILER = _Profiler(output_dir)
+    pulumi.resource.register_resource = _PROFILER.register_resource
+    pulumi.runtime.invoke = _PROFILER.invoke
+    if _PROFILER._invoke_output is not None:
+        pulumi.runtime.invoke_output = _PROFILER.invoke_output
+    if _PROFILER._invoke_async is not None:
+        pulumi.runtime.invoke_async = _PROFILER.invoke_async
+    atexit.register(_PROFILER.finish)
+    print(f"Profiling resource registrations to {output_dir}")
+
+
+def configure(config: pulumi.Config):
+    """
+    Enables the profiler when the `profile` flag of the stack config is set
+
+    Args:
+        config (pulumi.Config): The config of the project
+    """
+    if config.get_bool("profile"):
+        enable(output_dir=config.get("profile_output") or ".")
@@ -0,0 +1,265 @@
+"""
+EventBridge input transformer projections
+
+A projection maps the keys of a slim message to JSON paths in the EventBridge event:
+
+    {"id": "$.id", "time": "$.time", "order": "$.detail.order"}
+
+`input_transformer` turns it into the `input_paths` and `input_template` of an Event Target,
+so only those fields are written to the SQS Queue instead of the full envelope.  Before it is
+deployed the paths can be checked against sample events and against the schemas found by the
+schema discoverer, and `project` applies it locally the same way EventBridge does.
+
+The handler side decodes the projected messages with `src/projection_decoder.py`, which reads
+the same projections file.
+"""
+# pylint: disable=line-too-long
+
+import glob
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+
+# https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-transform-target-input.html
+MAX_INPUT_PATHS = 100
+
+# Keys become attributes of the decoded message, so they have to be Python identifiers
+KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+PATH_PATTERN = re.compile(r"^\$(\.[A-Za-z0-9_\-]+)*$")
+
+_MISSING = object()
+
+
+def load_projection(path: str, name: str) -> Dict[str, str]:
+    """
+    Loads a projection from a projections file
+
+    Args:
+        path (str): The path of the JSON projections file, keyed by projection name
+        name (str): The name of the projection
+
+    Returns:
+        dict: The projection
+    """
+    with open(path, encoding="utf-8") as projections_file:
+        projections = json.load(projections_file)
+    if name not in projections:
+        raise ValueError(f"Projection {name} is not defined in {path}")
+    return validate_projection(projections[name])
+
+
+def validate_projection(projection: Dict[str, str]) -> Dict[str, str]:
+    """
+    Validates the keys and JSON paths of a projection
+
+    Args:
+        projection (dict): The projection
+
+    Raises:
+        ValueError: If the projection is not valid
+
+    Returns:
+        dict: The projection
+    """
+    if not isinstance(projection, dict) or not projection:
+        raise ValueError("Projection must be a non empty JSON object")
+    if len(projection) > MAX_INPUT_PATHS:
+        raise ValueError(f"Projection has {len(projection)} keys, at most {MAX_INPUT_PATHS} are allowed")
+
+    for key, path in projection.items():
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"Projection key {key} must be a Python identifier")
+        if not isinstance(path, str) or not PATH_PATTERN.match(path):
+            raise ValueError(f"Projection path {path} of {key} must be a JSON path like $.detail.order")
+    return projection
+
+
+def input_transformer(projection: Dict[str, str]) -> Tuple[Dict[str, str], str]:
+    """
+    Builds the input paths and input template of an Event Target
+
+    Placeholders are not quoted in the template, EventBridge quotes string values itself
+    and writes objects, arrays and numbers as JSON.
+
+    Args:
+        projection (dict): The projection
+
+    Returns:
+        tuple: The input paths and the input template
+    """
+    validate_projection(projection)
+    template = ", ".join(f"{json.dumps(key)}: <{key}>" for key in projection)
+    return dict(projection), f"{{{template}}}"
+
+
+def _split_path(path: str) -> List[str]:
+    return path.split(".")[1:]
+
+
+def resolve(path: str, event: dict) -> Any:
+    """
+    Returns the value at a JSON path, or None when it does not exist
+
+    Args:
+        path (str): The JSON path
+        event (dict): The event
+
+    Returns:
+        Any: The value
+    """
+    value = _resolve(path, event)
+    return None if value is _MISSING else value
+
+
+def _resolve(path: str, event: dict) -> Any:
+    value = event
+    for segment in _split_path(path):
+        if not isinstance(value, dict) or segment not in value:
+            return _MISSING
+        value = value[segment]
+    return value
+
+
+def project(projection: Dict[str, str], event: dict) -> dict:
+    """
+    Applies a projection to an event like the Event Target input transformer
+
+    Args:
+        projection (dict): The projection
+        event (dict): The EventBridge event
+
+    Returns:
+        dict: The projected message
+    """
+    return {key: resolve(path, event) for key, path in projection.items()}
+
+
+# ----------------------------------------------------------------
+# Checks against samples and discovered schemas
+# ----------------------------------------------------------------
+
+def check_event(projection: Dict[str, str], event: dict) -> List[str]:
+    """
+    Returns the projection paths that do not exist in a sample event
+
+    Args:
+        projection (dict): The projection
+        event (dict): A sample EventBridge event
+
+    Returns:
+        list: The missing paths
+    """
+    return [path for path in projection.values() if _resolve(path, event) is _MISSING]
+
+
+def check_schema(projection: Dict[str, str], schema: dict) -> List[str]:
+    """
+    Returns the projection paths that are not declared by a discovered schema
+
+    Both the OpenAPI 3 schemas of the `discovered-schemas` registry and their JSONSchema
+    Draft 4 exports are supported.
+
+    Args:
+        projection (dict): The projection
+        schema (dict): The schema document
+
+    Returns:
+        list: The undeclared paths
+    """
+    root = schema_root(schema)
+    return [path for path in projection.values() if not _schema_declares(schema, root, _split_path(path))]
+
+
+def schema_root(schema: dict) -> dict:
+    """
+    Returns the schema of the whole EventBridge event in a discovered schema document
+
+    Args:
+        schema (dict): The OpenAPI 3 or JSONSchema Draft 4 document
+
+    Returns:
+        dict: The event schema
+    """
+    if "openapi" in schema:
+        return schema.get("components", {}).get("schemas", {}).get("AWSEvent", {})
+    return schema
+
+
+def _schema_declares(document: dict, node: dict, segments: List[str]) -> bool:
+    node = dereference(document, node)
+    if not segments:
+        return True
+
+    properties = node.get("properties", {})
+    if segments[0] in properties:
+        return _schema_declares(document, properties[segments[0]], segments[1:])
+    # Objects without declared properties can hold any key
+    return node.get("type") == "object" and "properties" not in node
+
+
+def dereference(document: dict, node: dict) -> dict:
+    """
+    Follows the local `$ref` of a schema node
+
+    Args:
+        document (dict): The schema document the references point into
+        node (dict): The schema node
+
+    Returns:
+        dict: The referenced schema node
+    """
+    while isinstance(node, dict) and "$ref" in node:
+        target = document
+        for part in node["$ref"].lstrip("#/").split("/"):
+            target = target.get(part, {})
+        node = target
+    return node
+
+
+def load_samples(patterns: List[str]) -> Tuple[List[Tuple[str, dict]], List[Tuple[str, dict]]]:
+    """
+    Loads sample events and discovered schemas from JSON files
+
+    Args:
+        patterns (list): Paths or glob patterns of the JSON files
+
+    Returns:
+        tuple: The (path, event) samples and the (path, schema) documents
+    """
+    events, schemas = [], []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            raise ValueError(f"No projection samples found for {pattern}")
+        for path in paths:
+            with open(path, encoding="utf-8") as sample_file:
+                document = json.load(sample_file)
+            if "openapi" in document or "$schema" in document:
+                schemas.append((path, document))
+            else:
+                events.append((path, document))
+    return events, schemas
+
+
+def check_projection(projection: Dict[str, str], patterns: List[str]):
+    """
+    Checks every path of a projection against sample events and discovered schemas
+
+    Args:
+        projection (dict): The projection
+        patterns (list): Paths or glob patterns of the JSON files
+
+    Raises:
+        ValueError: If a path is missing from a sample or a schema
+    """
+    validate_projection(projection)
+    events, schemas = load_samples(patterns)
+
+    problems = []
+    for path, event in events:
+        problems.extend(f"{missing} is missing from {path}" for missing in check_event(projection, event))
+    for path, schema in schemas:
+        problems.extend(f"{missing} is not declared by {path}" for missing in check_schema(projection, schema))
+    if problems:
+        raise ValueError("Projection does not match the samples: " + "; ".join(problems))
@@ -0,0 +1,187 @@
+"""
+Aggregated CloudWatch Embedded Metric Format (EMF) metrics
+
+Counters and latency histograms are accumulated in memory while a batch is processed and
+written as compact EMF documents when the invocation ends, instead of one document per record.
+A document holds one value per dimension, so there is one document per distinct set of
+dimension values (and at most 100 metrics each).  Histograms with more than 100 samples are
+reduced to 100 evenly spaced quantiles, the most values an EMF metric can hold.  The quantiles
+keep the percentiles but not the SampleCount and Sum, so every histogram also writes exact
+`<name>Count` and `<name>Sum` metrics, use those for counts, averages and totals.
+
+Dimension values are capped per dimension for the lifetime of the execution environment;
+values past the cap are reported as `other` so a bad key can not create unbounded custom
+metrics.
+
+    batch_metrics = MetricsAggregator(namespace="PineapplePizza", service="Magic")
+
+    @batch_metrics.flush_after
+    def lambda_handler(event, context):
+        batch_metrics.count("OrdersProcessed", dimensions={"size": "12"})
+        batch_metrics.timing("OrderLatency", 12.5, high_resolution=True)
+"""
+import functools
+import json
+import time
+
+
+# https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+MAX_METRICS_PER_DOCUMENT = 100
+MAX_VALUES_PER_METRIC = 100
+MAX_DIMENSIONS = 30
+
+OVERFLOW_VALUE = "other"
+
+
+class MetricsAggregator:
+    """
+    Accumulates counters and histograms per dimension set and flushes them as EMF documents
+    """
+
+    def __init__(self, namespace, service=None, max_dimension_values=25, emit=print):
+        self.namespace = namespace
+        self.default_dimensions = {"service": service} if service else {}
+        self.max_dimension_values = max_dimension_values
+        self.emit = emit
+        self.resolutions = {}
+        self._seen_values = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def _dimension_key(self, dimensions):
+        merged = dict(self.default_dimensions)
+        if dimensions:
+            merged.update(dimensions)
+        if len(merged) > MAX_DIMENSIONS:
+            raise ValueError(f"At most {MAX_DIMENSIONS} dimensions are allowed, got {len(merged)}")
+
+        bounded = []
+        for name, value in sorted(merged.items()):
+            value = str(value)
+            seen = self._seen_values.setdefault(name, set())
+            if value not in seen:
+                if len(seen) >= self.max_dimension_values:
+                    value = OVERFLOW_VALUE
+                else:
+                    seen.add(value)
+            bounded.append((name, value))
+        return tuple(bounded)
+
+    def _register(self, name, unit, high_resolution):
+        resolution = 1 if high_resolution else 60
+        registered = self.resolutions.setdefault(name, (unit, resolution))
+        if registered != (unit, resolution):
+            raise ValueError(f"Metric {name} was already recorded with unit {registered[0]} and resolution {registered[1]}")
+
+    def count(self, name, value=1, dimensions=None, unit="Count", high_resolution=False):
+        """
+        Adds to a counter, the sum for the invocation is emitted
+
+        Args:
+            name (str): The metric name
+            value (float): The amount to add
+            dimensions (dict, optional): Dimensions added to the service dimension
+            unit (str): The CloudWatch unit
+            high_resolution (bool): Store the metric with 1 second resolution
+        """
+        self._register(name, unit, high_resolution)
+        counters = self._counters.setdefault(self._dimension_key(dimensions), {})
+        counters[name] = counters.get(name, 0) + value
+
+    def timing(self, name, value, dimensions=None, unit="Milliseconds", high_resolution=False):
+        """
+        Records a sample of a histogram, the distribution, sample count and sum for the invocation are emitted
+
+        Args:
+            name (str): The metric name
+            value (float): The sample, milliseconds by default
+            dimensions (dict, optional): Dimensions added to the service dimension
+            unit (str): The CloudWatch unit
+            high_resolution (bool): Store the metric with 1 second resolution
+        """
+        self._register(name, unit, high_resolution)
+        self._register(f"{name}Count", "Count", high_resolution)
+        self._register(f"{name}Sum", unit, high_resolution)
+        self._histograms.setdefault(self._dimension_key(dimensions), {}).setdefault(name, []).append(value)
+
+    def documents(self, timestamp=None):
+        """
+        Builds the EMF documents for everything recorded since the last flush
+
+        Args:
+            timestamp (int, optional): Milliseconds since the epoch, defaults to now
+
+        Returns:
+            list: The EMF documents as dicts
+        """
+        timestamp = int(time.time() * 1000) if timestamp is None else timestamp
+        documents = []
+        for key in sorted(self._counters.keys() | self._histograms.keys()):
+            values = dict(self._counters.get(key, {}))
+            for name, samples in self._histograms.get(key, {}).items():
+                values[name] = _summarize(samples)
+                values[f"{name}Count"] = len(samples)
+                values[f"{name}Sum"] = sum(samples)
+
+            names = sorted(values)
+            for start in range(0, len(names), MAX_METRICS_PER_DOCUMENT):
+                chunk = names[start:start + MAX_METRICS_PER_DOCUMENT]
+                metrics = []
+                for name in chunk:
+                    unit, resolution = self.resolutions[name]
+                    definition = {"Name": name, "Unit": unit}
+                    if resolution == 1:
+                        definition["StorageResolution"] = 1
+                    metrics.append(definition)
+
+                document = {
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [{
+                            "Namespace": self.namespace,
+                            "Dimensions": [[dimension for dimension, _ in key]],
+                            "Metrics": metrics,
+                        }],
+                    },
+                }
+                document.update(key)
+                document.update((name, values[name]) for name in chunk)
+                documents.append(document)
+        return documents
+
+    def flush(self, timestamp=None):
+        """
+        Emits the EMF documents, one line each, and clears the counters and histograms
+
+        Args:
+            timestamp (int, optional): Milliseconds since the epoch, defaults to now
+
+        Returns:
+            list: The emitted lines
+        """
+        lines = [json.dumps(document, separators=(",", ":")) for document in self.documents(timestamp)]
+        self._counters, self._histograms = {}, {}
+        for line in lines:
+            self.emit(line)
+        return lines
+
+    def flush_after(self, handler):
+        """
+        Decorates a handler so the metrics are flushed when the invocation ends, also when it raises
+        """
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            try:
+                return handler(event, context)
+            finally:
+                self.flush()
+        return wrapper
+
+
+def _summarize(samples):
+    if len(samples) <= MAX_VALUES_PER_METRIC:
+        return samples
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    # Evenly spaced quantiles keep the percentiles of the batch within one step of the exact values
+    return [ordered[round(index * last / (MAX_VALUES_PER_METRIC - 1))] for index in range(MAX_VALUES_PER_METRIC)]
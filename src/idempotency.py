@@ -0,0 +1,290 @@
+"""
+Idempotent processing of SQS records
+
+SQS delivers at least once, so a record can reach the handler again after a retry or a redrive.
+Every record gets a key from a JMESPath expression (the `body` is searched as parsed JSON), and
+is only processed when a conditional write of that key to the idempotency table succeeds.  Keys
+that finished in this execution environment are kept in an LRU cache, so repeated deliveries
+to a warm function are skipped without a call to DynamoDB.
+
+The table, its TTL and the environment variables are created by `create_lambda_function(...,
+idempotency=True)`:
+
+    store = IdempotencyStore.from_environment()
+
+    def lambda_handler(event, context):
+        return store.process_batch(event, process_record, context)
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import jmespath  # Bundled with boto3 in the Lambda runtime
+
+
+STATUS_IN_PROGRESS = "INPROGRESS"
+STATUS_COMPLETED = "COMPLETED"
+
+# How long a key is locked while it is processed when the remaining time of the invocation is unknown
+DEFAULT_IN_PROGRESS_SECONDS = 900
+
+# A key is free when it was never written or when its record expired but TTL has not deleted it yet
+LOCK_CONDITION = "attribute_not_exists(#id) OR #expiration < :now"
+
+logger = logging.getLogger(__name__)
+
+
+def client_factory():
+    """
+    Creates the DynamoDB client, the emulator replaces it with its local stand-in
+
+    `IDEMPOTENCY_ENDPOINT_URL` points the client at DynamoDB Local.
+    """
+    import boto3  # pylint: disable=import-outside-toplevel
+    return boto3.client("dynamodb", endpoint_url=os.environ.get("IDEMPOTENCY_ENDPOINT_URL"))
+
+
+class IdempotencyInProgressError(Exception):
+    """Raised when another invocation is processing the same key"""
+
+
+class LRUCache:
+    """
+    Least recently used cache of the keys completed in this execution environment
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def get(self, key, now):
+        """Returns the cached result, None when the key is missing or expired"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < now:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item
+
+    def put(self, key, expiration, result):
+        """Caches the result of a completed key"""
+        self._items[key] = (expiration, result)
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class IdempotencyStore:
+    """
+    Deduplicates records with an in memory LRU cache in front of a conditional write to DynamoDB
+    """
+
+    def __init__(self, table_name, key_expression="messageId", ttl_seconds=3600, cache_size=1024, client=None, prefix=None):
+        self.table_name = table_name
+        self.key_expression = jmespath.compile(key_expression)
+        self.ttl_seconds = ttl_seconds
+        self.cache = LRUCache(cache_size)
+        self.prefix = prefix or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "")
+        self._client = client
+
+    @classmethod
+    def from_environment(cls, client=None):
+        """
+        Creates the store from the environment variables set by `create_lambda_function`
+
+        Returns:
+            IdempotencyStore: The store, None when the function has no idempotency table
+        """
+        table_name = os.environ.get("IDEMPOTENCY_TABLE")
+        if not table_name:
+            return None
+        return cls(
+            table_name,
+            key_expression=os.environ.get("IDEMPOTENCY_KEY", "messageId"),
+            ttl_seconds=int(os.environ.get("IDEMPOTENCY_TTL", "3600")),
+            cache_size=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1024")),
+            client=client,
+        )
+
+    @property
+    def client(self):
+        """The DynamoDB client, created on first use"""
+        if self._client is None:
+            self._client = client_factory()
+        return self._client
+
+    def key(self, record):
+        """
+        Returns the idempotency key of a record
+
+        Args:
+            record (dict): The SQS record
+
+        Returns:
+            str: The key, None when the expression does not match the record
+        """
+        body = record.get("body")
+        if isinstance(body, str):
+            try:
+                record = {**record, "body": json.loads(body)}
+            except ValueError:
+                pass
+
+        value = self.key_expression.search(record)
+        if value is None:
+            return None
+        digest = hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return f"{self.prefix}#{digest}"
+
+    def process(self, record, handler, context=None):
+        """
+        Calls the handler for a record unless the record was already processed
+
+        Args:
+            record (dict): The SQS record
+            handler (callable): Called with the record, its result is kept for duplicates
+            context (LambdaContext, optional): Used to lock the key only for the rest of the invocation
+
+        Raises:
+            IdempotencyInProgressError: If another invocation is processing the same key
+
+        Returns:
+            Any: The result of the handler, or the result of the first delivery for a duplicate
+        """
+        key, result, _ = self._run(record, handler, context)
+        if key is not None:
+            self._complete(key, result)
+        return result
+
+    def _run(self, record, handler, context):
+        """
+        Calls the handler with the key locked
+
+        Returns:
+            tuple: The key to complete, None when there is nothing to complete, the result,
+                and whether the handler ran, which it also does for a record without a key
+        """
+        key = self.key(record)
+        if key is None:
+            return None, handler(record), True
+
+        now = int(time.time())
+        cached = self.cache.get(key, now)
+        if cached is not None:
+            return None, cached[1], False
+
+        in_progress_seconds = DEFAULT_IN_PROGRESS_SECONDS
+        if context is not None:
+            in_progress_seconds = max(1, context.get_remaining_time_in_millis() // 1000 + 1)
+        if not self._lock(key, now, now + in_progress_seconds):
+            return None, self._duplicate(key, now), False
+
+        try:
+            result = handler(record)
+        except Exception:
+            # Unlock the key so the redelivery of the record is processed again
+            self._release(key)
+            raise
+        return key, result, True
+
+    def _complete(self, key, result):
+        expiration = int(time.time()) + self.ttl_seconds
+        self.client.put_item(TableName=self.table_name, Item={
+            "id": {"S": key},
+            "status": {"S": STATUS_COMPLETED},
+            "expiration": {"N": str(expiration)},
+            "result": {"S": json.dumps(result, default=str)},
+        })
+        self.cache.put(key, expiration, result)
+
+    def _release(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={"id": {"S": key}})
+
+    def _lock(self, key, now, expiration):
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "id": {"S": key},
+                    "status": {"S": STATUS_IN_PROGRESS},
+                    "expiration": {"N": str(expiration)},
+                },
+                ConditionExpression=LOCK_CONDITION,
+                ExpressionAttributeNames={"#id": "id", "#expiration": "expiration"},
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            if _error_code(error) != "ConditionalCheckFailedException":
+                raise
+            return False
+        return True
+
+    def _duplicate(self, key, now):
+        item = self.client.get_item(TableName=self.table_name, Key={"id": {"S": key}}, ConsistentRead=True).get("Item")
+        if item is None or item["status"]["S"] != STATUS_COMPLETED:
+            raise IdempotencyInProgressError(f"Record {key} is being processed by another invocation")
+
+        result = json.loads(item["result"]["S"]) if "result" in item else None
+        expiration = int(item["expiration"]["N"])
+        if expiration >= now:
+            self.cache.put(key, expiration, result)
+        return result
+
+    def process_batch(self, event, handler, context=None, flush=None):
+        """
+        Processes every record of a SQS batch and reports the failed records
+
+        The event source mapping has to report batch item failures, so only the failed or
+        in progress records are redelivered.  When the handler buffers outbound events, pass
+        the function that sends them as `flush`: the records are only marked completed after
+        it returns, and are released and reported as failed when it raises, so a redelivery
+        publishes them again instead of being skipped as a duplicate.
+
+        Args:
+            event (dict): The SQS event
+            handler (callable): Called with every record that was not processed before
+            context (LambdaContext, optional): The Lambda context
+            flush (callable, optional): Sends what the handler buffered, for example `Publisher.flush`
+
+        Returns:
+            dict: The `batchItemFailures` response
+        """
+        failures, processed = [], []
+        for record in event["Records"]:
+            try:
+                key, result, ran = self._run(record, handler, context)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Record %s failed", record["messageId"])
+                failures.append({"itemIdentifier": record["messageId"]})
+                continue
+            # A record without a key is not locked, but what it buffered is lost just the same when the flush fails
+            if ran:
+                processed.append((record, key, result))
+
+        if flush is not None:
+            try:
+                flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Publishing for %d records failed", len(processed))
+                for record, key, _ in processed:
+                    if key is not None:
+                        self._release(key)
+                    failures.append({"itemIdentifier": record["messageId"]})
+                return {"batchItemFailures": failures}
+
+        for _, key, result in processed:
+            if key is not None:
+                self._complete(key, result)
+        return {"batchItemFailures": failures}
+
+
+def _error_code(error):
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
@@ -1,9 +1,15 @@
 import os
+import time
 from loguru import logger as logs
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools import Tracer, Logger, Metrics
 from aws_lambda_powertools.utilities.data_classes import event_source, SQSEvent
 from aws_lambda_powertools.utilities import parameters
+from idempotency import IdempotencyStore
+from publisher import Publisher, warm
+from batch_metrics import MetricsAggregator
+from projection_decoder import load_decoders
+from order_models import decode_detail
 
 
 # Grabbing Environmental Variables on the Lambda Function
@@ -16,9 +22,8 @@ REGION = os.environ['AWS_REGION']
 # Inside Lambda - What is inside AWS lambda? Are there things inside there? Let's find out!
 # https://insidelambda.com/
 
-# Create boto3 Events Client
+# Outbound events and messages are sent with publisher.py, which creates its boto3 clients once
 # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/events.html
-# events = boto3.client('events')
 
 # Lambda Defined/Reserverd runtime environment variables
 # https://docs.aws.amazon.com/lambda/latest/dg/configuration-envvars.html#configuration-envvars-runtime
@@ -41,23 +46,66 @@ tracer = Tracer()  # Sets service via env var
 logger = Logger()
 metrics = Metrics(namespace="PineapplePizza", service="Magic")
 
+# Per record metrics, aggregated for the batch and flushed as one EMF document per dimension set
+batch_metrics = MetricsAggregator(namespace="PineapplePizza", service="Magic")
 
+# Skips SQS redeliveries when the function was created with idempotency=True, None otherwise
+idempotency_store = IdempotencyStore.from_environment()
+
+# The NewPizza rule slims the events to the PizzaOrder projection of projections.json,
+# its order is decoded straight into the class generated for the detail-type
+pizza_orders = load_decoders(converters={"PizzaOrder": {"order": decode_detail}})["PizzaOrder"]
+
+# Buffered PutEvents/SendMessageBatch, flushed before the invocation returns
+publisher = Publisher()
+if publisher.bus_name or os.environ.get("PUBLISH_QUEUE_URLS"):
+    warm()
+
+
+def process_record(record: dict) -> dict:
+    """
+    Processes a single SQS record, at most once per idempotency key when the store is enabled.
+
+    Returns:
+        dict: The result, kept for the redeliveries of the record
+    """
+    start = time.perf_counter()
+    message = pizza_orders.decode(record["body"])
+    logger.debug("Processing order", extra={"message_id": record["messageId"], "event_id": message.id, "order_id": message.order.order.id})
+    batch_metrics.count("RecordsProcessed")
+    # A histogram of the batch, written as quantiles with the exact ProcessingTimeCount and ProcessingTimeSum
+    batch_metrics.timing("ProcessingTime", (time.perf_counter() - start) * 1000)
+    return {"id": message.id}
 
 
 @metrics.log_metrics(capture_cold_start_metric=True)
 @logger.inject_lambda_context(log_event=True)
 @tracer.capture_lambda_handler
+@batch_metrics.flush_after
+@publisher.flush_after
 @event_source(data_class=SQSEvent)
 def lambda_handler(event: SQSEvent, context):
     """
     This function is called when an event is received by the Lambda function.
     """
 
-    correlation_id = event["requestContext"]["requestId"]
-    originating_ip = event['headers']['x-forwarded-for']
+    # Only invocations through the HTTP API carry a request context, SQS batches do not
+    request_context = event.get("requestContext") or {}
+    originating_ip = (event.get("headers") or {}).get("x-forwarded-for")
 
-    logger.append_keys(source_ip=originating_ip)
+    if originating_ip:
+        logger.append_keys(source_ip=originating_ip)
     logger.append_keys(lambda_request_id=context.aws_request_id)
-    logger.set_correlation_id(correlation_id)
+    logger.set_correlation_id(request_context.get("requestId", context.aws_request_id))
+
+    records = event.raw_event["Records"]
+    batch_metrics.count("RecordsReceived", len(records))
+
+    if idempotency_store is not None:
+        # The outbound events are sent before the records are marked completed
+        return idempotency_store.process_batch(event.raw_event, process_record, context, flush=publisher.flush)
 
-    # dosomething here
+    # Without ReportBatchItemFailures a failed record fails, and redelivers, the whole batch
+    for record in records:
+        process_record(record)
+    return None
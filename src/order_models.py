@@ -0,0 +1,262 @@
+"""
+Decoders for the CancelOrder, NewOrder events
+
+Generated by codegen.py from CancelOrder.json, NewOrder.json, do not edit.
+"""
+# pylint: disable=line-too-long,too-many-branches,too-many-instance-attributes,too-many-arguments,redefined-builtin
+
+from typing import List, Optional
+
+try:
+    from orjson import loads  # pylint: disable=no-name-in-module
+except ImportError:
+    from json import loads
+
+
+class DecodeError(ValueError):
+    """Raised when a message does not match its schema"""
+
+
+class CancelledOrder:
+    """Generated from CancelOrder.json"""
+
+    __slots__ = ("id",)
+
+    def __init__(self, id: int):
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f"CancelledOrder(id={self.id!r})"
+
+    def __eq__(self, other) -> bool:
+        return type(other) is CancelledOrder and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CancelledOrder":
+        """Validates a decoded JSON object and builds the class from it"""
+        if type(data) is not dict:
+            raise DecodeError("CancelledOrder must be an object")
+        try:
+            id = data["id"]
+        except KeyError:
+            raise DecodeError("CancelledOrder.id is required") from None
+        if type(id) is not int:
+            raise DecodeError("CancelledOrder.id must be integer")
+        return cls(id)
+
+    @classmethod
+    def decode(cls, body) -> "CancelledOrder":
+        """Decodes a JSON message body"""
+        return cls.from_dict(loads(body))
+
+    @classmethod
+    def decode_event(cls, body) -> "CancelledOrder":
+        """Decodes the detail of a JSON EventBridge event or projected message"""
+        return cls.from_dict(find_detail(loads(body)))
+
+
+class CancelOrder:
+    """Generated from CancelOrder.json"""
+
+    __slots__ = ("source", "detail_type", "order", "reason")
+
+    def __init__(self, source: str, detail_type: str, order: CancelledOrder, reason: Optional[str] = None):
+        self.source = source
+        self.detail_type = detail_type
+        self.order = order
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"CancelOrder(source={self.source!r}, detail_type={self.detail_type!r}, order={self.order!r}, reason={self.reason!r})"
+
+    def __eq__(self, other) -> bool:
+        return type(other) is CancelOrder and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CancelOrder":
+        """Validates a decoded JSON object and builds the class from it"""
+        if type(data) is not dict:
+            raise DecodeError("CancelOrder must be an object")
+        try:
+            source = data["source"]
+        except KeyError:
+            raise DecodeError("CancelOrder.source is required") from None
+        if type(source) is not str:
+            raise DecodeError("CancelOrder.source must be string")
+        try:
+            detail_type = data["detail-type"]
+        except KeyError:
+            raise DecodeError("CancelOrder.detail-type is required") from None
+        if type(detail_type) is not str:
+            raise DecodeError("CancelOrder.detail-type must be string")
+        if detail_type not in {'CancelOrder'}:
+            raise DecodeError(f"CancelOrder.detail-type must be one of CancelOrder, got {detail_type!r}")
+        try:
+            order = data["order"]
+        except KeyError:
+            raise DecodeError("CancelOrder.order is required") from None
+        order = CancelledOrder.from_dict(order)
+        reason = data.get("reason")
+        if reason is not None:
+            if type(reason) is not str:
+                raise DecodeError("CancelOrder.reason must be string")
+        return cls(source, detail_type, order, reason)
+
+    @classmethod
+    def decode(cls, body) -> "CancelOrder":
+        """Decodes a JSON message body"""
+        return cls.from_dict(loads(body))
+
+    @classmethod
+    def decode_event(cls, body) -> "CancelOrder":
+        """Decodes the detail of a JSON EventBridge event or projected message"""
+        return cls.from_dict(find_detail(loads(body)))
+
+
+class Order:
+    """Generated from NewOrder.json"""
+
+    __slots__ = ("id", "toppings", "size", "price", "delivery")
+
+    def __init__(self, id: int, toppings: List[str], size: Optional[int] = None, price: Optional[float] = None, delivery: Optional[bool] = None):
+        self.id = id
+        self.toppings = toppings
+        self.size = size
+        self.price = price
+        self.delivery = delivery
+
+    def __repr__(self) -> str:
+        return f"Order(id={self.id!r}, toppings={self.toppings!r}, size={self.size!r}, price={self.price!r}, delivery={self.delivery!r})"
+
+    def __eq__(self, other) -> bool:
+        return type(other) is Order and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Order":
+        """Validates a decoded JSON object and builds the class from it"""
+        if type(data) is not dict:
+            raise DecodeError("Order must be an object")
+        try:
+            id = data["id"]
+        except KeyError:
+            raise DecodeError("Order.id is required") from None
+        if type(id) is not int:
+            raise DecodeError("Order.id must be integer")
+        try:
+            toppings = data["toppings"]
+        except KeyError:
+            raise DecodeError("Order.toppings is required") from None
+        if type(toppings) is not list:
+            raise DecodeError("Order.toppings must be an array")
+        for item in toppings:
+            if type(item) is not str:
+                raise DecodeError("Order.toppings items must be string")
+        size = data.get("size")
+        if size is not None:
+            if type(size) is not int:
+                raise DecodeError("Order.size must be integer")
+        price = data.get("price")
+        if price is not None:
+            if type(price) is not float and type(price) is not int:
+                raise DecodeError("Order.price must be number")
+        delivery = data.get("delivery")
+        if delivery is not None:
+            if type(delivery) is not bool:
+                raise DecodeError("Order.delivery must be boolean")
+        return cls(id, toppings, size, price, delivery)
+
+    @classmethod
+    def decode(cls, body) -> "Order":
+        """Decodes a JSON message body"""
+        return cls.from_dict(loads(body))
+
+    @classmethod
+    def decode_event(cls, body) -> "Order":
+        """Decodes the detail of a JSON EventBridge event or projected message"""
+        return cls.from_dict(find_detail(loads(body)))
+
+
+class NewOrder:
+    """Generated from NewOrder.json"""
+
+    __slots__ = ("source", "detail_type", "order")
+
+    def __init__(self, source: str, detail_type: str, order: Order):
+        self.source = source
+        self.detail_type = detail_type
+        self.order = order
+
+    def __repr__(self) -> str:
+        return f"NewOrder(source={self.source!r}, detail_type={self.detail_type!r}, order={self.order!r})"
+
+    def __eq__(self, other) -> bool:
+        return type(other) is NewOrder and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NewOrder":
+        """Validates a decoded JSON object and builds the class from it"""
+        if type(data) is not dict:
+            raise DecodeError("NewOrder must be an object")
+        try:
+            source = data["source"]
+        except KeyError:
+            raise DecodeError("NewOrder.source is required") from None
+        if type(source) is not str:
+            raise DecodeError("NewOrder.source must be string")
+        try:
+            detail_type = data["detail-type"]
+        except KeyError:
+            raise DecodeError("NewOrder.detail-type is required") from None
+        if type(detail_type) is not str:
+            raise DecodeError("NewOrder.detail-type must be string")
+        if detail_type not in {'NewOrder'}:
+            raise DecodeError(f"NewOrder.detail-type must be one of NewOrder, got {detail_type!r}")
+        try:
+            order = data["order"]
+        except KeyError:
+            raise DecodeError("NewOrder.order is required") from None
+        order = Order.from_dict(order)
+        return cls(source, detail_type, order)
+
+    @classmethod
+    def decode(cls, body) -> "NewOrder":
+        """Decodes a JSON message body"""
+        return cls.from_dict(loads(body))
+
+    @classmethod
+    def decode_event(cls, body) -> "NewOrder":
+        """Decodes the detail of a JSON EventBridge event or projected message"""
+        return cls.from_dict(find_detail(loads(body)))
+
+
+# Generated classes by the detail-type of the event detail
+DETAIL_TYPES = {
+    "CancelOrder": CancelOrder,
+    "NewOrder": NewOrder,
+}
+
+# Keys that hold the event detail in the messages the rules deliver, the event's and the projections'
+DETAIL_KEYS = ("detail", "order")
+
+
+def find_detail(message):
+    """Returns the event detail of a decoded EventBridge event or projected message"""
+    if type(message) is dict:
+        for key in DETAIL_KEYS:
+            if key in message:
+                return message[key]
+    raise DecodeError("Message has no event detail")
+
+
+def decode_detail(detail):
+    """Builds the class of the detail-type of a decoded event detail"""
+    try:
+        model = DETAIL_TYPES[detail["detail-type"]]
+    except (TypeError, KeyError):
+        raise DecodeError("Detail has no known detail-type") from None
+    return model.from_dict(detail)
+
+
+def decode_event(body):
+    """Decodes a JSON EventBridge event, or a message projected from one, into the class of its detail's detail-type"""
+    return decode_detail(find_detail(loads(body)))
@@ -0,0 +1,92 @@
+"""
+Decoder for messages slimmed by an EventBridge input transformer
+
+Builds a named tuple per projection from `projections.json`, the same file the Event Target
+input transformers are created from, so a message is decoded with one `loads` and one
+`itemgetter` call instead of walking the full EventBridge envelope.
+
+    decoders = load_decoders()
+    for order in decoders["PizzaOrder"].decode_records(event):
+        order.id, order.order
+
+A converter turns a key into a class while the message is decoded, for example the
+detail into the class generated for its detail-type:
+
+    decoders = load_decoders(converters={"PizzaOrder": {"order": order_models.decode_detail}})
+"""
+import json
+import os
+from collections import namedtuple
+from operator import itemgetter
+
+try:
+    from orjson import loads  # pylint: disable=no-name-in-module
+except ImportError:
+    from json import loads
+
+
+PROJECTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projections.json")
+
+
+class ProjectionDecoder:
+    """
+    Decodes the projected message bodies into named tuples with the projection keys as fields
+    """
+
+    def __init__(self, name, fields, converters=None):
+        self.fields = tuple(fields)
+        self.message_type = namedtuple(name, self.fields)
+        self.converters = dict(converters or {})
+        self._getter = itemgetter(*self.fields)
+        self._single = len(self.fields) == 1
+
+    def decode(self, body):
+        """
+        Decodes a single message body
+
+        Args:
+            body (str): The SQS message body
+
+        Returns:
+            namedtuple: The message, keys that are missing from the body are None
+        """
+        data = loads(body)
+        try:
+            values = self._getter(data)
+        except KeyError:
+            message = self.message_type._make(map(data.get, self.fields))
+        else:
+            message = self.message_type(values) if self._single else self.message_type._make(values)
+        if self.converters:
+            message = message._replace(**{field: convert(getattr(message, field)) for field, convert in self.converters.items()})
+        return message
+
+    def decode_records(self, event):
+        """
+        Decodes the message bodies of a SQS batch
+
+        Args:
+            event (dict): The SQS event with the `Records` batch
+
+        Returns:
+            list: The messages in the order of the records
+        """
+        decode = self.decode
+        return [decode(record["body"]) for record in event["Records"]]
+
+
+def load_decoders(path=PROJECTIONS_FILE, converters=None):
+    """
+    Builds a decoder for every projection in a projections file
+
+    Args:
+        path (str): The path of the JSON projections file
+        converters (dict, optional): Functions called with the value of a key, by projection name and key
+
+    Returns:
+        dict: The decoders by projection name
+    """
+    with open(path, encoding="utf-8") as projections_file:
+        projections = json.load(projections_file)
+    converters = converters or {}
+    return {name: ProjectionDecoder(name, projection, converters.get(name)) for name, projection in projections.items()}
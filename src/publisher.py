@@ -0,0 +1,258 @@
+"""
+Pooled AWS clients and batched outbound publishing
+
+Clients are created once per execution environment, on first use, with keep-alive, a larger
+connection pool and the standard retry mode instead of the botocore defaults.  The `Publisher`
+buffers outbound events and messages during an invocation and sends them with `PutEvents` and
+`SendMessageBatch` in batches of the maximum size before the invocation returns.  Entries that
+fail inside a successful call with a throttling or internal error are retried with backoff;
+entries that still fail, or fail validation or authorization, raise a `PublishError`.
+
+    publisher = Publisher()
+
+    @publisher.flush_after
+    def lambda_handler(event, context):
+        publisher.put_event({"order": 1}, detail_type="OrderBaked")
+
+With an idempotency store, pass `publisher.flush` to `IdempotencyStore.process_batch` so the
+records are only marked completed once their events are sent.
+
+The bus and queues the function may publish to are set by `create_lambda_function(...,
+publish_bus_name=..., publish_queue_arns=[...])`.
+"""
+import functools
+import json
+import os
+import random
+import time
+
+
+# https://docs.aws.amazon.com/eventbridge/latest/APIReference/API_PutEvents.html
+MAX_EVENTS_PER_BATCH = 10
+# https://docs.aws.amazon.com/AWSSimpleQueueService/latest/APIReference/API_SendMessageBatch.html
+MAX_MESSAGES_PER_BATCH = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+# PutEvents entry errors that can succeed when sent again, the others (AccessDeniedException,
+# MalformedDetail, InvalidArgument, ...) fail the same way every time
+# https://docs.aws.amazon.com/eventbridge/latest/APIReference/API_PutEventsResultEntry.html
+RETRYABLE_EVENT_ERRORS = {"InternalFailure", "ThrottlingException"}
+
+DEFAULT_SOURCE = "pizza.pineapple.events"
+
+# Tuned for short lived handlers that talk to a few endpoints often
+CLIENT_CONFIG = {
+    "max_pool_connections": int(os.environ.get("PUBLISHER_MAX_POOL_CONNECTIONS", "50")),
+    "connect_timeout": 2,
+    "read_timeout": 5,
+    "tcp_keepalive": True,
+    "retries": {"mode": "standard", "max_attempts": 3},
+}
+
+_CLIENTS = {}
+
+
+def client_factory(service):
+    """
+    Creates a client with the tuned configuration, the emulator replaces it with its local stand-ins
+
+    Args:
+        service (str): The service name, for example `events`
+
+    Returns:
+        botocore.client.BaseClient: The client
+    """
+    import boto3  # pylint: disable=import-outside-toplevel
+    from botocore.config import Config  # pylint: disable=import-outside-toplevel
+    return boto3.client(service, config=Config(**CLIENT_CONFIG))
+
+
+def get_client(service):
+    """
+    Returns the client of a service, created once per execution environment
+
+    Args:
+        service (str): The service name, for example `events`
+
+    Returns:
+        botocore.client.BaseClient: The client
+    """
+    client = _CLIENTS.get(service)
+    if client is None:
+        client = _CLIENTS[service] = client_factory(service)
+    return client
+
+
+def warm(*services):
+    """
+    Creates the clients during init, when the execution environment has spare CPU
+
+    Args:
+        services (str): The service names, defaults to `events` and `sqs`
+    """
+    for service in services or ("events", "sqs"):
+        get_client(service)
+
+
+class PublishError(Exception):
+    """Raised when entries still fail after every retry"""
+
+    def __init__(self, message, failed):
+        super().__init__(message)
+        self.failed = failed
+
+
+def _event_size(entry):
+    # https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-putevent-size.html
+    size = 14 if "Time" in entry else 0
+    for key in ("Source", "DetailType", "Detail"):
+        size += len(entry.get(key, "").encode("utf-8"))
+    return size + sum(len(resource.encode("utf-8")) for resource in entry.get("Resources", []))
+
+
+def _message_size(entry):
+    size = len(entry["MessageBody"].encode("utf-8"))
+    for name, attribute in entry.get("MessageAttributes", {}).items():
+        size += len(name.encode("utf-8")) + len(attribute["DataType"].encode("utf-8"))
+        size += len(attribute.get("StringValue", "").encode("utf-8")) + len(attribute.get("BinaryValue", b""))
+    return size
+
+
+def _batches(entries, size, max_entries):
+    """Splits entries into batches of at most `max_entries` entries and `MAX_BATCH_BYTES` bytes"""
+    batch, batch_bytes = [], 0
+    for entry in entries:
+        entry_bytes = size(entry)
+        if entry_bytes > MAX_BATCH_BYTES:
+            raise ValueError(f"Entry of {entry_bytes} bytes is larger than the {MAX_BATCH_BYTES} bytes allowed")
+        if batch and (len(batch) == max_entries or batch_bytes + entry_bytes > MAX_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(entry)
+        batch_bytes += entry_bytes
+    if batch:
+        yield batch
+
+
+class Publisher:
+    """
+    Buffers outbound events and messages and sends them in batches
+    """
+
+    def __init__(self, bus_name=None, source=DEFAULT_SOURCE, max_attempts=4, base_delay=0.05):
+        self.bus_name = bus_name or os.environ.get("PUBLISH_BUS_NAME")
+        self.source = source
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.events = []
+        self.messages = {}
+
+    def put_event(self, detail, detail_type, source=None, bus_name=None, resources=None):
+        """
+        Buffers an event for `PutEvents`
+
+        Args:
+            detail (dict | str): The detail of the event
+            detail_type (str): The detail-type of the event
+            source (str, optional): The source of the event, defaults to the publisher's source
+            bus_name (str, optional): The event bus, defaults to `PUBLISH_BUS_NAME`
+            resources (list, optional): ARNs of the resources the event is about
+        """
+        entry = {
+            "Source": source or self.source,
+            "DetailType": detail_type,
+            "Detail": detail if isinstance(detail, str) else json.dumps(detail),
+            "EventBusName": bus_name or self.bus_name,
+        }
+        if resources:
+            entry["Resources"] = list(resources)
+        self.events.append(entry)
+
+    def send_message(self, queue_url, body, attributes=None, group_id=None, deduplication_id=None):
+        """
+        Buffers a message for `SendMessageBatch`
+
+        Args:
+            queue_url (str): The URL of the queue
+            body (dict | str): The message body
+            attributes (dict, optional): String message attributes
+            group_id (str, optional): The message group of a FIFO queue
+            deduplication_id (str, optional): The deduplication id of a FIFO queue
+        """
+        entry = {"MessageBody": body if isinstance(body, str) else json.dumps(body)}
+        if attributes:
+            entry["MessageAttributes"] = {name: {"DataType": "String", "StringValue": str(value)} for name, value in attributes.items()}
+        if group_id is not None:
+            entry["MessageGroupId"] = group_id
+        if deduplication_id is not None:
+            entry["MessageDeduplicationId"] = deduplication_id
+        self.messages.setdefault(queue_url, []).append(entry)
+
+    def flush(self):
+        """
+        Sends every buffered event and message
+
+        Raises:
+            PublishError: If entries still fail after every retry, the others were sent
+        """
+        events, self.events = self.events, []
+        messages, self.messages = self.messages, {}
+
+        failed = []
+        for batch in _batches(events, _event_size, MAX_EVENTS_PER_BATCH):
+            failed.extend(self._send(batch, self._put_events))
+        for queue_url, entries in messages.items():
+            for batch in _batches(entries, _message_size, MAX_MESSAGES_PER_BATCH):
+                failed.extend(self._send(batch, functools.partial(self._send_message_batch, queue_url)))
+
+        if failed:
+            raise PublishError(f"{len(failed)} entries could not be published", failed)
+
+    def _send(self, batch, send):
+        rejected = []
+        for attempt in range(self.max_attempts):
+            failed = send(batch)
+            rejected.extend(failure for failure in failed if failure["final"])
+            batch = [failure["entry"] for failure in failed if not failure["final"]]
+            if not batch:
+                return rejected
+            if attempt + 1 < self.max_attempts:
+                # Full jitter, so throttled functions do not retry in lockstep
+                time.sleep(random.uniform(0, self.base_delay * 2 ** attempt))
+        return rejected + [failure for failure in failed if not failure["final"]]
+
+    @staticmethod
+    def _put_events(batch):
+        response = get_client("events").put_events(Entries=batch)
+        if not response.get("FailedEntryCount"):
+            return []
+        return [
+            {"entry": entry, "error": result["ErrorCode"], "final": result["ErrorCode"] not in RETRYABLE_EVENT_ERRORS}
+            for entry, result in zip(batch, response["Entries"]) if "ErrorCode" in result
+        ]
+
+    @staticmethod
+    def _send_message_batch(queue_url, batch):
+        entries = [{"Id": str(index), **entry} for index, entry in enumerate(batch)]
+        response = get_client("sqs").send_message_batch(QueueUrl=queue_url, Entries=entries)
+        # Sender faults are invalid entries, sending them again can not succeed
+        return [
+            {"entry": batch[int(failure["Id"])], "error": failure.get("Code"), "final": bool(failure.get("SenderFault"))}
+            for failure in response.get("Failed", [])
+        ]
+
+    def flush_after(self, handler):
+        """
+        Decorates a handler so the buffers are flushed before the invocation returns, or dropped when it raises
+        """
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            try:
+                response = handler(event, context)
+            except Exception:
+                # The batch is delivered again, publishing now would send its entries twice
+                self.events, self.messages = [], {}
+                raise
+            self.flush()
+            return response
+        return wrapper
@@ -0,0 +1,80 @@
+"""
+Shared fixtures
+
+The Pulumi programs and tools live at the root of the repository and the Lambda Function code
+in `src/`, so both are put on the path the way `python emulator.py` and the runtime see them.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+for path in (SRC, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def sqs_record(body: str, message_id: str, receive_count: int = 1) -> dict:
+    """Returns a SQS record the way the event source mapping delivers it"""
+    return {
+        "messageId": message_id,
+        "receiptHandle": message_id,
+        "body": body,
+        "attributes": {"ApproximateReceiveCount": str(receive_count)},
+        "messageAttributes": {},
+        "md5OfBody": "",
+        "eventSource": "aws:sqs",
+        "eventSourceARN": "arn:aws:sqs:us-east-2:000000000000:NewPizza",
+        "awsRegion": "us-east-2",
+    }
+
+
+@pytest.fixture(autouse=True)
+def restore_handler_environment():
+    """The emulator sets the environment variables and client factories of the handlers it loads"""
+    import idempotency  # pylint: disable=import-outside-toplevel
+    import publisher  # pylint: disable=import-outside-toplevel
+
+    environment = dict(os.environ)
+    factories = (idempotency.client_factory, publisher.client_factory)
+    yield
+    os.environ.clear()
+    os.environ.update(environment)
+    idempotency.client_factory, publisher.client_factory = factories
+
+
+@pytest.fixture
+def load_handler(monkeypatch):
+    """
+    Loads a fresh `src/lambda_function.py` with the environment variables `infra.py` would set
+
+    The DynamoDB client of the idempotency store is replaced with the emulator's stand-in, which
+    is returned with the module as `dynamodb`.
+    """
+    import emulator  # pylint: disable=import-outside-toplevel
+    import idempotency  # pylint: disable=import-outside-toplevel
+
+    dynamodb = emulator.LocalDynamoDB()
+    monkeypatch.setattr(idempotency, "client_factory", lambda: dynamodb)
+
+    def load(**environment):
+        for key, value in {
+            "AWS_REGION": "us-east-2",
+            "AWS_LAMBDA_FUNCTION_NAME": "doStuff",
+            "POWERTOOLS_SERVICE_NAME": "Magic",
+            "POWERTOOLS_TRACE_DISABLED": "true",
+            **environment,
+        }.items():
+            monkeypatch.setenv(key, value)
+        spec = importlib.util.spec_from_file_location("lambda_function", os.path.join(SRC, "lambda_function.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.dynamodb = dynamodb
+        return module
+
+    return load
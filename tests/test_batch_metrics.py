@@ -0,0 +1,23 @@
+"""Tests of the aggregated EMF metrics"""
+from batch_metrics import MAX_VALUES_PER_METRIC, MetricsAggregator
+
+
+def test_summarized_histograms_keep_the_exact_count_and_sum():
+    metrics = MetricsAggregator(namespace="PineapplePizza", service="Magic", emit=lambda line: None)
+    samples = [index / 10 for index in range(1000)]
+    for sample in samples:
+        metrics.timing("ProcessingLatency", sample, high_resolution=True)
+
+    document = metrics.documents(timestamp=0)[0]
+
+    assert len(document["ProcessingLatency"]) == MAX_VALUES_PER_METRIC
+    assert (document["ProcessingLatencyCount"], document["ProcessingLatencySum"]) == (1000, sum(samples))
+    assert {"Name": "ProcessingLatencyCount", "Unit": "Count", "StorageResolution": 1} in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+
+
+def test_counters_are_summed_per_dimension_set():
+    metrics = MetricsAggregator(namespace="PineapplePizza", service="Magic", emit=lambda line: None)
+    for size in ["8", "12", "12"]:
+        metrics.count("OrdersProcessed", dimensions={"size": size})
+
+    assert [(document["size"], document["OrdersProcessed"]) for document in metrics.documents(timestamp=0)] == [("12", 2), ("8", 1)]
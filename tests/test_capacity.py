@@ -0,0 +1,116 @@
+"""Tests of planning the capacity and writing it to the stack config"""
+import json
+
+import pytest
+import yaml
+
+import capacity
+
+
+CAPACITY = {"functions": {"doStuff": {"batch_size": 62, "timeout": 30}}}
+
+STACK_FILE = """\
+# Settings of the nonprod stack
+config:
+  aws:region: us-east-2
+  pineapple-pizza:capacity:
+    functions:
+      doStuff:
+        batch_size: 10
+  # The custom domain of the API
+  pineapple-pizza:api_url: api.skwab.dev
+  pineapple-pizza:lambda_memory: "256"
+encryptionsalt: v1:abc
+"""
+
+
+def test_only_the_capacity_key_is_replaced(tmp_path):
+    path = tmp_path / "Pulumi.nonprod.yaml"
+    path.write_text(STACK_FILE, encoding="utf-8")
+
+    capacity.write(str(path), "pineapple-pizza", CAPACITY)
+
+    written = path.read_text(encoding="utf-8")
+    assert written == STACK_FILE.replace("        batch_size: 10\n", "        batch_size: 62\n        timeout: 30\n")
+    assert yaml.safe_load(written)["config"]["pineapple-pizza:capacity"] == CAPACITY
+
+
+def test_capacity_is_added_at_the_end_of_the_config(tmp_path):
+    path = tmp_path / "Pulumi.nonprod.yaml"
+    path.write_text("config:\n  aws:region: us-east-2  # Ohio\n\nencryptionsalt: v1:abc\n", encoding="utf-8")
+
+    capacity.write(str(path), "pineapple-pizza", CAPACITY)
+
+    assert path.read_text(encoding="utf-8").startswith("config:\n  aws:region: us-east-2  # Ohio\n  pineapple-pizza:capacity:\n")
+    assert yaml.safe_load(path.read_text(encoding="utf-8")) == {"config": {"aws:region": "us-east-2", "pineapple-pizza:capacity": CAPACITY}, "encryptionsalt": "v1:abc"}
+
+
+def test_a_missing_stack_file_is_created(tmp_path):
+    path = tmp_path / "Pulumi.dev.yaml"
+
+    capacity.write(str(path), "pineapple-pizza", CAPACITY)
+
+    assert yaml.safe_load(path.read_text(encoding="utf-8")) == {"config": {"pineapple-pizza:capacity": CAPACITY}}
+
+
+def spec(rps=100, peak_multiplier=1, share=1, record_ms=40, latency_target_ms=400, recovery_hours=24, quotas=None) -> dict:
+    return {
+        "region": "us-east-2",
+        "routes": [{"route": "POST /event", "rps": rps, "peak_multiplier": peak_multiplier, "payload_bytes": 2048}],
+        "consumers": [{"function": "doStuff", "queue": "NewPizza", "route": "POST /event", "share": share,
+                       "record_ms": record_ms, "latency_target_ms": latency_target_ms, "recovery_hours": recovery_hours}],
+        "quotas": quotas or {},
+    }
+
+
+@pytest.mark.parametrize("load, function, queue", [
+    # Little's law: 300 rps * 0.5 share * 40 ms * 1.2 headroom = 7.2 records in flight, 6 * 3 s timeout visibility
+    (spec(peak_multiplier=3, share=0.5), {"timeout": 3, "batch_size": 5, "batching_window": 0, "maximum_concurrency": 8},
+     {"visibility_timeout": 18, "message_retention": 345600}),
+    # A batch of 250 records fills in 2.5 s at 100 rps, the 2 s window fits the latency target
+    (spec(record_ms=10, latency_target_ms=5000, recovery_hours=72), {"timeout": 5, "batch_size": 250, "batching_window": 2, "maximum_concurrency": 2},
+     {"visibility_timeout": 32, "message_retention": 518400}),
+    # 12 records would need a window, but less than a second is left of the latency target
+    (spec(latency_target_ms=1000, recovery_hours=1), {"timeout": 3, "batch_size": 10, "batching_window": 0, "maximum_concurrency": 5},
+     {"visibility_timeout": 18, "message_retention": 345600}),
+    # The retention is capped at the 14 days SQS keeps messages
+    (spec(recovery_hours=24 * 10), {"timeout": 3, "batch_size": 5, "batching_window": 0, "maximum_concurrency": 5},
+     {"visibility_timeout": 18, "message_retention": 1209600}),
+])
+def test_plan(load, function, queue):
+    planned, warnings, _ = capacity.plan(load)
+
+    assert planned["functions"]["doStuff"] == function
+    assert planned["queues"]["NewPizza"] == queue
+    assert planned["queues"]["NewPizza"]["visibility_timeout"] == capacity.VISIBILITY_TIMEOUT_MULTIPLIER * function["timeout"] + function["batching_window"]
+    assert function["batch_size"] <= capacity.MAX_BATCH_SIZE_WITHOUT_WINDOW or function["batching_window"] >= 1
+    assert len(warnings) == (queue["message_retention"] == capacity.MAX_RETENTION)
+
+
+def test_plan_throttles_the_route_at_the_peak():
+    planned, _, usage = capacity.plan(spec(peak_multiplier=3, share=0.5))
+
+    assert planned["routes"] == {"POST /event": {"throttle_rate": 360, "throttle_burst": 720}}
+    assert usage == {"api_rate": (360, 10000), "lambda_concurrency": (8, 900), "put_events_rate": (300, 2400)}
+
+
+def test_plan_warns_about_every_quota_the_load_exceeds():
+    planned, warnings, usage = capacity.plan(spec(rps=5000, peak_multiplier=2, record_ms=100, latency_target_ms=1000))
+
+    assert usage == {"api_rate": (12000, 10000), "lambda_concurrency": (1000, 900), "put_events_rate": (10000, 2400)}
+    assert planned["functions"]["doStuff"]["maximum_concurrency"] == capacity.MAX_MAXIMUM_CONCURRENCY
+    assert warnings == [
+        "Route throttles add up to 12000 requests/s, the account allows 10000 per region",
+        "Function doStuff needs 1200 concurrent executions, an event source mapping scales to 1000",
+        "Functions need 1000 concurrent executions, the account has 900 besides the 100 Lambda keeps unreserved",
+        "The peak needs 10000 PutEvents requests/s, the account allows 2400 in us-east-2",
+    ]
+
+
+def test_usage_is_printed_without_available_concurrency(tmp_path, capsys):
+    path = tmp_path / "capacity.json"
+    path.write_text(json.dumps(spec(quotas={"lambda_concurrency": capacity.UNRESERVED_CONCURRENCY})), encoding="utf-8")
+
+    capacity.main([str(path)])
+
+    assert "lambda_concurrency: 5 of 0 (none available, -5 headroom)" in capsys.readouterr().err
@@ -0,0 +1,158 @@
+"""Tests of the multi-stack deployment driver, without the Pulumi CLI"""
+import os
+import threading
+import types
+
+import pytest
+import yaml
+
+import deploy
+from conftest import ROOT
+
+
+def test_stacks_are_deployed_after_their_dependencies():
+    targets = [
+        deploy.StackTarget("prod-east", depends_on=["nonprod"]),
+        deploy.StackTarget("nonprod"),
+        deploy.StackTarget("prod-west", depends_on=["nonprod"]),
+    ]
+
+    assert [[target.name for target in wave] for wave in deploy.plan_waves(targets)] == [["nonprod"], ["prod-east", "prod-west"]]
+
+
+def test_dependency_cycles_are_rejected():
+    with pytest.raises(ValueError, match="Dependency cycle"):
+        deploy.plan_waves([deploy.StackTarget("a", depends_on=["b"]), deploy.StackTarget("b", depends_on=["a"])])
+
+
+def test_workspace_runs_the_program_without_touching_its_stack_files(tmp_path):
+    with open(os.path.join(ROOT, "Pulumi.nonprod.yaml"), encoding="utf-8") as stack_file:
+        stack_config = stack_file.read()
+    driver = deploy.DeploymentDriver(operation="preview")
+
+    driver.write_workspace(deploy.StackTarget("nonprod", region="us-west-2"), str(tmp_path))
+
+    with open(tmp_path / "Pulumi.yaml", encoding="utf-8") as project_file:
+        project = yaml.safe_load(project_file)
+    assert os.path.normpath(tmp_path / project["main"]) == ROOT
+    assert project["runtime"]["options"]["virtualenv"] == os.path.join(ROOT, "venv")
+    assert (tmp_path / "Pulumi.nonprod.yaml").read_text(encoding="utf-8") == stack_config
+
+
+def test_file_backend_needs_a_passphrase(monkeypatch):
+    for name in deploy.PASSPHRASE_VARS:
+        monkeypatch.delenv(name, raising=False)
+
+    with pytest.raises(ValueError, match="PULUMI_CONFIG_PASSPHRASE"):
+        deploy.DeploymentDriver(backend_url="file:///tmp/pulumi-state")
+
+    assert deploy.DeploymentDriver(backend_url="file:///tmp/pulumi-state", env_vars={"PULUMI_CONFIG_PASSPHRASE": "local"})
+
+
+class FakeStack:
+    """Records what the driver does with a stack, its operations raise for the stacks in `failing`"""
+
+    def __init__(self, stacks, stack_name, work_dir, opts):
+        self.stacks = stacks
+        self.name = stack_name
+        self.work_dir = work_dir
+        self.env_vars = opts.env_vars
+        with open(os.path.join(work_dir, "Pulumi.yaml"), encoding="utf-8") as project_file:
+            self.project = yaml.safe_load(project_file)
+        self.config = {}
+        self.operations = []
+
+    def set_config(self, key, value):
+        self.config[key] = value.value
+
+    def _run(self, operation, on_output):
+        self.operations.append(operation)
+        on_output(f"{operation} {self.name}")
+        with self.stacks.lock:
+            self.stacks.order.append(self.name)
+        if self.name in self.stacks.failing:
+            raise RuntimeError(f"code: 255\nerror: {operation} of {self.name} failed")
+        return types.SimpleNamespace(change_summary={"create": 2}, summary=types.SimpleNamespace(resource_changes={"update": 1}))
+
+    def preview(self, on_output):
+        return self._run("preview", on_output)
+
+    def up(self, on_output):
+        return self._run("up", on_output)
+
+    def destroy(self, on_output):
+        return self._run("destroy", on_output)
+
+
+@pytest.fixture
+def stacks(monkeypatch):
+    """Replaces the Automation API stacks with `FakeStack`s, by name in the order they ran"""
+    recorded = types.SimpleNamespace(by_name={}, order=[], failing=set(), lock=threading.Lock())
+
+    def create_or_select_stack(stack_name, work_dir, opts):
+        stack = FakeStack(recorded, stack_name, work_dir, opts)
+        recorded.by_name[stack_name] = stack
+        return stack
+
+    monkeypatch.setattr(deploy.auto, "create_or_select_stack", create_or_select_stack)
+    return recorded
+
+
+def plan():
+    return [
+        deploy.StackTarget("nonprod"),
+        deploy.StackTarget("prod-east", region="us-east-2", depends_on=["nonprod"]),
+        deploy.StackTarget("prod-west", region="us-west-2", depends_on=["nonprod"]),
+        deploy.StackTarget("global", depends_on=["prod-east", "prod-west"]),
+    ]
+
+
+def test_stack_runs_in_a_temporary_workspace_of_the_program(stacks):
+    output = []
+    driver = deploy.DeploymentDriver(operation="up", backend_url="file:///tmp/pulumi-state", env_vars={"PULUMI_CONFIG_PASSPHRASE": "local"},
+                                     on_output=lambda name, line: output.append((name, line)))
+
+    result = driver.run_stack(deploy.StackTarget("prod-west", region="us-west-2", config={"lambda_memory": "512"}))
+
+    stack = stacks.by_name["prod-west"]
+    assert result.succeeded and result.changes == {"update": 1}
+    assert stack.operations == ["up"] and output == [("prod-west", "up prod-west")]
+    assert stack.work_dir != ROOT and not os.path.exists(stack.work_dir)
+    assert os.path.normpath(os.path.join(stack.work_dir, stack.project["main"])) == ROOT
+    assert stack.config == {"aws:region": "us-west-2", "lambda_memory": "512"}
+    assert stack.env_vars == {"PULUMI_CONFIG_PASSPHRASE": "local", "PULUMI_BACKEND_URL": "file:///tmp/pulumi-state"}
+
+
+def test_preview_reports_the_change_summary(stacks):
+    result = deploy.DeploymentDriver(operation="preview").run_stack(deploy.StackTarget("nonprod"))
+
+    assert result.succeeded and result.changes == {"create": 2}
+    assert stacks.by_name["nonprod"].operations == ["preview"]
+
+
+def test_failed_wave_stops_the_next_wave(stacks):
+    stacks.failing.add("prod-east")
+
+    results = deploy.DeploymentDriver(operation="up").run(plan())
+
+    assert [(result.name, result.status) for result in results] == [
+        ("nonprod", "succeeded"), ("prod-east", "failed"), ("prod-west", "succeeded"), ("global", "skipped")]
+    assert results[1].error == "error: up of prod-east failed"
+    assert "global" not in stacks.by_name
+
+
+def test_failed_wave_does_not_stop_the_next_wave_when_asked(stacks):
+    stacks.failing.add("prod-east")
+
+    results = deploy.DeploymentDriver(operation="up").run(plan(), stop_on_failure=False)
+
+    assert [result.status for result in results] == ["succeeded", "failed", "succeeded", "succeeded"]
+
+
+def test_destroy_runs_the_waves_in_reverse(stacks):
+    results = deploy.DeploymentDriver(operation="destroy").run(plan())
+
+    assert all(result.succeeded for result in results)
+    assert stacks.order[0] == "global"
+    assert set(stacks.order[1:3]) == {"prod-east", "prod-west"}
+    assert stacks.order[3] == "nonprod"
@@ -0,0 +1,83 @@
+"""Tests of the in-process pipeline emulator"""
+import inspect
+import json
+
+import pytest
+
+import capacity
+from emulator import PipelineEmulator, build_pizza_pipeline
+
+
+def new_orders(count: int):
+    return (json.dumps({"source": "Pizza", "detail-type": "NewOrder", "order": {"id": index, "toppings": ["pineapple"]}}) for index in range(count))
+
+
+def handler_globals(function: dict) -> dict:
+    """The module globals of a loaded handler, under its decorators"""
+    return inspect.unwrap(function["handler"]).__globals__
+
+
+@pytest.fixture
+def emulator():
+    return build_pizza_pipeline(PipelineEmulator())
+
+
+def test_real_handler_processes_every_order(emulator):
+    report = emulator.load_test("POST /event", new_orders(25))
+
+    assert (report.published, report.processed, report.retried, report.failed, report.pending) == (25, 25, 0, 0, 0)
+
+
+def test_pipeline_is_the_deployed_definition(emulator):
+    function = emulator.functions[0]
+
+    assert emulator.dynamodb.tables.keys() == {"local-pineapple-pizza-doStuff-idempotency"}
+    assert handler_globals(function)["idempotency_store"].key_expression.expression == "body.id"
+
+
+def test_capacity_config_is_applied():
+    capacity_config, _, _ = capacity.plan({
+        "routes": [{"route": "POST /event", "rps": 200}],
+        "consumers": [{"function": "doStuff", "queue": "NewPizza", "route": "POST /event", "record_ms": 40, "latency_target_ms": 5000}],
+    })
+    emulator = build_pizza_pipeline(PipelineEmulator(), capacity_config=capacity_config)
+
+    assert emulator.functions[0]["batch_size"] == capacity_config["functions"]["doStuff"]["batch_size"]
+
+
+def test_failed_records_are_received_again(emulator):
+    function = emulator.functions[0]
+    handler = function["handler"]
+    calls = []
+
+    def fail_first_receive(event, context):
+        calls.append(len(event["Records"]))
+        if all(record["attributes"]["ApproximateReceiveCount"] == "1" for record in event["Records"]):
+            raise RuntimeError("cold database")
+        return handler(event, context)
+
+    function["handler"] = fail_first_receive
+    report = emulator.load_test("POST /event", new_orders(10))
+
+    assert calls == [10, 10]
+    assert (report.processed, report.retried, report.failed) == (10, 10, 0)
+
+
+def test_records_that_always_fail_are_counted_after_max_receives():
+    emulator = build_pizza_pipeline(PipelineEmulator(max_receives=3))
+    emulator.functions[0]["handler"] = lambda event, context: {"batchItemFailures": [{"itemIdentifier": record["messageId"]} for record in event["Records"]]}
+
+    report = emulator.load_test("POST /event", new_orders(4))
+
+    assert (report.processed, report.retried, report.failed, report.pending) == (0, 8, 4, 0)
+
+
+def test_every_function_is_loaded_with_its_own_name(emulator):
+    queue_arn = emulator.create_sqs_queue(name="Other")
+    emulator.create_lambda_function(
+        function_name="other", runtime="python3.9", code_source="./src", handler="lambda_function.lambda_handler",
+        memory=128, queue_arn=queue_arn, idempotency=True)
+
+    prefixes = [handler_globals(function)["idempotency_store"].prefix for function in emulator.functions]
+
+    assert prefixes == ["local-pineapple-pizza-doStuff", "local-pineapple-pizza-other"]
@@ -0,0 +1,60 @@
+"""Tests of the local EventBridge pattern validation and matching"""
+import pytest
+
+import event_patterns
+
+
+PIZZA_ORDER = {"id": "$.id", "time": "$.time", "order": "$.detail"}
+
+
+def test_filter_patterns_are_nested_under_the_body():
+    assert event_patterns.sqs_filter_patterns(['{"detail": {"detail-type": ["NewOrder"]}}']) == [{"body": {"detail": {"detail-type": ["NewOrder"]}}}]
+
+
+def test_filter_patterns_use_the_keys_of_the_projection():
+    assert event_patterns.sqs_filter_patterns([{"order": {"detail-type": ["NewOrder"]}}], PIZZA_ORDER) == [{"body": {"order": {"detail-type": ["NewOrder"]}}}]
+
+
+def test_filter_patterns_written_against_the_envelope_are_rejected_with_a_projection():
+    with pytest.raises(ValueError, match="detail are not in the projected message"):
+        event_patterns.sqs_filter_patterns([{"detail": {"detail-type": ["NewOrder"]}}], PIZZA_ORDER)
+
+
+def test_or_matches_any_of_its_patterns():
+    pattern = event_patterns.validate_pattern({"source": ["Pizza"], "$or": [{"detail-type": ["NewOrder"]}, {"order": {"size": [{"numeric": [">=", 12]}]}}]})
+
+    assert event_patterns.matches(pattern, {"source": "Pizza", "detail-type": "NewOrder", "order": {}})
+    assert event_patterns.matches(pattern, {"source": "Pizza", "detail-type": "CancelOrder", "order": {"size": 14}})
+    assert not event_patterns.matches(pattern, {"source": "Pizza", "detail-type": "CancelOrder", "order": {"size": 10}})
+
+
+def test_wildcard_and_cidr_filters_are_matched():
+    assert event_patterns.matches({"detail-type": [{"wildcard": "*Order"}]}, {"detail-type": "NewOrder"})
+    assert not event_patterns.matches({"detail-type": [{"anything-but": {"wildcard": "Cancel*"}}]}, {"detail-type": "CancelOrder"})
+    assert event_patterns.matches({"ip": [{"cidr": "10.0.0.0/24"}]}, {"ip": "10.0.0.7"})
+    assert not event_patterns.matches({"ip": [{"cidr": "10.0.0.0/24"}]}, {"ip": "10.0.1.7"})
+
+
+@pytest.mark.parametrize("pattern", [
+    {"$or": [{"source": ["Pizza"]}]},
+    {"ip": [{"cidr": "10.0.0.300/24"}]},
+    {"detail-type": [{"wildcard": "New**"}]},
+])
+def test_invalid_operators_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        event_patterns.validate_pattern(pattern)
+
+
+def test_filter_patterns_accept_or_with_the_keys_of_the_projection():
+    patterns = event_patterns.sqs_filter_patterns([{"$or": [{"id": [{"prefix": "a"}]}, {"order": {"size": [12]}}]}], PIZZA_ORDER)
+
+    assert patterns == [{"body": {"$or": [{"id": [{"prefix": "a"}]}, {"order": {"size": [12]}}]}}]
+
+
+@pytest.mark.parametrize("rule, operator", [
+    ({"anything-but": {"wildcard": "10.*"}}, "wildcard"),
+    ({"cidr": "10.0.0.0/8"}, "cidr"),
+])
+def test_filters_lambda_does_not_support_are_rejected(rule, operator):
+    with pytest.raises(ValueError, match=f"order.ip uses {operator}"):
+        event_patterns.sqs_filter_patterns([{"order": {"ip": [rule]}}])
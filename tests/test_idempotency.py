@@ -0,0 +1,71 @@
+"""Tests of the idempotency store"""
+import json
+
+import pytest
+
+from conftest import sqs_record
+from emulator import LocalDynamoDB
+from idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def store():
+    dynamodb = LocalDynamoDB()
+    dynamodb.create_table("idempotency")
+    return IdempotencyStore("idempotency", key_expression="body.id", client=dynamodb, prefix="doStuff")
+
+
+def batch(*ids) -> dict:
+    return {"Records": [sqs_record(json.dumps({"id": order_id}), f"message-{order_id}") for order_id in ids]}
+
+
+def test_records_are_processed_once(store):
+    processed = []
+
+    assert store.process_batch(batch(1, 2), processed.append) == {"batchItemFailures": []}
+    assert store.process_batch(batch(1, 2, 3), processed.append) == {"batchItemFailures": []}
+
+    assert [json.loads(record["body"])["id"] for record in processed] == [1, 2, 3]
+
+
+def test_records_are_released_when_the_publish_fails(store):
+    processed = []
+
+    def flush():
+        raise RuntimeError("PutEvents failed")
+
+    response = store.process_batch(batch(1, 2), processed.append, flush=flush)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-1"}, {"itemIdentifier": "message-2"}]}
+    assert store.client.tables["idempotency"] == {}
+
+    # The redelivery is processed, and published, again instead of being skipped as a duplicate
+    flushed = []
+    assert store.process_batch(batch(1, 2), processed.append, flush=lambda: flushed.append(True)) == {"batchItemFailures": []}
+    assert len(processed) == 4 and flushed == [True]
+    assert {item["status"]["S"] for item in store.client.tables["idempotency"].values()} == {"COMPLETED"}
+
+
+def test_records_are_completed_after_the_flush(store):
+    statuses = []
+
+    def flush():
+        statuses.extend(item["status"]["S"] for item in store.client.tables["idempotency"].values())
+
+    store.process_batch(batch(1), lambda record: None, flush=flush)
+
+    assert statuses == ["INPROGRESS"]
+
+
+def test_records_without_a_key_fail_when_the_publish_fails(store):
+    processed = []
+    keyless = {"Records": [sqs_record(json.dumps({"order": 1}), "message-keyless"), *batch(2)["Records"]]}
+
+    def flush():
+        raise RuntimeError("PutEvents failed")
+
+    response = store.process_batch(keyless, processed.append, flush=flush)
+
+    assert len(processed) == 2
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-keyless"}, {"itemIdentifier": "message-2"}]}
+    assert store.client.tables["idempotency"] == {}
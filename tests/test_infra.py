@@ -0,0 +1,164 @@
+"""Tests of the resources the Pulumi program registers, run with the Pulumi mocks"""
+# pylint: disable=protected-access
+import os
+import runpy
+
+import pulumi
+import pulumi.resource
+import pulumi.runtime
+import pytest
+from pulumi.runtime.stack import wait_for_rpcs
+from pulumi.runtime.sync_await import _sync_await
+
+import layers
+import profiler
+from conftest import ROOT
+
+
+# The longest chain of resources that wait on each other: bus, bus policy, API role, integration and route.
+# Raise it only for a real new data dependency.
+MAX_DEPENDENCY_DEPTH = 5
+
+CONFIG = {
+    "pineapple-pizza:api_authorizer_uri": "https://auth.example.com/",
+    "pineapple-pizza:authorizer_audience": "pizza",
+    "pineapple-pizza:api_url": "api.example.com",
+    "pineapple-pizza:route53_zone_name": "example.com",
+    "pineapple-pizza:certificate_name": "*.example.com",
+    "pineapple-pizza:lambda_memory": "256",
+}
+
+INVOKES = {
+    "aws:index/getCallerIdentity:getCallerIdentity": {"accountId": "123456789012", "arn": "arn:aws:iam::123456789012:user/test", "userId": "test", "id": "123456789012"},
+    "aws:index/getRegion:getRegion": {"name": "us-east-2", "id": "us-east-2", "endpoint": "ec2.us-east-2.amazonaws.com", "description": "US East (Ohio)"},
+    "aws:iam/getPolicyDocument:getPolicyDocument": {"json": "{}", "id": "policy"},
+    "aws:acm/getCertificate:getCertificate": {"arn": "arn:aws:acm:us-east-2:123456789012:certificate/test", "id": "certificate"},
+    "aws:route53/getZone:getZone": {"name": "example.com", "id": "zone", "nameServers": []},
+}
+
+
+class InfraMocks(pulumi.runtime.Mocks):
+    """Returns the inputs of a resource with an ARN and name as its outputs"""
+
+    def __init__(self):
+        self.registered = []
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        self.registered.append(args)
+        outputs = {"arn": f"arn:aws:test:us-east-2:123456789012:{args.name}", "name": args.name, **args.inputs}
+        if args.typ == "aws:apigatewayv2/domainName:DomainName":
+            outputs["domainNameConfiguration"] = {"targetDomainName": "target.example.com", "hostedZoneId": "zone"}
+        return [f"{args.name}-id", outputs]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        return INVOKES.get(args.token, {})
+
+
+@pytest.fixture(scope="module")
+def program(tmp_path_factory):
+    """Runs `__main__.py` once and returns the mocks and the profiler that recorded the dependencies"""
+    mocks = InfraMocks()
+    layer_zip = tmp_path_factory.mktemp("layers") / "layer.zip"
+    layer_zip.write_bytes(b"")
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(ROOT)
+        # The layer is built by pip, which is not what these tests are about
+        monkeypatch.setattr(layers, "build_layer", lambda requirements, runtime, architecture="x86_64": (str(layer_zip), "0" * 64))
+        recorder = profiler._Profiler(str(tmp_path_factory.mktemp("profile")))
+        monkeypatch.setattr(pulumi.resource, "register_resource", recorder.register_resource)
+
+        pulumi.runtime.set_mocks(mocks, project="pineapple-pizza", stack="nonprod", preview=False)
+        pulumi.runtime.set_all_config(CONFIG)
+        runpy.run_path(os.path.join(ROOT, "__main__.py"), run_name="pulumi_program")
+        _sync_await(wait_for_rpcs())
+
+    return mocks, recorder
+
+
+def dependency_depth(resources: dict) -> int:
+    """The number of resources in the longest chain of dependencies"""
+    depths = {}
+
+    def depth(key: int) -> int:
+        if key not in depths:
+            depths[key] = 1 + max((depth(dependency) for dependency in resources[key]["depends_on"] if dependency in resources), default=0)
+        return depths[key]
+
+    return max(depth(key) for key in resources)
+
+
+def test_dependency_depth_of_the_graph(program):
+    _, recorder = program
+
+    assert dependency_depth(recorder.resources) <= MAX_DEPENDENCY_DEPTH
+
+
+def test_eventbridge_integration_uses_the_role_of_the_bus(program):
+    mocks, _ = program
+    integration = next(args for args in mocks.registered if args.typ == "aws:apigatewayv2/integration:Integration")
+
+    assert integration.inputs["credentialsArn"] == "arn:aws:test:us-east-2:123456789012:apiBusRole"
+
+
+@pytest.fixture
+def infra(program):
+    """`infra.py`, which looks up the account on import, once the program ran with the mocks"""
+    import infra as module  # pylint: disable=import-outside-toplevel
+    return module
+
+
+def test_routes_share_integrations_by_name(infra):
+    queue_arn = pulumi.Output.from_input("arn:aws:sqs:us-east-2:123456789012:orders")
+
+    table = infra.build_route_table([
+        {"route": "POST /event"},
+        {"route": "POST /again"},
+        {"route": "POST /orders", "target": "SQS", "queue_arn": queue_arn, "integration_name": "orders"},
+        {"route": "PUT /orders", "target": "SQS", "queue_arn": queue_arn.apply(str), "integration_name": "orders"},
+        {"route": "DELETE /orders", "target": "SQS", "queue_arn": queue_arn},
+    ], "JWT", "https://auth.example.com/", "pizza")
+
+    assert [route["integration_key"] for route in table] == [
+        ("EventBridge", "PizzaOrder", "pizza.pineapple.events"),
+        ("EventBridge", "PizzaOrder", "pizza.pineapple.events"),
+        ("SQS", "orders"),
+        ("SQS", "orders"),
+        ("SQS", "DELETE /orders"),
+    ]
+
+
+def test_a_single_scope_is_a_list(infra):
+    table = infra.build_route_table([{"route": "POST /event"}, {"route": "POST /orders", "scopes": "orders:write"}], "JWT", None, None, "pizza:write")
+
+    assert [route["scopes"] for route in table] == [["pizza:write"], ["orders:write"]]
+
+
+def test_route_resources_are_named_after_the_route(program):
+    mocks, _ = program
+    names = {args.typ.rsplit(":", 1)[-1]: args.name for args in mocks.registered if args.typ.startswith("aws:apigatewayv2/")}
+
+    assert names["Route"].endswith("HttpApiRoutePostEvent")
+    assert names["Integration"].endswith("ApiEventBusIntegrationPizzaorderPizzaPineappleEvents")
+
+
+def test_names_do_not_depend_on_the_order_of_the_routes(infra):
+    routes = [
+        {"route": "POST /event"},
+        {"route": "POST /orders", "target": "SQS", "queue_arn": "arn:aws:sqs:us-east-2:123456789012:orders"},
+        {"route": "DELETE /orders", "target": "SQS", "queue_arn": pulumi.Output.from_input("arn"), "integration_name": "cancel-orders"},
+    ]
+
+    def slugs(table):
+        return {route["route"]: (route["route_slug"], route["integration_slug"]) for route in table}
+
+    assert slugs(infra.build_route_table(routes, "JWT", None, None)) == slugs(infra.build_route_table(routes[::-1], "JWT", None, None)) == {
+        "POST /event": ("PostEvent", "PizzaorderPizzaPineappleEvents"),
+        "POST /orders": ("PostOrders", "Orders"),
+        "DELETE /orders": ("DeleteOrders", "CancelOrders"),
+    }
+
+
+def test_routes_with_the_same_name_are_rejected(infra):
+    with pytest.raises(ValueError, match="same name PostOrdersId"):
+        infra.build_route_table([{"route": "POST /orders/{id}"}, {"route": "POST /orders-id"}], "NONE", None, None)
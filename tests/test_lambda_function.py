@@ -0,0 +1,87 @@
+"""Tests of the Lambda Function handler with SQS batches"""
+import json
+import os
+
+import pytest
+
+import projections
+from conftest import SRC, sqs_record
+from emulator import LambdaContext
+
+
+PIZZA_ORDER = projections.load_projection(os.path.join(SRC, "projections.json"), "PizzaOrder")
+
+
+def pizza_message(order_id: int) -> str:
+    """Returns the body the NewPizza rule delivers for an order"""
+    event = {
+        "version": "0",
+        "id": f"event-{order_id}",
+        "detail-type": "PizzaOrder",
+        "source": "pizza.pineapple.events",
+        "time": "2022-01-01T00:00:00Z",
+        "detail": {"source": "Pizza", "detail-type": "NewOrder", "order": {"id": order_id, "toppings": ["pineapple"]}},
+    }
+    return json.dumps(projections.project(PIZZA_ORDER, event))
+
+
+def sqs_event(*order_ids) -> dict:
+    return {"Records": [sqs_record(pizza_message(order_id), f"message-{order_id}") for order_id in order_ids]}
+
+
+def test_handler_processes_sqs_batch_without_idempotency(load_handler):
+    module = load_handler()
+    assert module.idempotency_store is None
+
+    assert module.lambda_handler(sqs_event(1, 2), LambdaContext("doStuff", 256)) is None
+
+
+def test_handler_records_the_processing_time_of_every_record(load_handler):
+    module = load_handler()
+    lines = []
+    module.batch_metrics.emit = lines.append
+
+    module.lambda_handler(sqs_event(1, 2, 3), LambdaContext("doStuff", 256))
+
+    document = json.loads(lines[0])
+    assert len(document["ProcessingTime"]) == 3
+    assert document["ProcessingTimeCount"] == 3
+    assert document["ProcessingTimeSum"] == pytest.approx(sum(document["ProcessingTime"]))
+
+
+def test_handler_skips_redelivered_records(load_handler):
+    module = load_handler(IDEMPOTENCY_TABLE="idempotency", IDEMPOTENCY_KEY="body.id")
+    module.dynamodb.create_table("idempotency")
+    processed = []
+    process_record = module.process_record
+    module.process_record = lambda record: processed.append(record["messageId"]) or process_record(record)
+
+    event = sqs_event(1, 2)
+    assert module.lambda_handler(event, LambdaContext("doStuff", 256)) == {"batchItemFailures": []}
+    assert module.lambda_handler(event, LambdaContext("doStuff", 256)) == {"batchItemFailures": []}
+
+    assert processed == ["message-1", "message-2"]
+    assert len(module.dynamodb.tables["idempotency"]) == 2
+
+
+def test_handler_reports_failed_records(load_handler):
+    module = load_handler(IDEMPOTENCY_TABLE="idempotency", IDEMPOTENCY_KEY="body.id")
+    module.dynamodb.create_table("idempotency")
+
+    event = {"Records": [sqs_record(pizza_message(1), "message-1"), sqs_record(json.dumps({"id": "event-2", "order": {}}), "message-2")]}
+    response = module.lambda_handler(event, LambdaContext("doStuff", 256))
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-2"}]}
+
+
+def test_records_are_decoded_with_the_projection_of_the_rule(load_handler):
+    module = load_handler()
+
+    assert module.process_record(sqs_record(pizza_message(1), "message-1")) == {"id": "event-1"}
+
+
+def test_handler_raises_without_idempotency_so_the_batch_is_redelivered(load_handler):
+    module = load_handler()
+
+    with pytest.raises(ValueError):
+        module.lambda_handler({"Records": [sqs_record("not json", "message-0")]}, LambdaContext("doStuff", 256))
@@ -0,0 +1,43 @@
+"""Tests of the dependency layer builder"""
+import zipfile
+
+import pytest
+
+import layers
+
+
+def test_unpinned_requirements_are_rejected(tmp_path):
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("loguru==0.7.3\norjson>=3\n")
+
+    with pytest.raises(ValueError, match="orjson>=3"):
+        layers.requirements_hash(str(requirements), "python3.9")
+
+
+def test_only_top_level_test_directories_are_pruned(tmp_path):
+    for path in ["tests/test_a.py", "numpy/testing/utils.py", "numpy/__pycache__/core.cpython-39.pyc", "numpy/core.py"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+
+    layers.prune(str(tmp_path))
+
+    assert sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob("*.py")) == ["numpy/core.py", "numpy/testing/utils.py"]
+    assert not (tmp_path / "numpy" / "__pycache__").exists()
+
+
+def test_layer_is_renamed_into_place(tmp_path, monkeypatch):
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("loguru==0.7.3\n")
+
+    def install(requirements, runtime, architecture, build_dir):
+        (tmp_path / build_dir / "python").mkdir()
+        (tmp_path / build_dir / "python" / "loguru.py").write_text("")
+
+    monkeypatch.setattr(layers, "_install", install)
+    cache_dir = tmp_path / "cache"
+
+    zip_path, lock_hash = layers.build_layer(str(requirements), "python3.9", cache_dir=str(cache_dir))
+
+    assert zip_path == str(cache_dir / f"{lock_hash}.zip")
+    assert [path.name for path in cache_dir.iterdir()] == [f"{lock_hash}.zip"]
+    assert zipfile.ZipFile(zip_path).namelist() == ["python/loguru.py"]
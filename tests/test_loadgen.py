@@ -0,0 +1,75 @@
+"""Tests of the load generator's token minting, local authorizer and latency histograms"""
+import asyncio
+import json
+import urllib.error
+import urllib.request
+
+import jwt
+import pytest
+from aiohttp import web
+
+from emulator import PipelineEmulator, build_pizza_pipeline
+from loadgen import LocalHttpApi, SigningKey, run_load
+
+
+@pytest.fixture(scope="module")
+def key():
+    return SigningKey.generate()
+
+
+def post(url: str, token: str) -> int:
+    request = urllib.request.Request(url, data=b'{"source": "Pizza", "detail-type": "NewOrder", "order": {"id": 1}}', headers={"Authorization": f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def test_minted_tokens_verify_against_the_jwks(key):
+    token = key.mint("https://issuer.example.com/", "pizza", subject="loadgen-1", scopes="orders:write", ttl=60)
+
+    public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key.jwks()["keys"][0]))
+    claims = jwt.decode(token, public_key, algorithms=["RS256"], issuer="https://issuer.example.com/", audience="pizza")
+
+    assert jwt.get_unverified_header(token)["kid"] == key.kid
+    assert (claims["sub"], claims["scope"], claims["exp"] - claims["iat"]) == ("loadgen-1", "orders:write", 60)
+
+
+def test_local_api_checks_the_scopes_of_the_route(key):
+    emulator = PipelineEmulator()
+    build_pizza_pipeline(emulator)
+    emulator.routes["POST /event"]["scopes"] = ["orders:write"]
+
+    with LocalHttpApi(emulator, key, audience="pizza") as api:
+        allowed = post(f"{api.url}/event", key.mint(api.issuer, "pizza", scopes="orders:write"))
+        forbidden = post(f"{api.url}/event", key.mint(api.issuer, "pizza", scopes="orders:read"))
+        unauthorized = post(f"{api.url}/event", SigningKey.generate().mint(api.issuer, "pizza", scopes="orders:write"))
+
+    assert (allowed, forbidden, unauthorized) == (200, 403, 401)
+
+
+def test_response_time_includes_the_wait_for_a_connection():
+    async def load():
+        async def slow(request):
+            await asyncio.sleep(0.05)
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_post("/event", slow)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+        try:
+            # All five are due at once but there is one connection, so they are served one after the other
+            return await run_load(f"http://127.0.0.1:{port}/event", [0.0] * 5, ["{}"] * 5, connections=1)
+        finally:
+            await runner.cleanup()
+
+    report = asyncio.run(load())
+
+    assert (report.sent, report.completed, report.errors) == (5, 5, 0)
+    assert report.service.get_max_value() < 150_000
+    assert report.response.get_max_value() >= 4 * 45_000
@@ -0,0 +1,58 @@
+"""Tests of the generated decoders against the messages the pipeline delivers"""
+import json
+import os
+
+import pytest
+
+import codegen
+import order_models
+from projection_decoder import load_decoders
+from conftest import ROOT, SRC
+from emulator import PipelineEmulator, build_pizza_pipeline
+
+
+@pytest.fixture
+def delivered():
+    """Publishes orders through the emulated API and returns the message bodies of every queue"""
+    emulator = build_pizza_pipeline(PipelineEmulator())
+
+    def publish(*bodies):
+        for body in bodies:
+            emulator.request("POST /event", json.dumps(body))
+        return {arn.rsplit("-", 2)[-2]: [message["body"] for _, message in queue] for arn, queue in emulator.queues.items()}
+
+    return publish
+
+
+def test_projected_new_orders_are_decoded(delivered):
+    queues = delivered({"source": "Pizza", "detail-type": "NewOrder", "order": {"id": 7, "toppings": ["pineapple"], "size": 12}})
+
+    order = order_models.decode_event(queues["NewPizza"][0])
+
+    assert order == order_models.NewOrder("Pizza", "NewOrder", order_models.Order(7, ["pineapple"], size=12))
+
+
+def test_projected_orders_are_decoded_into_the_class_of_their_detail(delivered):
+    queues = delivered({"source": "Pizza", "detail-type": "NewOrder", "order": {"id": 7, "toppings": ["pineapple"], "size": 12}})
+    pizza_orders = load_decoders(converters={"PizzaOrder": {"order": order_models.decode_detail}})["PizzaOrder"]
+
+    message = pizza_orders.decode(queues["NewPizza"][0])
+
+    assert message.order == order_models.NewOrder("Pizza", "NewOrder", order_models.Order(7, ["pineapple"], size=12))
+
+
+def test_cancelled_order_events_are_decoded(delivered):
+    queues = delivered({"source": "Pizza", "detail-type": "CancelOrder", "order": {"id": 7}, "reason": "late"})
+
+    assert json.loads(queues["CancelPizza"][0])["detail-type"] == "PizzaOrder"
+    assert order_models.decode_event(queues["CancelPizza"][0]) == order_models.CancelOrder("Pizza", "CancelOrder", order_models.CancelledOrder(7), "late")
+
+
+def test_detail_type_of_the_class_is_checked():
+    with pytest.raises(order_models.DecodeError, match="must be one of NewOrder"):
+        order_models.NewOrder.from_dict({"source": "Pizza", "detail-type": "CancelOrder", "order": {"id": 7, "toppings": []}})
+
+
+def test_generated_module_is_up_to_date():
+    with open(order_models.__file__, encoding="utf-8") as module:
+        assert codegen.generate([os.path.join(ROOT, "schemas", "*.json")], projections_file=os.path.join(SRC, "projections.json")) == module.read()
@@ -0,0 +1,120 @@
+"""Tests of the resource registration profiler, run on a small program with the Pulumi mocks"""
+# pylint: disable=protected-access
+import asyncio
+import json
+import types
+
+import pulumi
+import pulumi.resource
+import pulumi.runtime
+import pytest
+from pulumi.runtime.stack import wait_for_rpcs
+from pulumi.runtime.sync_await import _sync_await
+
+import profiler
+
+
+class ProgramMocks(pulumi.runtime.Mocks):
+    """Returns the inputs of a resource with an ARN as its outputs"""
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        return [f"{args.name}-id", {**args.inputs, "arn": f"arn:test:{args.name}"}]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        return {"json": "{}"}
+
+
+class Thing(pulumi.CustomResource):
+    """A resource with an `arn` output and an optional `source` input"""
+
+    arn: pulumi.Output[str]
+
+    def __init__(self, name: str, source=None, opts=None):
+        super().__init__("test:index:Thing", name, {"source": source, "arn": None}, opts)
+
+
+def run_program(config: dict):
+    """Runs a chain of three resources and two invokes, with the `profile` flag of `config`"""
+    # A new root stack, the one of an earlier program waits on the event loop that ran it
+    pulumi.runtime.reset_options()
+    pulumi.runtime.set_mocks(ProgramMocks(), project="profiled", stack="test", preview=False)
+    pulumi.runtime.set_all_config(config)
+    profiler.configure(pulumi.Config())
+
+    queue = Thing("queue")
+    rule = Thing("rule", source=queue.arn)
+    Thing("target", source=rule.arn)
+    Thing("alarm", opts=pulumi.ResourceOptions(depends_on=[queue]))
+    pulumi.runtime.invoke("test:index:getPolicy", {})
+    pulumi.runtime.invoke_output("test:index:getPolicyOutput", {})
+    _sync_await(wait_for_rpcs())
+
+
+@pytest.fixture
+def patched(monkeypatch):
+    """Restores everything `profiler.enable` patches once the test is done"""
+    monkeypatch.setattr(profiler, "_PROFILER", None)
+    monkeypatch.setattr(pulumi.resource, "register_resource", pulumi.resource.register_resource)
+    monkeypatch.setattr(pulumi.runtime, "invoke", pulumi.runtime.invoke)
+    monkeypatch.setattr(pulumi.runtime, "invoke_output", pulumi.runtime.invoke_output)
+    monkeypatch.setattr(pulumi.runtime, "invoke_async", pulumi.runtime.invoke_async)
+    exit_handlers = []
+    monkeypatch.setattr(profiler, "atexit", types.SimpleNamespace(register=exit_handlers.append))
+    # An earlier `asyncio.run` leaves no event loop for the mocks to register resources on
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield exit_handlers
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+@pytest.fixture
+def profiled(patched, tmp_path):
+    """Runs the program with the flag on and returns the output directory once the profile was written"""
+    run_program({"profiled:profile": "true", "profiled:profile_output": str(tmp_path)})
+    assert patched == [profiler._PROFILER.finish]
+    profiler._PROFILER.finish()
+    return tmp_path
+
+
+def test_trace_has_a_complete_event_per_resource_and_invoke(profiled):
+    trace = json.loads((profiled / "pulumi-trace.json").read_text(encoding="utf-8"))
+    complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+
+    resources = {event["args"]["urn"].rsplit("::", 1)[-1]: event for event in complete if event["pid"] == 1}
+    assert {"queue", "rule", "target", "alarm"} <= set(resources)
+    invokes = [event for event in complete if event["pid"] == 2]
+    assert sorted(event["name"] for event in invokes) == ["test:index:getPolicy", "test:index:getPolicyOutput"]
+    for event in complete:
+        assert event["ts"] >= 0
+        assert event["dur"] >= 0
+    assert {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"} == {"resources", "invokes"}
+
+
+def test_trace_has_the_dependency_edges(profiled):
+    trace = json.loads((profiled / "pulumi-trace.json").read_text(encoding="utf-8"))
+    depends_on = {event["args"]["urn"].rsplit("::", 1)[-1]: event["args"]["depends_on"] for event in trace["traceEvents"] if event.get("pid") == 1 and event["ph"] == "X"}
+
+    assert [urn.rsplit("::", 1)[-1] for urn in depends_on["rule"]] == ["queue"]
+    assert [urn.rsplit("::", 1)[-1] for urn in depends_on["target"]] == ["rule"]
+    assert [urn.rsplit("::", 1)[-1] for urn in depends_on["alarm"]] == ["queue"]
+    assert depends_on["queue"] == []
+
+
+def test_report_follows_the_critical_path(profiled):
+    report = (profiled / "critical-path.txt").read_text(encoding="utf-8")
+    critical_path = report.split("\n\n")[0].splitlines()[2:]
+
+    assert [line.rsplit("::", 1)[-1] for line in critical_path][-3:] == ["queue", "rule", "target"]
+    assert "test:index:getPolicyOutput" in report.split("Invokes")[1]
+
+
+def test_nothing_is_patched_when_the_flag_is_off(patched, tmp_path):
+    originals = (pulumi.resource.register_resource, pulumi.runtime.invoke, pulumi.runtime.invoke_output, pulumi.runtime.invoke_async)
+
+    run_program({"profiled:profile_output": str(tmp_path)})
+
+    assert profiler._PROFILER is None
+    assert (pulumi.resource.register_resource, pulumi.runtime.invoke, pulumi.runtime.invoke_output, pulumi.runtime.invoke_async) == originals
+    assert not patched
+    assert not list(tmp_path.iterdir())
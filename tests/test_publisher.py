@@ -0,0 +1,52 @@
+"""Tests of the batched outbound publisher"""
+import pytest
+
+import publisher
+from publisher import Publisher, PublishError
+
+
+class FailingEvents:
+    """EventBridge client whose entries fail with the given error codes, one list per call"""
+
+    def __init__(self, *error_codes):
+        self.error_codes = list(error_codes)
+        self.calls = []
+
+    def put_events(self, Entries):
+        self.calls.append(Entries)
+        codes = self.error_codes.pop(0) if self.error_codes else [None] * len(Entries)
+        results = [{"EventId": "1"} if code is None else {"ErrorCode": code, "ErrorMessage": code} for code in codes]
+        return {"FailedEntryCount": sum(code is not None for code in codes), "Entries": results}
+
+
+@pytest.fixture
+def events(monkeypatch):
+    def install(*error_codes):
+        client = FailingEvents(*error_codes)
+        monkeypatch.setattr(publisher, "_CLIENTS", {"events": client})
+        return client
+    return install
+
+
+def test_throttled_entries_are_retried(events):
+    client = events(["ThrottlingException", None], ["InternalFailure"])
+    events_publisher = Publisher(bus_name="bus", base_delay=0)
+    events_publisher.put_event({"id": 1}, "NewOrder")
+    events_publisher.put_event({"id": 2}, "NewOrder")
+
+    events_publisher.flush()
+
+    assert [len(call) for call in client.calls] == [2, 1, 1]
+
+
+@pytest.mark.parametrize("error_code", ["AccessDeniedException", "MalformedDetail", "InvalidArgument"])
+def test_rejected_entries_fail_without_retry(events, error_code):
+    client = events([error_code])
+    events_publisher = Publisher(bus_name="bus", base_delay=0)
+    events_publisher.put_event({"id": 1}, "NewOrder")
+
+    with pytest.raises(PublishError) as error:
+        events_publisher.flush()
+
+    assert len(client.calls) == 1
+    assert [failure["error"] for failure in error.value.failed] == [error_code]